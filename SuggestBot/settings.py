@@ -83,6 +83,108 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # برای اشتراک نتایج بین پردازش‌ها می‌توان از FileBasedCache استفاده کرد
+    'analytics': {
+        'BACKEND': config('ANALYTICS_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('ANALYTICS_CACHE_LOCATION', default='suggestbot-analytics'),
+    },
+}
+
+# Event ingestion
+EVENT_BATCH_MAX_SIZE = config('EVENT_BATCH_MAX_SIZE', default=1000, cast=int)
+# 'sync' رویدادها را همان لحظه ذخیره می‌کند؛ 'spool' آن‌ها را در صف محلی می‌نویسد
+# تا دستور drain_event_spool آن‌ها را به صورت دسته‌ای ثبت کند.
+EVENT_INGEST_MODE = config('EVENT_INGEST_MODE', default='sync')
+EVENT_SPOOL_DIR = config('EVENT_SPOOL_DIR', default=str(BASE_DIR / 'spool'))
+EVENT_SPOOL_FLUSH_SIZE = config('EVENT_SPOOL_FLUSH_SIZE', default=5000, cast=int)
+EVENT_SPOOL_FLUSH_INTERVAL = config('EVENT_SPOOL_FLUSH_INTERVAL', default=2.0, cast=float)
+EVENT_SPOOL_SEGMENT_MAX_BYTES = config('EVENT_SPOOL_SEGMENT_MAX_BYTES', default=16 * 1024 * 1024, cast=int)
+EVENT_SPOOL_MAX_BYTES = config('EVENT_SPOOL_MAX_BYTES', default=1024 * 1024 * 1024, cast=int)
+EVENT_SPOOL_FSYNC = config('EVENT_SPOOL_FSYNC', default=True, cast=bool)
+# قطعه بازی که این مدت (ثانیه) تغییر نکرده رهاشده است و تخلیه‌کننده آن را می‌بندد؛ باید از
+# EVENT_SPOOL_FLUSH_INTERVAL (عمر مجاز قطعه باز) بسیار بیشتر باشد
+EVENT_SPOOL_ABANDONED_AFTER = config('EVENT_SPOOL_ABANDONED_AFTER', default=60, cast=float)
+
+# API key -> UserSite cache (per process)
+API_KEY_CACHE_SIZE = config('API_KEY_CACHE_SIZE', default=10000, cast=int)
+API_KEY_CACHE_TTL = config('API_KEY_CACHE_TTL', default=300, cast=int)
+API_KEY_CACHE_NEGATIVE_TTL = config('API_KEY_CACHE_NEGATIVE_TTL', default=10, cast=int)
+
+# Product fingerprint cache used by event ingest (per process)
+PRODUCT_CACHE_SIZE = config('PRODUCT_CACHE_SIZE', default=100000, cast=int)
+PRODUCT_CACHE_TTL = config('PRODUCT_CACHE_TTL', default=3600, cast=int)
+
+# Customer identity cache and coalesced last_seen updates used by event ingest (per process)
+CUSTOMER_CACHE_SIZE = config('CUSTOMER_CACHE_SIZE', default=200000, cast=int)
+CUSTOMER_CACHE_TTL = config('CUSTOMER_CACHE_TTL', default=3600, cast=int)
+CUSTOMER_LAST_SEEN_FLUSH_INTERVAL = config('CUSTOMER_LAST_SEEN_FLUSH_INTERVAL', default=30, cast=int)
+CUSTOMER_LAST_SEEN_FLUSH_SIZE = config('CUSTOMER_LAST_SEEN_FLUSH_SIZE', default=10000, cast=int)
+
+# شمارنده‌های کل محصولات (بازدید، خرید، نرخ تبدیل) هر چند ثانیه یک بار در run_analytics_worker
+# از آمار روزانه به‌روز می‌شوند، نه در هر دسته رویداد
+PRODUCT_TOTALS_REFRESH_INTERVAL = config('PRODUCT_TOTALS_REFRESH_INTERVAL', default=60, cast=int)
+
+# Analytics result cache; the data watermark that invalidates results is stored in the database
+# (AnalyticsWatermark) so purchases ingested by any process are seen by all of them
+ANALYTICS_CACHE_ALIAS = 'analytics'
+ANALYTICS_CACHE_DEFAULT_TTL = 600
+ANALYTICS_CACHE_TTLS = {
+    'market_basket': 3600,
+    'customer_segments': 600,
+    'sales_forecast': 3600,
+    'cooccurrence': 600,
+    'cohorts': 3600,
+}
+# نتیجه کهنه تا این مدت نگه داشته می‌شود تا هنگام محاسبه مجدد نمایش داده شود
+ANALYTICS_CACHE_MAX_STALE = 24 * 60 * 60
+ANALYTICS_CACHE_REFRESH_TIMEOUT = 300
+ANALYTICS_CACHE_BACKGROUND_REFRESH = config('ANALYTICS_CACHE_BACKGROUND_REFRESH', default=True, cast=bool)
+# نتیجه‌ای که پس از آن خرید جدیدی ثبت شده، زودتر از این فاصله دوباره محاسبه نمی‌شود
+ANALYTICS_JOB_MIN_INTERVAL = 60
+# فاصله بررسی نتایج کهنه و افزودن کار به صف در run_analytics_worker (ثانیه)
+ANALYTICS_JOB_SCHEDULE_INTERVAL = config('ANALYTICS_JOB_SCHEDULE_INTERVAL', default=30, cast=int)
+
+CUSTOMER_SEGMENT_PAGE_SIZE = 50
+CUSTOMER_EVENTS_PAGE_SIZE = 50
+CUSTOMER_EVENTS_MAX_PAGE_SIZE = 500
+PRODUCT_LIST_PAGE_SIZE = 50
+
+# مدل پیش‌بینی فروش: linear، seasonal (ضریب روز هفته) یا holt_winters
+SALES_FORECAST_MODEL = config('SALES_FORECAST_MODEL', default='seasonal')
+
+# شاخص درون‌حافظه‌ای «محصولات هم‌خرید/هم‌بازدید» که پردازشگر کارها می‌سازد و برای هر محصول در ProductCooccurrence ذخیره می‌کند
+RECOMMENDATION_INDEX_WINDOW_DAYS = config('RECOMMENDATION_INDEX_WINDOW_DAYS', default=90, cast=int)
+# رویدادهای این چند ثانیه قبل از آخرین زمان خوانده‌شده دوباره خوانده می‌شوند (commitهای دیرهنگام و spool)
+RECOMMENDATION_INDEX_REREAD_MARGIN = config('RECOMMENDATION_INDEX_REREAD_MARGIN', default=600, cast=int)
+# سقف محصولات یک سبد؛ جفت‌های هر سبد با مربع تعداد محصولات رشد می‌کنند
+RECOMMENDATION_BASKET_MAX_ITEMS = config('RECOMMENDATION_BASKET_MAX_ITEMS', default=50, cast=int)
+# بازسازی کامل شاخص برای حذف رویدادهای خارج از بازه
+RECOMMENDATION_INDEX_REBUILD_SECONDS = config('RECOMMENDATION_INDEX_REBUILD_SECONDS', default=6 * 60 * 60, cast=int)
+RECOMMENDATION_INDEX_MAX_OWNERS = config('RECOMMENDATION_INDEX_MAX_OWNERS', default=1000, cast=int)
+RECOMMENDATION_INDEX_TOP_K = 10
+RECOMMENDATION_API_MAX_K = 50
+
+# همگام‌سازی محصولات ووکامرس (دستور sync_woocommerce)
+WOOCOMMERCE_SYNC_WORKERS = config('WOOCOMMERCE_SYNC_WORKERS', default=8, cast=int)
+WOOCOMMERCE_PAGE_SIZE = 100  # حداکثر مقدار per_page در REST API ووکامرس
+WOOCOMMERCE_TIMEOUT = config('WOOCOMMERCE_TIMEOUT', default=20, cast=int)
+WOOCOMMERCE_SYNC_OVERLAP = 300
+
+# تعیین نسخه تست A/B؛ تغییر کلید، گروه همه مشتریان را عوض می‌کند
+AB_TEST_HASH_KEY = config('AB_TEST_HASH_KEY', default='suggestbot-ab-test')
+# شاخص تست‌های فعال هر فروشگاه (per process)؛ ذخیره تست فقط کش همان پردازه را پاک می‌کند،
+# پس پردازه‌های دیگر پس از این مدت تغییر را می‌بینند
+AB_TEST_INDEX_TTL = config('AB_TEST_INDEX_TTL', default=60, cast=int)
+AB_TEST_INDEX_MAX_OWNERS = config('AB_TEST_INDEX_MAX_OWNERS', default=10000, cast=int)
+# سطح اطمینان آزمون معناداری و برآورد حجم نمونه لازم برای تشخیص ۱۰٪ تغییر نسبی با توان ۸۰٪
+AB_TEST_CONFIDENCE_LEVEL = 0.95
+AB_TEST_POWER = 0.8
+AB_TEST_MIN_DETECTABLE_LIFT = 0.1
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -0,0 +1,186 @@
+# core/abtesting.py
+
+import hashlib
+import logging
+import math
+from bisect import bisect_right
+from collections import defaultdict
+from itertools import accumulate
+from statistics import NormalDist
+
+from django.conf import settings
+
+from .caching import TTLCache
+from .models import ABTest, ABTestVariantStats
+
+logger = logging.getLogger(__name__)
+
+_BUCKET_SCALE = float(1 << 64)
+
+
+class ActiveTest:
+    """نسخه فقط‌خواندنی یک تست فعال برای تعیین نسخه بدون مراجعه به پایگاه داده."""
+    __slots__ = ('id', 'variable', 'arms', 'cumulative_weights', 'traffic')
+
+    def __init__(self, test):
+        self.id = test.id
+        self.variable = test.variable
+        self.arms = test.arms()
+        weights = test.weights or [1] * len(self.arms)
+        total = float(sum(weights))
+        self.cumulative_weights = [w / total for w in accumulate(weights)]
+        self.traffic = test.traffic_percent / 100
+
+
+def bucket(test_id, customer_identifier):
+    """دو عدد پایدار در بازه [0، 1) برای یک مشتری در یک تست: ورود به تست و انتخاب نسخه.
+
+    از blake2b کلیددار استفاده می‌شود تا برخلاف hash() پایتون در همه پردازه‌ها و پس از راه‌اندازی مجدد یکسان باشد.
+    """
+    digest = hashlib.blake2b(
+        f'{test_id}:{customer_identifier}'.encode('utf-8'),
+        key=settings.AB_TEST_HASH_KEY.encode('utf-8'), digest_size=16,
+    ).digest()
+    return int.from_bytes(digest[:8], 'big') / _BUCKET_SCALE, int.from_bytes(digest[8:], 'big') / _BUCKET_SCALE
+
+
+def assign_variant(test, customer_identifier):
+    """نسخه نمایش داده شده به مشتری: (برچسب، مقدار) یا None اگر مشتری خارج از ترافیک تست باشد."""
+    enrollment, position = bucket(test.id, customer_identifier)
+    if enrollment >= test.traffic:
+        return None
+    index = min(bisect_right(test.cumulative_weights, position), len(test.arms) - 1)
+    return test.arms[index]
+
+
+_indexes = TTLCache(maxsize=settings.AB_TEST_INDEX_MAX_OWNERS, ttl=settings.AB_TEST_INDEX_TTL)
+
+
+def get_active_tests(owner_id):
+    """نگاشت شناسه محصول در سایت به تست فعال آن برای یک فروشگاه (از کش درون‌فرایندی)."""
+    index = _indexes.get(owner_id)
+    if index is None:
+        index = {}
+        tests = ABTest.objects.filter(product__owner_id=owner_id, is_active=True).select_related('product')
+        # اگر یک محصول چند تست فعال داشته باشد، قدیمی‌ترین آن‌ها اجرا می‌شود
+        for test in tests.order_by('id'):
+            index.setdefault(test.product.product_id_from_site, ActiveTest(test))
+        _indexes.set(owner_id, index)
+    return index
+
+
+def invalidate_active_tests(owner_id=None):
+    """پاک کردن شاخص تست‌های فعال یک فروشگاه (یا همه فروشگاه‌ها) پس از تغییر تست‌ها."""
+    if owner_id is None:
+        _indexes.clear()
+    else:
+        _indexes.delete(owner_id)
+
+
+ARM_LABELS = {'CONTROL': 'نسخه کنترل', 'VARIANT': 'نسخه جدید'}
+UNDECIDED = "هنوز مشخص نیست"
+_NORMAL = NormalDist()
+
+
+def arm_label(variant):
+    if variant in ARM_LABELS:
+        return ARM_LABELS[variant]
+    return f"نسخه جدید {variant.rsplit('_', 1)[-1]}"
+
+
+def wilson_interval(conversions, views, confidence):
+    """بازه اطمینان ویلسون برای نرخ تبدیل (به صورت کسر)."""
+    if views == 0:
+        return 0.0, 0.0
+    z = _NORMAL.inv_cdf(1 - (1 - confidence) / 2)
+    p = min(conversions / views, 1.0)
+    denominator = 1 + z * z / views
+    center = (p + z * z / (2 * views)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / views + z * z / (4 * views * views)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def two_proportion_z_test(control_conversions, control_views, conversions, views):
+    """آزمون z دو نسبت (دوطرفه)؛ خروجی (z، p-value) یا (None، None) اگر داده کافی نباشد."""
+    if control_views == 0 or views == 0:
+        return None, None
+    p1 = min(control_conversions / control_views, 1.0)
+    p2 = min(conversions / views, 1.0)
+    pooled = min((control_conversions + conversions) / (control_views + views), 1.0)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / control_views + 1 / views))
+    if se == 0:
+        return None, None
+    z = (p2 - p1) / se
+    return z, 2 * (1 - _NORMAL.cdf(abs(z)))
+
+
+def required_sample_size(base_rate, lift, alpha, power):
+    """تعداد نمایش لازم برای هر نسخه تا تغییر نسبی lift در نرخ پایه قابل تشخیص باشد."""
+    target = base_rate * (1 + lift)
+    if base_rate <= 0 or target >= 1:
+        return None
+    z_alpha = _NORMAL.inv_cdf(1 - alpha / 2)
+    z_beta = _NORMAL.inv_cdf(power)
+    variance = base_rate * (1 - base_rate) + target * (1 - target)
+    return math.ceil((z_alpha + z_beta) ** 2 * variance / (target - base_rate) ** 2)
+
+
+def analyze_test(test, counters):
+    """نتایج یک تست از روی شمارنده‌های نسخه‌ها ({نسخه: (نمایش، تبدیل)}) بدون کوئری اضافه.
+
+    هر نسخه با کنترل مقایسه می‌شود و سطح معناداری برای چند نسخه با تصحیح بونفرونی تقسیم می‌شود.
+    """
+    confidence = settings.AB_TEST_CONFIDENCE_LEVEL
+    arms = test.arms()
+    alpha = (1 - confidence) / max(len(arms) - 1, 1)
+    control_views, control_conversions = counters.get('CONTROL', (0, 0))
+
+    results = []
+    for variant, value in arms:
+        views, conversions = counters.get(variant, (0, 0))
+        low, high = wilson_interval(conversions, views, confidence)
+        result = {
+            'variant': variant, 'label': arm_label(variant), 'value': value,
+            'views': views, 'conversions': conversions,
+            'rate': (conversions / views * 100) if views > 0 else 0,
+            'ci_low': low * 100, 'ci_high': high * 100,
+            'lift': None, 'z': None, 'p_value': None, 'significant': False,
+        }
+        if variant != 'CONTROL':
+            control_rate = control_conversions / control_views if control_views else 0
+            if control_rate > 0 and views > 0:
+                result['lift'] = (conversions / views - control_rate) / control_rate * 100
+            z, p_value = two_proportion_z_test(control_conversions, control_views, conversions, views)
+            result.update(z=z, p_value=p_value, significant=p_value is not None and p_value < alpha)
+        results.append(result)
+
+    variants = results[1:]
+    better = [r for r in variants if r['significant'] and r['z'] > 0]
+    if better:
+        winner = max(better, key=lambda r: r['rate'])['label']
+    elif variants and all(r['significant'] and r['z'] < 0 for r in variants):
+        winner = ARM_LABELS['CONTROL']
+    else:
+        winner = UNDECIDED
+
+    base_rate = control_conversions / control_views if control_views else 0
+    return {
+        'arms': results,
+        'control': results[0],
+        'variant': results[1],
+        'winner': winner,
+        'confidence_level': confidence,
+        'required_sample_size': required_sample_size(
+            min(base_rate, 1.0), settings.AB_TEST_MIN_DETECTABLE_LIFT, alpha, settings.AB_TEST_POWER
+        ),
+    }
+
+
+def get_ab_test_results_bulk(tests):
+    """نتایج چند تست با یک کوئری روی جدول آمار نسخه‌ها؛ خروجی نگاشت شناسه تست به نتایج."""
+    tests = list(tests)
+    counters = defaultdict(dict)
+    rows = ABTestVariantStats.objects.filter(test__in=[test.id for test in tests]).values_list('test_id', 'variant', 'views', 'conversions')
+    for test_id, variant, views, conversions in rows:
+        counters[test_id][variant] = (views, conversions)
+    return {test.id: analyze_test(test, counters[test.id]) for test in tests}
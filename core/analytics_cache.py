@@ -0,0 +1,102 @@
+# core/analytics_cache.py
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AnalyticsWatermark
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[settings.ANALYTICS_CACHE_ALIAS]
+
+
+def get_watermark(owner_id):
+    """نسخه داده‌های یک فروشگاه؛ با هر دسته رویداد دارای خرید یک واحد افزایش می‌یابد."""
+    version = AnalyticsWatermark.objects.filter(owner_id=owner_id).values_list('version', flat=True).first()
+    return version or 0
+
+
+def get_last_purchase_times(owner_ids=None):
+    """نگاشت شناسه فروشگاه به زمان آخرین خرید ثبت‌شده (برای تشخیص کهنه بودن کارهای تحلیلی)."""
+    watermarks = AnalyticsWatermark.objects.all()
+    if owner_ids is not None:
+        watermarks = watermarks.filter(owner_id__in=owner_ids)
+    return dict(watermarks.values_list('owner_id', 'updated_at'))
+
+
+def bump_watermark(owner_id):
+    """باطل کردن نتایج تحلیلی یک فروشگاه پس از ثبت خرید جدید.
+
+    نسخه در پایگاه داده نگه داشته می‌شود تا افزایش آن در پردازه تخلیه spool یا هر worker دیگر
+    بدون کش مشترک (Redis) به همه پردازه‌ها برسد.
+    """
+    now = timezone.now()
+    updated = AnalyticsWatermark.objects.filter(owner_id=owner_id).update(version=F('version') + 1, updated_at=now)
+    if not updated:
+        _, created = AnalyticsWatermark.objects.get_or_create(owner_id=owner_id,
+                                                              defaults={'version': 1, 'updated_at': now})
+        if not created:
+            AnalyticsWatermark.objects.filter(owner_id=owner_id).update(version=F('version') + 1, updated_at=now)
+
+
+def _entry_key(owner_id, analysis, params):
+    digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'analytics:{owner_id}:{analysis}:{digest}'
+
+
+def _compute_and_store(key, compute, watermark):
+    value = compute()
+    _cache().set(key, {'value': value, 'watermark': watermark, 'computed_at': time.time()},
+                 timeout=settings.ANALYTICS_CACHE_MAX_STALE)
+    return value
+
+
+def _refresh_in_background(key, compute, watermark):
+    cache = _cache()
+    lock_key = f'{key}:refreshing'
+    # فقط یک محاسبه مجدد همزمان برای هر نتیجه
+    if not cache.add(lock_key, True, timeout=settings.ANALYTICS_CACHE_REFRESH_TIMEOUT):
+        return
+
+    def refresh():
+        try:
+            _compute_and_store(key, compute, watermark)
+        except Exception as e:
+            logger.error(f"Refreshing analytics cache entry {key} failed: {e}")
+        finally:
+            cache.delete(lock_key)
+            connection.close()
+
+    if settings.ANALYTICS_CACHE_BACKGROUND_REFRESH:
+        threading.Thread(target=refresh, daemon=True).start()
+    else:
+        refresh()
+
+
+def cached_analysis(owner, analysis, compute, params=None):
+    """خواندن نتیجه یک تحلیل از کش.
+
+    اگر نتیجه کهنه باشد (تغییر نسخه داده یا گذشت TTL)، نتیجه قبلی برگردانده می‌شود
+    و محاسبه مجدد در پس‌زمینه انجام می‌شود. فقط در نبود هیچ نتیجه‌ای محاسبه همزمان انجام می‌شود.
+    """
+    key = _entry_key(owner.pk, analysis, params or {})
+    watermark = get_watermark(owner.pk)
+    entry = _cache().get(key)
+    if entry is None:
+        return _compute_and_store(key, compute, watermark)
+
+    ttl = settings.ANALYTICS_CACHE_TTLS.get(analysis, settings.ANALYTICS_CACHE_DEFAULT_TTL)
+    if entry['watermark'] != watermark or time.time() - entry['computed_at'] > ttl:
+        _refresh_in_background(key, compute, watermark)
+    return entry['value']
@@ -0,0 +1,78 @@
+# core/basket.py
+
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from django.db.models.functions import TruncDate
+from mlxtend.frequent_patterns import fpgrowth, association_rules
+
+from .models import ProductEvent
+
+logger = logging.getLogger(__name__)
+
+RULE_COLUMNS = ['antecedents', 'consequents', 'support', 'confidence', 'lift']
+
+
+def build_basket_matrix(basket_keys, item_ids):
+    """ساخت ماتریس اسپارس بولی (سبد × محصول) از ردیف‌های خرید.
+
+    هر سبد با یک کلید (مثلاً مشتری و روز) و هر ستون با شناسه محصول مشخص می‌شود.
+    """
+    basket_codes, _ = pd.factorize(pd.Series(basket_keys, dtype=object))
+    item_codes, items = pd.factorize(pd.Series(item_ids))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(item_codes), dtype=bool), (basket_codes, item_codes)),
+        shape=(basket_codes.max() + 1 if len(basket_codes) else 0, len(items)),
+    )
+    # خرید تکراری یک محصول در یک سبد فقط یک بار حساب می‌شود
+    matrix.sum_duplicates()
+    matrix.data[:] = True
+    return matrix, list(items)
+
+
+def mine_rules(matrix, items, min_support=0.01, min_confidence=0.0, min_lift=1.0, max_len=None):
+    """استخراج قوانین وابستگی با FP-Growth روی ماتریس اسپارس سبدها."""
+    if matrix.shape[0] == 0:
+        return pd.DataFrame(columns=RULE_COLUMNS)
+
+    # محصولی که به‌تنهایی به حداقل پشتیبانی نرسد در هیچ مجموعه پرتکراری نیست؛ پیش از استخراج حذف می‌شود
+    support = np.asarray(matrix.sum(axis=0)).ravel() / matrix.shape[0]
+    frequent_columns = np.flatnonzero(support >= min_support)
+    if len(frequent_columns) < 2:
+        return pd.DataFrame(columns=RULE_COLUMNS)
+    matrix = matrix[:, frequent_columns]
+    items = [items[column] for column in frequent_columns]
+
+    # ستون‌ها با اندیس ۰ تا n-1 ساخته می‌شوند (محدودیت mlxtend برای دیتافریم اسپارس) و بعد به شناسه محصول برمی‌گردند
+    baskets = pd.DataFrame.sparse.from_spmatrix(matrix)
+    frequent_itemsets = fpgrowth(baskets, min_support=min_support, use_colnames=True, max_len=max_len)
+    if frequent_itemsets.empty or frequent_itemsets['itemsets'].map(len).max() < 2:
+        return pd.DataFrame(columns=RULE_COLUMNS)
+
+    rules = association_rules(frequent_itemsets, num_itemsets=matrix.shape[0], metric='lift', min_threshold=min_lift)
+    rules = rules[rules['confidence'] >= min_confidence][RULE_COLUMNS]
+    for column in ('antecedents', 'consequents'):
+        rules[column] = rules[column].map(lambda codes: frozenset(items[code] for code in codes))
+    return rules.sort_values(['confidence', 'lift'], ascending=False).reset_index(drop=True)
+
+
+def get_purchase_rows(owner):
+    """خریدهای یک فروشگاه به صورت دو لیست: کلید سبد (مشتری، روز) و شناسه محصول."""
+    rows = ProductEvent.objects.filter(
+        product__owner=owner, event_type='PURCHASE'
+    ).annotate(day=TruncDate('created_at')).values_list('customer_id', 'day', 'product_id')
+
+    basket_keys, item_ids = [], []
+    for customer_id, day, product_id in rows.iterator(chunk_size=10000):
+        basket_keys.append((customer_id, day))
+        item_ids.append(product_id)
+    return basket_keys, item_ids
+
+
+def mine_association_rules(owner, min_support=0.01, min_confidence=0.0, min_lift=1.0, max_len=None):
+    """قوانین «محصولات هم‌خرید» یک فروشگاه بر اساس شناسه محصول."""
+    basket_keys, item_ids = get_purchase_rows(owner)
+    matrix, items = build_basket_matrix(basket_keys, item_ids)
+    return mine_rules(matrix, items, min_support, min_confidence, min_lift, max_len), len(item_ids)
@@ -0,0 +1,80 @@
+# core/caching.py
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import UserSite
+
+_MISSING = object()
+
+
+class TTLCache:
+    """کش درون‌فرایندی با سقف تعداد (LRU) و زمان انقضا برای هر کلید."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+site_cache = TTLCache(maxsize=settings.API_KEY_CACHE_SIZE, ttl=settings.API_KEY_CACHE_TTL)
+# کلیدهای نامعتبر جداگانه و کوتاه‌مدت نگه داشته می‌شوند تا سیل درخواست‌های جعلی
+# به پایگاه داده نرسد و کلیدهای معتبر را هم از کش بیرون نکند
+invalid_key_cache = TTLCache(maxsize=settings.API_KEY_CACHE_SIZE, ttl=settings.API_KEY_CACHE_NEGATIVE_TTL)
+
+
+def get_site_for_api_key(api_key):
+    """یافتن سایت فعال متناظر با کلید API با استفاده از کش؛ در صورت نبود None برمی‌گرداند."""
+    site = site_cache.get(api_key)
+    if site is not None:
+        return site
+    if invalid_key_cache.get(api_key):
+        return None
+
+    site = UserSite.objects.select_related('owner').filter(api_key__key=api_key, is_active=True).first()
+    if site is None:
+        invalid_key_cache.set(api_key, True)
+    else:
+        site_cache.set(api_key, site)
+    return site
+
+
+def invalidate_site_cache():
+    """پاک کردن کش کلیدهای API پس از تغییر کلید یا سایت."""
+    site_cache.clear()
+    invalid_key_cache.clear()
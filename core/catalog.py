@@ -0,0 +1,75 @@
+# core/catalog.py
+
+import base64
+import json
+import math
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import Product
+
+# کلید مرتب‌سازی ← ستون؛ همه به صورت نزولی و با شناسه به عنوان کلید دوم
+PRODUCT_SORTS = {
+    'newest': 'created_at',
+    'views': 'total_views',
+    'purchases': 'total_purchases',
+    'conversion': 'conversion_rate',
+}
+# موجودی None یعنی نامشخص (محصول ساخته‌شده از رویدادها) و ناموجود حساب نمی‌شود
+STOCK_FILTERS = {
+    'in': Q(stock__gt=0),
+    'out': Q(stock__lte=0),
+    'unknown': Q(stock__isnull=True),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort, product):
+    value = getattr(product, PRODUCT_SORTS[sort])
+    if sort == 'newest':
+        value = value.isoformat()
+    payload = json.dumps([sort, value, product.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(sort, cursor):
+    """خواندن مکان‌نما؛ مکان‌نمای ساخته‌شده برای مرتب‌سازی دیگر نامعتبر است."""
+    try:
+        cursor_sort, value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if cursor_sort != sort or isinstance(product_id, bool) or not isinstance(product_id, int):
+        raise InvalidCursor('Invalid cursor')
+    if sort == 'newest':
+        value = parse_datetime(value) if isinstance(value, str) else None
+        if value is None:
+            raise InvalidCursor('Invalid cursor')
+    elif isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise InvalidCursor('Invalid cursor')
+    return value, product_id
+
+
+def get_product_page(owner, sort='newest', category=None, stock=None, cursor=None, limit=50):
+    """یک صفحه از محصولات فروشگاه با صفحه‌بندی keyset؛ خروجی (محصولات، مکان‌نمای صفحه بعد).
+
+    مرتب‌سازی از شمارنده‌های ذخیره‌شده روی محصول خوانده می‌شود، پس هزینه هر صفحه به تعداد کل محصولات بستگی ندارد.
+    """
+    if sort not in PRODUCT_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    field = PRODUCT_SORTS[sort]
+    products = Product.objects.filter(owner=owner)
+    if category:
+        products = products.filter(category=category)
+    if stock:
+        products = products.filter(STOCK_FILTERS[stock])
+    if cursor:
+        value, product_id = decode_cursor(sort, cursor)
+        products = products.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': product_id}))
+
+    page = list(products.order_by(f'-{field}', '-id')[:limit + 1])
+    next_cursor = encode_cursor(sort, page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
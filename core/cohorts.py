@@ -0,0 +1,133 @@
+# core/cohorts.py
+
+import numpy as np
+import pandas as pd
+from django.db.models import DateField
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import ProductEvent, CohortActivity
+
+COHORT_GRANULARITIES = {
+    'month': (TruncMonth, 'ماه'),
+    'week': (TruncWeek, 'هفته'),
+}
+
+
+def period_index(dates, granularity):
+    """تبدیل برداری تاریخ‌ها (شروع ماه یا هفته) به شماره صحیح دوره."""
+    if granularity == 'week':
+        # اول ژانویه ۱۹۷۰ پنجشنبه است؛ با جابه‌جایی ۳ روزه هفته‌ها از دوشنبه شمرده می‌شوند
+        return (np.asarray(dates, dtype='datetime64[D]').astype(np.int64) + 3) // 7
+    return np.asarray(dates, dtype='datetime64[M]').astype(np.int64)
+
+
+def period_labels(periods, granularity):
+    """برچسب متنی دوره‌ها (YYYY-MM برای ماه و تاریخ دوشنبه برای هفته)."""
+    if granularity == 'week':
+        return pd.Index((periods * 7 - 3).astype('datetime64[D]')).strftime('%Y-%m-%d')
+    return pd.Index(periods.astype('datetime64[M]')).strftime('%Y-%m')
+
+
+def build_cohort_table(customer_ids, cohort_periods, event_periods):
+    """شمارش مشتریان یکتای هر کوهورت در هر فاصله زمانی با عملیات برداری.
+
+    ورودی‌ها آرایه‌های هم‌طول هستند (یک ردیف برای هر رویداد یا هر جفت یکتای مشتری-دوره).
+    خروجی: (شماره دوره کوهورت‌ها، ماتریس شمارش کوهورت × فاصله، اندازه هر کوهورت).
+    """
+    customer_ids = np.asarray(customer_ids, dtype=np.int64)
+    cohort_periods = np.asarray(cohort_periods, dtype=np.int64)
+    offsets = np.asarray(event_periods, dtype=np.int64) - cohort_periods
+    valid = offsets >= 0
+    customer_ids, cohort_periods, offsets = customer_ids[valid], cohort_periods[valid], offsets[valid]
+    if len(customer_ids) == 0:
+        return np.empty(0, dtype=np.int64), np.zeros((0, 0), dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # هر مشتری فقط یک کوهورت دارد، پس جفت یکتای (مشتری، فاصله) برای شمارش کافی است
+    n_offsets = int(offsets.max()) + 1
+    first_period = int(cohort_periods.min())
+    cohort_codes = cohort_periods - first_period
+    n_cohorts = int(cohort_codes.max()) + 1
+
+    unique_pairs = ~pd.Series(customer_ids * n_offsets + offsets).duplicated().to_numpy()
+    counts = np.bincount(
+        cohort_codes[unique_pairs] * n_offsets + offsets[unique_pairs], minlength=n_cohorts * n_offsets
+    ).reshape(n_cohorts, n_offsets)
+
+    unique_customers = ~pd.Series(customer_ids).duplicated().to_numpy()
+    sizes = np.bincount(cohort_codes[unique_customers], minlength=n_cohorts)
+
+    # دوره‌هایی که هیچ مشتری جدیدی نداشته‌اند حذف می‌شوند
+    present = sizes > 0
+    cohorts = np.arange(first_period, first_period + n_cohorts)[present]
+    counts, sizes = counts[present], sizes[present]
+    return cohorts, counts, sizes
+
+
+def get_cohort_rows(owner, granularity='month', event_type=None):
+    """یک کوئری: جفت‌های یکتای (مشتری، دوره کوهورت، دوره رویداد) یک فروشگاه."""
+    trunc = COHORT_GRANULARITIES[granularity][0]
+    events = ProductEvent.objects.filter(customer__owner=owner)
+    if event_type:
+        events = events.filter(event_type=event_type)
+    rows = events.annotate(
+        cohort=trunc('customer__first_seen', output_field=DateField()),
+        period=trunc('created_at', output_field=DateField()),
+    ).values_list('customer_id', 'cohort', 'period').distinct()
+
+    customer_ids, cohorts, periods = [], [], []
+    for customer_id, cohort, period in rows.iterator(chunk_size=10000):
+        customer_ids.append(customer_id)
+        cohorts.append(cohort)
+        periods.append(period)
+    return customer_ids, cohorts, periods
+
+
+def compute_cohorts(owner, granularity='month', event_type=None):
+    """جدول بازگشت مشتریان به صورت تعداد و درصد.
+
+    granularity: 'month' یا 'week'. event_type: اگر داده شود بازگشت فقط با همان نوع رویداد سنجیده می‌شود.
+    """
+    if granularity not in COHORT_GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    customer_ids, cohorts, periods = get_cohort_rows(owner, granularity, event_type)
+    event_periods = period_index(periods, granularity)
+    cohort_periods, counts, sizes = build_cohort_table(customer_ids, period_index(cohorts, granularity), event_periods)
+
+    last_period = event_periods.max() if len(event_periods) else None
+    return _cohort_tables(cohort_periods, counts, sizes, last_period, granularity)
+
+
+def _cohort_tables(cohort_periods, counts, sizes, last_period, granularity):
+    label = COHORT_GRANULARITIES[granularity][1]
+    index = period_labels(cohort_periods, granularity)
+    columns = [f"{label} {i}" for i in range(counts.shape[1])]
+    count_table = pd.DataFrame(counts, index=index, columns=columns)
+    percent_table = count_table.divide(np.maximum(sizes, 1), axis=0).multiply(100).round(1)
+
+    # خانه‌هایی که هنوز زمانشان نرسیده (کوهورت + فاصله بعد از آخرین دوره) خالی می‌مانند
+    if len(cohort_periods):
+        future = cohort_periods[:, None] + np.arange(counts.shape[1]) > last_period
+        count_table = count_table.mask(future)
+        percent_table = percent_table.mask(future)
+    return {'counts': count_table, 'percents': percent_table, 'sizes': pd.Series(sizes, index=index)}
+
+
+def get_stored_cohorts(owner):
+    """جدول بازگشت ماهانه از جدول فعالیت کوهورت (بدون خواندن رویدادها).
+
+    اندازه هر کوهورت برابر تعداد مشتریان فعال در ماه اول آن است.
+    """
+    rows = list(CohortActivity.objects.filter(owner=owner).values_list('cohort_month', 'activity_month', 'customers'))
+    cohort_months, activity_months, customers = zip(*rows) if rows else ((), (), ())
+    row_cohorts = period_index(cohort_months, 'month')
+    row_activity = period_index(activity_months, 'month')
+    offsets = row_activity - row_cohorts
+    valid = offsets >= 0
+    if not valid.any():
+        empty = np.empty(0, dtype=np.int64)
+        return _cohort_tables(empty, np.zeros((0, 0), dtype=np.int64), empty, None, 'month')
+
+    cohort_periods, cohort_codes = np.unique(row_cohorts[valid], return_inverse=True)
+    counts = np.zeros((len(cohort_periods), int(offsets[valid].max()) + 1), dtype=np.int64)
+    np.add.at(counts, (cohort_codes, offsets[valid]), np.asarray(customers, dtype=np.int64)[valid])
+    return _cohort_tables(cohort_periods, counts, counts[:, 0], row_activity.max(), 'month')
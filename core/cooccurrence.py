@@ -0,0 +1,185 @@
+# core/cooccurrence.py
+
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict, Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import TTLCache
+from .models import Product, ProductCooccurrence, ProductEvent
+
+logger = logging.getLogger(__name__)
+
+# نوع هم‌رخدادی بر اساس نوع رویداد: هم‌خرید و هم‌بازدید
+KINDS = {'PURCHASE': 'bought_together', 'VIEW': 'viewed_together'}
+
+
+class CooccurrenceIndex:
+    """شاخص درون‌حافظه‌ای محصولات هم‌خرید و هم‌بازدید یک فروشگاه.
+
+    سبد = رویدادهای یک مشتری در یک روز. شاخص یک بار از رویدادهای بازه اخیر ساخته می‌شود
+    و پس از آن فقط رویدادهای جدیدتر از آخرین زمان خوانده‌شده (منهای یک حاشیه اطمینان) به آن اضافه می‌شوند.
+    شاخص فقط در پردازشگر کارهای تحلیلی ساخته می‌شود (jobs.JOB_ANALYSES) و نتیجه آن برای هر محصول
+    در یک ردیف ProductCooccurrence ذخیره می‌شود که API پیشنهاد می‌خواند.
+    """
+
+    def __init__(self, owner_id, window_days):
+        self.owner_id = owner_id
+        self.window_days = window_days
+        self.watermark = None
+        self.refreshed_at = 0
+        self.products = {}
+        self.site_ids = {}
+        self.pairs = {kind: defaultdict(Counter) for kind in KINDS}
+        self.baskets = {kind: {} for kind in KINDS}
+        self._top = {kind: {} for kind in KINDS}
+        # محصولاتی که فهرستشان از آخرین ذخیره تغییر کرده؛ None یعنی شاخص تازه ساخته شده و همه باید ذخیره شوند
+        self.changed = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _load_products(self, product_ids=None):
+        products = Product.objects.filter(owner_id=self.owner_id)
+        if product_ids is not None:
+            products = products.filter(id__in=product_ids)
+        for product_id, site_id, name, url in products.values_list('id', 'product_id_from_site', 'name', 'page_url'):
+            self.products[product_id] = {'product_id': site_id, 'name': name, 'url': url}
+            self.site_ids[site_id] = product_id
+
+    def _fold(self, rows):
+        """افزودن رویدادها به سبدها و شمارنده‌های هم‌رخدادی.
+
+        تکرار یک رویداد بی‌اثر است (محصول از قبل در سبد است)، پس بازخوانی حاشیه زیر watermark امن است.
+        سبدهای بزرگ‌تر از RECOMMENDATION_BASKET_MAX_ITEMS محصول دیگری نمی‌پذیرند تا تعداد جفت‌ها محدود بماند.
+        """
+        dirty = set()
+        max_items = settings.RECOMMENDATION_BASKET_MAX_ITEMS
+        for customer_id, product_id, event_type, created_at in rows:
+            if self.watermark is None or created_at > self.watermark:
+                self.watermark = created_at
+            basket = self.baskets[event_type].setdefault((customer_id, timezone.localdate(created_at)), set())
+            if product_id in basket or len(basket) >= max_items:
+                continue
+            pairs = self.pairs[event_type]
+            for other in basket:
+                pairs[product_id][other] += 1
+                pairs[other][product_id] += 1
+                dirty.add((event_type, other))
+            dirty.add((event_type, product_id))
+            basket.add(product_id)
+        return dirty
+
+    def _prune_baskets(self):
+        # رویدادهای جدید فقط به سبدهای امروز (و دیروز برای تاخیر صف) اضافه می‌شوند؛ سبدهای حاشیه
+        # بازخوانی هم باید نگه داشته شوند تا رویداد تکراری دوباره شمرده نشود
+        oldest_open_day = timezone.localdate(
+            timezone.now() - timedelta(days=1, seconds=settings.RECOMMENDATION_INDEX_REREAD_MARGIN)
+        )
+        for kind in KINDS:
+            self.baskets[kind] = {key: items for key, items in self.baskets[kind].items() if key[1] >= oldest_open_day}
+
+    def refresh(self):
+        """خواندن رویدادهای جدید از پایگاه داده و به‌روزرسانی شاخص.
+
+        شناسه رویدادها به ترتیب commit نیستند (تراکنش‌های طولانی، تخلیه spool)؛ برای همین به جای
+        مکان‌نمای شناسه، رویدادهای RECOMMENDATION_INDEX_REREAD_MARGIN ثانیه قبل از آخرین زمان خوانده‌شده
+        دوباره خوانده می‌شوند.
+        """
+        with self._refresh_lock:
+            events = ProductEvent.objects.filter(product__owner_id=self.owner_id, event_type__in=KINDS.keys())
+            if self.watermark is None:
+                events = events.filter(created_at__gte=timezone.now() - timedelta(days=self.window_days))
+            else:
+                events = events.filter(
+                    created_at__gte=self.watermark - timedelta(seconds=settings.RECOMMENDATION_INDEX_REREAD_MARGIN)
+                )
+            rows = events.order_by('id').values_list('customer_id', 'product_id', 'event_type', 'created_at')
+
+            with self._lock:
+                if self.refreshed_at == 0:
+                    self._load_products()
+                dirty = self._fold(rows.iterator(chunk_size=10000))
+                missing = {product_id for _, product_id in dirty if product_id not in self.products}
+                if missing:
+                    self._load_products(missing)
+                for kind, product_id in dirty:
+                    self._top[kind].pop(product_id, None)
+                if self.changed is not None:
+                    self.changed.update(product_id for _, product_id in dirty)
+                self._prune_baskets()
+                if self.refreshed_at == 0:
+                    logger.info(f"Built co-occurrence index for owner {self.owner_id} up to {self.watermark}")
+                self.refreshed_at = time.monotonic()
+
+    def _top_k(self, kind, product_id, k):
+        top = self._top[kind].get(product_id)
+        if top is None or len(top) < min(k, len(self.pairs[kind].get(product_id, ()))):
+            counts = self.pairs[kind].get(product_id, {})
+            top = heapq.nlargest(max(k, settings.RECOMMENDATION_INDEX_TOP_K), counts.items(), key=lambda x: x[1])
+            self._top[kind][product_id] = top
+        return top[:k]
+
+    def store(self, k):
+        """ذخیره k محصول برتر هم‌خرید و هم‌بازدید هر محصول؛ تعداد ردیف‌های نوشته‌شده را برمی‌گرداند.
+
+        پس از ساخت شاخص همه ردیف‌های فروشگاه بازنویسی و ردیف‌های بدون هم‌رخدادی حذف می‌شوند؛
+        در اجراهای بعدی فقط محصولاتی که شمارنده‌شان تغییر کرده نوشته می‌شوند.
+        """
+        with self._lock:
+            full = self.changed is None
+            product_ids = set().union(*(self.pairs[kind].keys() for kind in KINDS)) if full else self.changed
+            rows = [
+                ProductCooccurrence(product_id=product_id, owner_id=self.owner_id, **{
+                    name: [
+                        {**self.products[other], 'score': count}
+                        for other, count in self._top_k(kind, product_id, k) if other in self.products
+                    ]
+                    for kind, name in KINDS.items()
+                })
+                for product_id in product_ids if product_id in self.products
+            ]
+            self.changed = set()
+
+        stored_at = timezone.now()
+        try:
+            with transaction.atomic():
+                ProductCooccurrence.objects.bulk_create(
+                    rows, batch_size=1000, update_conflicts=True, unique_fields=['product'],
+                    update_fields=[*KINDS.values(), 'updated_at'],
+                )
+                if full:
+                    # ردیف‌هایی که در این ذخیره بازنویسی نشدند دیگر هم‌رخدادی ندارند
+                    ProductCooccurrence.objects.filter(owner_id=self.owner_id, updated_at__lt=stored_at).delete()
+        except Exception:
+            # تغییرات این اجرا ذخیره نشد؛ اجرای بعدی همه ردیف‌ها را دوباره می‌نویسد
+            self.changed = None
+            raise
+        return len(rows)
+
+
+# کارهای هر فروشگاه همیشه به یک پردازه ثابت پردازشگر کارها می‌رسند (run_analytics_worker)، پس شاخص
+# بین اجراها نگه داشته می‌شود و پس از پایان TTL از نو ساخته می‌شود تا هم‌رخدادی‌های خارج از بازه حذف شوند
+_indexes = TTLCache(maxsize=settings.RECOMMENDATION_INDEX_MAX_OWNERS, ttl=settings.RECOMMENDATION_INDEX_REBUILD_SECONDS)
+_indexes_lock = threading.Lock()
+
+
+def get_cooccurrence_index(owner_id):
+    """شاخص به‌روز هم‌رخدادی یک فروشگاه؛ در صورت نیاز ساخته می‌شود (فقط در پردازشگر کارها فراخوانی شود)."""
+    with _indexes_lock:
+        index = _indexes.get(owner_id)
+        if index is None:
+            index = CooccurrenceIndex(owner_id, settings.RECOMMENDATION_INDEX_WINDOW_DAYS)
+            _indexes.set(owner_id, index)
+    index.refresh()
+    return index
+
+
+def build_recommendations(owner):
+    """کار تحلیلی «هم‌رخدادی»: به‌روزرسانی شاخص و ذخیره ردیف محصولات تغییرکرده."""
+    return {'products': get_cooccurrence_index(owner.pk).store(settings.RECOMMENDATION_API_MAX_K)}
@@ -0,0 +1,190 @@
+# core/forecasting.py
+
+import logging
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DailyProductStats, SalesForecast
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DAYS = 90
+HORIZON_DAYS = 30
+# حداقل تعداد روزهای دارای فروش برای پیش‌بینی (مثل پیاده‌سازی قبلی)
+MIN_SALE_DAYS = 10
+
+NOT_ENOUGH_DATA_MESSAGE = "داده‌های کافی برای پیش‌بینی فروش این محصول وجود ندارد."
+SUCCESS_MESSAGE = "پیش‌بینی با موفقیت انجام شد."
+
+
+def load_daily_sales(owner, days=HISTORY_DAYS, end_day=None, product_ids=None):
+    """فروش روزانه همه محصولات یک فروشگاه در یک کوئری، به صورت ماتریس (محصول × روز).
+
+    روزهای بدون فروش صفر در نظر گرفته می‌شوند. خروجی: (شناسه محصولات، روز اول، ماتریس).
+    """
+    # امروز هنوز تمام نشده؛ تاریخچه تا دیروز خوانده می‌شود
+    end_day = end_day or timezone.localdate() - timedelta(days=1)
+    start_day = end_day - timedelta(days=days - 1)
+    stats = DailyProductStats.objects.filter(owner=owner, day__range=(start_day, end_day), purchases__gt=0)
+    if product_ids is not None:
+        stats = stats.filter(product_id__in=product_ids)
+    rows = list(stats.values_list('product_id', 'day', 'purchases'))
+
+    product_ids = sorted({product_id for product_id, _, _ in rows})
+    positions = {product_id: i for i, product_id in enumerate(product_ids)}
+    sales = np.zeros((len(product_ids), days), dtype=np.float64)
+    if rows:
+        product_codes = np.fromiter((positions[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+        day_codes = np.fromiter(((r[1] - start_day).days for r in rows), dtype=np.int64, count=len(rows))
+        sales[product_codes, day_codes] = [r[2] for r in rows]
+    return product_ids, start_day, sales
+
+
+class Forecaster:
+    """رابط مدل‌های پیش‌بینی: همه سری‌ها (ماتریس محصول × روز) با هم برازش می‌شوند."""
+    name = None
+
+    def fit_predict(self, sales, horizon, start_day):
+        """خروجی ماتریس (محصول × horizon) از فروش پیش‌بینی‌شده روزهای بعد از آخرین ستون."""
+        raise NotImplementedError
+
+
+class LinearTrendForecaster(Forecaster):
+    """روند خطی با یک حل کمترین مربعات برای همه سری‌ها."""
+    name = 'linear'
+
+    def fit_predict(self, sales, horizon, start_day):
+        n_days = sales.shape[1]
+        design = np.column_stack([np.ones(n_days), np.arange(n_days, dtype=np.float64)])
+        coefficients, *_ = np.linalg.lstsq(design, sales.T, rcond=None)
+        future = np.column_stack([np.ones(horizon), np.arange(n_days, n_days + horizon, dtype=np.float64)])
+        return np.maximum(0, future @ coefficients).T
+
+
+def _weekdays(start_day, offset, count):
+    return (start_day.weekday() + offset + np.arange(count)) % 7
+
+
+class SeasonalForecaster(Forecaster):
+    """سطح فروش چند هفته اخیر ضرب در ضریب روز هفته (محاسبه‌شده از کل تاریخچه)."""
+    name = 'seasonal'
+
+    def __init__(self, level_weeks=4):
+        self.level_weeks = level_weeks
+
+    def fit_predict(self, sales, horizon, start_day):
+        n_days = sales.shape[1]
+        weekdays = _weekdays(start_day, 0, n_days)
+        totals = np.zeros((sales.shape[0], 7))
+        np.add.at(totals.T, weekdays, sales.T)
+        day_counts = np.bincount(weekdays, minlength=7)
+        weekday_means = totals / np.maximum(day_counts, 1)
+        overall = weekday_means.mean(axis=1, keepdims=True)
+        factors = np.divide(weekday_means, overall, out=np.ones_like(weekday_means), where=overall > 0)
+
+        level = sales[:, -7 * self.level_weeks:].mean(axis=1, keepdims=True)
+        return level * factors[:, _weekdays(start_day, n_days, horizon)]
+
+
+class HoltWintersForecaster(Forecaster):
+    """هموارسازی نمایی Holt-Winters جمعی با فصل هفتگی.
+
+    برای هر سری از بین چند ترکیب پارامتر، ترکیبی با کمترین خطای پیش‌بینی یک‌روزه انتخاب می‌شود.
+    """
+    name = 'holt_winters'
+    season = 7
+    alphas = (0.1, 0.3, 0.5)
+    betas = (0.0, 0.05)
+    gammas = (0.1, 0.3)
+
+    def _run(self, sales, alpha, beta, gamma, horizon):
+        m = self.season
+        level = sales[:, :m].mean(axis=1)
+        trend = (sales[:, m:2 * m].mean(axis=1) - level) / m if sales.shape[1] >= 2 * m else np.zeros(len(sales))
+        seasonal = sales[:, :m] - level[:, None]
+        sse = np.zeros(len(sales))
+        for t in range(m, sales.shape[1]):
+            s = seasonal[:, t % m]
+            sse += (sales[:, t] - (level + trend + s)) ** 2
+            previous_level = level
+            level = alpha * (sales[:, t] - s) + (1 - alpha) * (level + trend)
+            trend = beta * (level - previous_level) + (1 - beta) * trend
+            seasonal[:, t % m] = gamma * (sales[:, t] - level) + (1 - gamma) * s
+        steps = np.arange(1, horizon + 1)
+        season_index = (sales.shape[1] + steps - 1) % m
+        predictions = level[:, None] + trend[:, None] * steps + seasonal[:, season_index]
+        return np.maximum(0, predictions), sse
+
+    def fit_predict(self, sales, horizon, start_day):
+        best, best_sse = None, None
+        for alpha in self.alphas:
+            for beta in self.betas:
+                for gamma in self.gammas:
+                    predictions, sse = self._run(sales, alpha, beta, gamma, horizon)
+                    if best is None:
+                        best, best_sse = predictions, sse
+                        continue
+                    better = sse < best_sse
+                    best[better], best_sse[better] = predictions[better], sse[better]
+        return best
+
+
+FORECASTERS = {
+    forecaster.name: forecaster
+    for forecaster in (LinearTrendForecaster, SeasonalForecaster, HoltWintersForecaster)
+}
+
+
+def get_forecaster(name=None):
+    """ساخت مدل پیش‌بینی بر اساس نام (پیش‌فرض: SALES_FORECAST_MODEL در تنظیمات)."""
+    name = name or settings.SALES_FORECAST_MODEL
+    if name not in FORECASTERS:
+        raise ValueError(f"Unknown forecaster: {name}")
+    return FORECASTERS[name]()
+
+
+def forecast_sales(owner, days=HISTORY_DAYS, horizon=HORIZON_DAYS, product_ids=None, forecaster=None):
+    """پیش‌بینی فروش روزانه محصولات؛ خروجی نگاشت شناسه محصول به {تاریخ: تعداد} یا None."""
+    forecaster = forecaster or get_forecaster()
+    product_ids, start_day, sales = load_daily_sales(owner, days, product_ids=product_ids)
+    enough = (sales > 0).sum(axis=1) >= MIN_SALE_DAYS
+    forecasts = dict.fromkeys(product_ids)
+    if not enough.any():
+        return forecasts
+
+    predicted = forecaster.fit_predict(sales[enough], horizon, start_day)
+    first_future_day = start_day + timedelta(days=days)
+    dates = [(first_future_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(horizon)]
+    for product_id, row in zip(np.asarray(product_ids)[enough], np.rint(predicted).astype(int)):
+        forecasts[int(product_id)] = dict(zip(dates, row.tolist()))
+    return forecasts
+
+
+def refresh_sales_forecasts(owner, days=HISTORY_DAYS, horizon=HORIZON_DAYS):
+    """محاسبه و ذخیره پیش‌بینی فروش همه محصولات یک فروشگاه؛ تعداد محصولات ذخیره‌شده را برمی‌گرداند."""
+    forecaster = get_forecaster()
+    forecasts = forecast_sales(owner, days, horizon, forecaster=forecaster)
+    fitted_at = timezone.now()
+    SalesForecast.objects.filter(owner=owner).exclude(product_id__in=forecasts.keys()).delete()
+    SalesForecast.objects.bulk_create(
+        [
+            SalesForecast(owner=owner, product_id=product_id, predictions=predictions,
+                          model=forecaster.name, fitted_at=fitted_at)
+            for product_id, predictions in forecasts.items()
+        ],
+        update_conflicts=True, unique_fields=['product'], update_fields=['predictions', 'model', 'fitted_at'],
+        batch_size=1000,
+    )
+    logger.info(f"Stored sales forecasts for {len(forecasts)} products of owner {owner.pk}")
+    return len(forecasts)
+
+
+def get_stored_forecast(product_id):
+    """خواندن پیش‌بینی ذخیره‌شده یک محصول؛ خروجی (پیش‌بینی، پیام)."""
+    forecast = SalesForecast.objects.filter(product_id=product_id).first()
+    if forecast is None or not forecast.predictions:
+        return None, NOT_ENOUGH_DATA_MESSAGE
+    return forecast.predictions, SUCCESS_MESSAGE
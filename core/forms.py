@@ -15,18 +15,20 @@ class OTPVerifyForm(forms.Form):
 class ABTestForm(forms.ModelForm):
     class Meta:
         model = ABTest
-        fields = ['product', 'name', 'variable', 'variant_value']
+        fields = ['product', 'name', 'variable', 'variant_value', 'traffic_percent']
         widgets = {
             'product': forms.Select(attrs={'class': 'form-control'}),
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'variable': forms.Select(attrs={'class': 'form-control'}),
             'variant_value': forms.TextInput(attrs={'class': 'form-control'}),
+            'traffic_percent': forms.NumberInput(attrs={'class': 'form-control'}),
         }
         labels = {
             'product': 'محصول مورد نظر',
             'name': 'نام تست',
             'variable': 'متغیر مورد تست',
             'variant_value': 'مقدار جدید برای تست',
+            'traffic_percent': 'درصد ترافیک',
         }
 
     def __init__(self, *args, **kwargs):
@@ -0,0 +1,400 @@
+# core/ingest.py
+
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import DateTimeField, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Product, Customer, ProductEvent, ABTest, ABTestEvent
+from .rollups import record_daily_stats, record_cohort_activity, record_customer_summaries, record_ab_test_stats
+from .analytics_cache import bump_watermark
+from .caching import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# نگاشت رویدادهای محصول به رویدادهای تست A/B
+AB_TEST_EVENT_MAP = {'PURCHASE': 'CONVERSION', 'VIEW': 'VIEW'}
+PRICE_QUANTUM = Decimal('0.01')
+
+# (صاحب فروشگاه، شناسه محصول در سایت) → (شناسه داخلی، اثر انگشت نام/قیمت/آدرس)
+_product_cache = TTLCache(maxsize=settings.PRODUCT_CACHE_SIZE, ttl=settings.PRODUCT_CACHE_TTL)
+
+
+class InvalidEvent(ValueError):
+    """رویداد ارسال‌شده از سایت کاربر نامعتبر است."""
+
+
+def _field_limit(model, field):
+    return model._meta.get_field(field).max_length
+
+
+# حداکثر طول مقادیر متنی رویداد (برابر max_length ستون‌های متناظر)
+MAX_LENGTHS = {
+    'product_id': _field_limit(Product, 'product_id_from_site'),
+    'product_name': _field_limit(Product, 'name'),
+    'product_url': _field_limit(Product, 'page_url'),
+    'customer_identifier': _field_limit(Customer, 'identifier'),
+    'ab_test_variant': _field_limit(ABTestEvent, 'variant_shown'),
+}
+_price_field = Product._meta.get_field('price')
+# بزرگ‌ترین قیمتی که در ستون price (max_digits / decimal_places) جا می‌شود
+MAX_PRICE = Decimal(10) ** (_price_field.max_digits - _price_field.decimal_places) - PRICE_QUANTUM
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise InvalidEvent('Invalid price')
+    if not price.is_finite():
+        raise InvalidEvent('Invalid price')
+    price = price.quantize(PRICE_QUANTUM)
+    if abs(price) > MAX_PRICE:
+        raise InvalidEvent('Invalid price')
+    return price
+
+
+def parse_event(data, default_customer_id=None, active_tests=None):
+    """اعتبارسنجی یک رویداد خام و تبدیل آن به ساختار استاندارد.
+
+    active_tests (خروجی abtesting.get_active_tests) اگر داده شود، نسخه تست A/B رویداد
+    با نسخه‌های تعریف‌شده تست فعال همان محصول مقایسه می‌شود.
+    """
+    if not isinstance(data, dict):
+        raise InvalidEvent('Invalid data')
+    try:
+        event_type = data['event_type']
+        product_data = data['product']
+        product_id = product_data['id']
+    except (KeyError, TypeError):
+        raise InvalidEvent('Invalid data')
+
+    if event_type not in ProductEvent.EventType.values:
+        raise InvalidEvent('Invalid event type')
+
+    customer_identifier = data.get('customer_id') or default_customer_id
+    if not customer_identifier:
+        raise InvalidEvent('Customer identifier required')
+
+    try:
+        price = product_data.get('price', 0)
+    except AttributeError:
+        raise InvalidEvent('Invalid data')
+
+    event = {
+        'event_type': event_type,
+        'product_id': str(product_id),
+        'product_name': str(product_data.get('name', 'محصول ناشناس')),
+        'product_price': _parse_price(price),
+        'product_url': str(product_data.get('url', '')),
+        'customer_identifier': str(customer_identifier),
+        'ab_test_id': None,
+        'ab_test_variant': None,
+        'created_at': timezone.now(),
+    }
+    if data.get('ab_test_variant'):
+        try:
+            event['ab_test_id'] = int(data.get('ab_test_id'))
+        except (TypeError, ValueError):
+            raise InvalidEvent('Invalid A/B test id')
+        event['ab_test_variant'] = str(data['ab_test_variant'])
+
+    for field, limit in MAX_LENGTHS.items():
+        if event[field] is not None and len(event[field]) > limit:
+            raise InvalidEvent(f'{field} is too long (max {limit} characters)')
+
+    if event['ab_test_variant'] and active_tests is not None:
+        test = active_tests.get(event['product_id'])
+        if test is not None and test.id == event['ab_test_id'] and \
+                event['ab_test_variant'] not in {label for label, _ in test.arms}:
+            raise InvalidEvent('Invalid A/B test variant')
+    return event
+
+
+def product_fingerprint(name, price, page_url):
+    """اثر انگشت کوتاه مقادیر قابل تغییر محصول برای تشخیص تغییر بدون خواندن از پایگاه داده."""
+    if price is not None:
+        try:
+            price = price.quantize(PRICE_QUANTUM)
+        except InvalidOperation:
+            pass
+    return hashlib.blake2b(f'{name}\x1f{price}\x1f{page_url}'.encode('utf-8'), digest_size=8).digest()
+
+
+def forget_product(owner_id, product_id_from_site):
+    """حذف محصول از کش اثر انگشت (پس از تغییر یا حذف دستی محصول)."""
+    _product_cache.delete((owner_id, product_id_from_site))
+
+
+def _resolve_products(owner, events):
+    """ساخت یا به‌روزرسانی گروهی محصولات و برگرداندن نگاشت شناسه سایت به شناسه داخلی.
+
+    محصولی که اثر انگشتش با کش یکسان باشد بدون هیچ کوئری استفاده می‌شود و فقط محصولات
+    تغییرکرده به‌روزرسانی می‌شوند.
+    """
+    latest = {}
+    for event in events:
+        latest[event['product_id']] = (event['product_name'], event['product_price'], event['product_url'])
+    fingerprints = {product_id: product_fingerprint(*fields) for product_id, fields in latest.items()}
+
+    resolved = {}
+    stale = {}
+    missing = []
+    for product_id, fingerprint in fingerprints.items():
+        cached = _product_cache.get((owner.pk, product_id))
+        if cached is None:
+            missing.append(product_id)
+        elif cached[1] == fingerprint:
+            resolved[product_id] = cached[0]
+        else:
+            stale[product_id] = cached[0]
+
+    for product_id, pk, name, price, page_url in Product.objects.filter(
+        owner=owner, product_id_from_site__in=missing
+    ).values_list('product_id_from_site', 'id', 'name', 'price', 'page_url'):
+        if product_fingerprint(name, price, page_url) == fingerprints[product_id]:
+            resolved[product_id] = pk
+        else:
+            stale[product_id] = pk
+
+    if stale:
+        now = timezone.now()
+        Product.objects.bulk_update([
+            Product(id=pk, name=latest[product_id][0], price=latest[product_id][1],
+                    page_url=latest[product_id][2], updated_at=now)
+            for product_id, pk in stale.items()
+        ], ['name', 'price', 'page_url', 'updated_at'])
+        resolved.update(stale)
+
+    # محصولات جدید؛ اگر پردازه دیگری همزمان همان محصول را ساخته باشد، ردیف موجود دوباره خوانده می‌شود
+    new_ids = [product_id for product_id in latest if product_id not in resolved]
+    if new_ids:
+        Product.objects.bulk_create([
+            Product(owner=owner, product_id_from_site=product_id, name=latest[product_id][0],
+                    price=latest[product_id][1], page_url=latest[product_id][2])
+            for product_id in new_ids
+        ], ignore_conflicts=True)
+        resolved.update(Product.objects.filter(
+            owner=owner, product_id_from_site__in=new_ids
+        ).values_list('product_id_from_site', 'id'))
+
+    # کش فقط پس از ثبت تراکنش پر می‌شود تا شناسه محصولِ برگشت‌خورده در آن نماند
+    entries = {(owner.pk, product_id): (pk, fingerprints[product_id]) for product_id, pk in resolved.items()}
+    transaction.on_commit(lambda: _remember_products(entries))
+    return resolved
+
+
+def _remember_products(entries):
+    for key, value in entries.items():
+        _product_cache.set(key, value)
+
+
+class LastSeenBuffer:
+    """تجمیع آخرین زمان دیده‌شدن مشتریان در حافظه و ثبت گروهی دوره‌ای آن.
+
+    به جای یک UPDATE برای هر رویداد، در هر بار ثبت برای هر مشتری فقط بیشترین زمان نوشته می‌شود.
+    """
+
+    def __init__(self, flush_interval, flush_size):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def add(self, seen):
+        """افزودن زمان‌ها؛ ثبت دوره‌ای در رشته پس‌زمینه انجام می‌شود و فقط بافر پر روی رشته درخواست ثبت می‌شود."""
+        with self._lock:
+            for customer_id, seen_at in seen.items():
+                if self._pending.get(customer_id, seen_at) <= seen_at:
+                    self._pending[customer_id] = seen_at
+            due = len(self._pending) >= self.flush_size
+            # رشته پس از fork در پردازه فرزند وجود ندارد و دوباره ساخته می‌شود
+            if self._timer is None or not self._timer.is_alive():
+                self._timer = threading.Thread(target=self._flush_periodically, name='last-seen-flush', daemon=True)
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+    def flush(self):
+        """ثبت همه زمان‌های در انتظار؛ تعداد مشتریان به‌روزشده را برمی‌گرداند."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            # زمان ذخیره‌شده فقط جلو می‌رود (رویدادهای دیررس آن را عقب نمی‌برند)
+            Customer.objects.bulk_update([
+                Customer(id=customer_id,
+                         last_seen=Greatest('last_seen', Value(seen_at, output_field=DateTimeField())))
+                for customer_id, seen_at in pending.items()
+            ], ['last_seen'], batch_size=1000)
+        except DatabaseError:
+            logger.exception(f"Failed to flush last_seen for {len(pending)} customers")
+            return 0
+        return len(pending)
+
+
+# (صاحب فروشگاه، شناسه مشتری) → شناسه داخلی مشتری
+_customer_cache = TTLCache(maxsize=settings.CUSTOMER_CACHE_SIZE, ttl=settings.CUSTOMER_CACHE_TTL)
+last_seen_buffer = LastSeenBuffer(settings.CUSTOMER_LAST_SEEN_FLUSH_INTERVAL, settings.CUSTOMER_LAST_SEEN_FLUSH_SIZE)
+# زمان‌های باقی‌مانده هنگام خروج عادی پردازه از دست نمی‌روند
+atexit.register(last_seen_buffer.flush)
+
+
+def forget_customer(owner_id, identifier):
+    """حذف مشتری از کش شناسه‌ها (پس از حذف مشتری)."""
+    _customer_cache.delete((owner_id, identifier))
+
+
+def _resolve_customers(owner, events):
+    """یافتن یا ساخت گروهی مشتریان و برگرداندن نگاشت شناسه به شناسه داخلی.
+
+    مشتریان شناخته‌شده از کش خوانده می‌شوند و مشتریان جدید با ignore_conflicts ساخته و دوباره
+    خوانده می‌شوند تا ثبت همزمان یک مشتری در چند پردازه خطا ندهد.
+    """
+    seen = {}
+    for event in events:
+        identifier = event['customer_identifier']
+        if identifier not in seen or seen[identifier] < event['created_at']:
+            seen[identifier] = event['created_at']
+
+    customers = {}
+    missing = []
+    for identifier in seen:
+        customer_id = _customer_cache.get((owner.pk, identifier))
+        if customer_id is None:
+            missing.append(identifier)
+        else:
+            customers[identifier] = customer_id
+
+    if missing:
+        customers.update(
+            Customer.objects.filter(owner=owner, identifier__in=missing).values_list('identifier', 'id')
+        )
+    new_identifiers = [identifier for identifier in missing if identifier not in customers]
+    if new_identifiers:
+        Customer.objects.bulk_create([
+            Customer(owner=owner, identifier=identifier, last_seen=seen[identifier])
+            for identifier in new_identifiers
+        ], ignore_conflicts=True)
+        customers.update(
+            Customer.objects.filter(owner=owner, identifier__in=new_identifiers).values_list('identifier', 'id')
+        )
+
+    # کش و last_seen فقط پس از ثبت تراکنش به‌روز می‌شوند
+    entries = {(owner.pk, identifier): customer_id for identifier, customer_id in customers.items()}
+    last_seen = {customers[identifier]: seen_at for identifier, seen_at in seen.items()}
+    transaction.on_commit(lambda: _remember_customers(entries, last_seen))
+    return customers
+
+
+def _remember_customers(entries, last_seen):
+    for key, customer_id in entries.items():
+        _customer_cache.set(key, customer_id)
+    last_seen_buffer.add(last_seen)
+
+
+def _record_ab_test_events(owner, events, customers):
+    """ثبت گروهی رویدادهای تست A/B مربوط به رویدادهای ورودی."""
+    ab_events = [e for e in events if e['ab_test_variant'] and e['event_type'] in AB_TEST_EVENT_MAP]
+    if not ab_events:
+        return
+
+    test_ids = set()
+    for event in ab_events:
+        try:
+            test_ids.add(int(event['ab_test_id']))
+        except (TypeError, ValueError):
+            pass
+    # نسخه‌های مجاز هر تست فعال
+    active_tests = {
+        test.id: {label for label, _ in test.arms()}
+        for test in ABTest.objects.filter(id__in=test_ids, product__owner=owner, is_active=True)
+    }
+
+    to_create = []
+    for event in ab_events:
+        try:
+            test_id = int(event['ab_test_id'])
+        except (TypeError, ValueError):
+            test_id = None
+        if test_id not in active_tests:
+            logger.warning(f"A/B Test with id {event['ab_test_id']} not found.")
+            continue
+        if event['ab_test_variant'] not in active_tests[test_id]:
+            logger.warning(f"A/B Test {test_id} has no variant {event['ab_test_variant']}.")
+            continue
+        to_create.append(ABTestEvent(
+            test_id=test_id,
+            customer_id=customers[event['customer_identifier']],
+            variant_shown=event['ab_test_variant'],
+            event_type=AB_TEST_EVENT_MAP[event['event_type']],
+            created_at=event['created_at'],
+        ))
+    ABTestEvent.objects.bulk_create(to_create)
+    record_ab_test_stats(to_create)
+
+
+def forget_cached_ids(owner, events):
+    """حذف شناسه‌های کش‌شده محصولات و مشتریان دسته؛ پس از خطای کلید خارجی فراخوانی می‌شود."""
+    for event in events:
+        forget_product(owner.pk, event['product_id'])
+        forget_customer(owner.pk, event['customer_identifier'])
+
+
+def ingest_events(owner, events):
+    """ذخیره گروهی رویدادهای معتبر در یک تراکنش؛ خروجی به ترتیب ورودی است.
+
+    کش شناسه‌ها فقط در همین پردازه پاک می‌شود؛ اگر محصول یا مشتری کش‌شده در پردازه دیگری حذف شده باشد
+    ثبت با IntegrityError شکست می‌خورد و یک بار با کش پاک‌شده تکرار می‌شود.
+    """
+    try:
+        return _ingest_batch(owner, events)
+    except IntegrityError:
+        forget_cached_ids(owner, events)
+        return _ingest_batch(owner, events)
+
+
+@transaction.atomic
+def _ingest_batch(owner, events):
+    if not events:
+        return []
+
+    products = _resolve_products(owner, events)
+    customers = _resolve_customers(owner, events)
+
+    product_events = ProductEvent.objects.bulk_create([
+        ProductEvent(
+            product_id=products[event['product_id']],
+            customer_id=customers[event['customer_identifier']],
+            event_type=event['event_type'],
+            created_at=event['created_at'],
+        )
+        for event in events
+    ])
+    record_daily_stats(owner, product_events)
+    record_cohort_activity(owner, product_events)
+    record_customer_summaries(product_events)
+    _record_ab_test_events(owner, events, customers)
+
+    # خرید جدید نتایج تحلیلی کش‌شده این فروشگاه را کهنه می‌کند
+    if any(event['event_type'] == 'PURCHASE' for event in events):
+        transaction.on_commit(lambda: bump_watermark(owner.pk))
+    return product_events
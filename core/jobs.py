@@ -0,0 +1,147 @@
+# core/jobs.py
+
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics_cache import get_last_purchase_times
+from .cooccurrence import build_recommendations
+from .models import AnalyticsJob, Product
+from .utils import get_market_basket_analysis
+from .forecasting import refresh_sales_forecasts
+from .segments import refresh_customer_segments
+
+logger = logging.getLogger(__name__)
+
+
+def _run_market_basket(owner):
+    rules, message = get_market_basket_analysis(owner)
+    records = json.loads(rules.to_json(orient='records')) if rules is not None else []
+    return {'rules': records, 'message': message}
+
+
+def _run_sales_forecast(owner):
+    return {'products': refresh_sales_forecasts(owner)}
+
+
+def _run_customer_segments(owner):
+    return {'customers': refresh_customer_segments(owner)}
+
+
+# تحلیل‌هایی که در پس‌زمینه اجرا می‌شوند؛ خروجی هر تابع باید قابل تبدیل به JSON باشد
+JOB_ANALYSES = {
+    'market_basket': _run_market_basket,
+    'sales_forecast': _run_sales_forecast,
+    'customer_segments': _run_customer_segments,
+    'cooccurrence': build_recommendations,
+}
+
+
+def _is_stale(analysis, last_finished, last_purchase_at, now):
+    """last_finished آخرین کار پایان‌یافته (موفق یا ناموفق) و last_purchase_at زمان آخرین خرید فروشگاه است."""
+    if last_finished is None:
+        return True
+    ttl = settings.ANALYTICS_CACHE_TTLS.get(analysis, settings.ANALYTICS_CACHE_DEFAULT_TTL)
+    if last_finished.finished_at < now - timedelta(seconds=ttl):
+        return True
+    # خرید جدید پس از پایان آخرین کار موفق؛ با فاصله حداقلی تا خریدهای پیاپی صف را پر نکنند
+    return (
+        last_finished.status == AnalyticsJob.Status.SUCCEEDED
+        and last_purchase_at is not None and last_purchase_at > last_finished.finished_at
+        and last_finished.finished_at < now - timedelta(seconds=settings.ANALYTICS_JOB_MIN_INTERVAL)
+    )
+
+
+def get_job_state(owner, analysis):
+    """آخرین نتیجه موفق و کار فعال یک تحلیل، با یک کوئری و بدون افزودن کار به صف.
+
+    کارهای کهنه را schedule_stale_jobs در run_analytics_worker در صف قرار می‌دهد.
+    """
+    # پس از هر اجرا نتایج قدیمی‌تر حذف می‌شوند، پس برای هر تحلیل حداکثر سه ردیف وجود دارد
+    rows = AnalyticsJob.objects.filter(owner=owner, analysis=analysis).order_by(F('finished_at').desc(nulls_last=True))
+    latest = active = None
+    for job in rows:
+        if job.status == AnalyticsJob.Status.SUCCEEDED and latest is None:
+            latest = job
+        elif job.status in (AnalyticsJob.Status.PENDING, AnalyticsJob.Status.RUNNING):
+            active = job
+    return latest, active
+
+
+def schedule_stale_jobs():
+    """افزودن کار برای هر فروشگاه دارای محصول و هر تحلیلی که نتیجه‌اش کهنه است؛ تعداد کارهای جدید را برمی‌گرداند.
+
+    نتیجه‌ای کهنه است که TTL آن گذشته باشد یا پس از محاسبه‌اش خرید جدیدی ثبت شده باشد.
+    """
+    now = timezone.now()
+    owner_ids = set(Product.objects.values_list('owner_id', flat=True).distinct())
+    last_purchases = get_last_purchase_times(owner_ids)
+
+    active, last_finished = set(), {}
+    for job in AnalyticsJob.objects.filter(owner_id__in=owner_ids).only('owner_id', 'analysis', 'status', 'finished_at'):
+        key = (job.owner_id, job.analysis)
+        if job.status in (AnalyticsJob.Status.PENDING, AnalyticsJob.Status.RUNNING):
+            active.add(key)
+        elif key not in last_finished or job.finished_at > last_finished[key].finished_at:
+            # کار ناموفق هم تا پایان TTL دوباره اجرا نمی‌شود تا خطای تکراری صف را پر نکند
+            last_finished[key] = job
+
+    new_jobs = [
+        AnalyticsJob(owner_id=owner_id, analysis=analysis)
+        for owner_id in owner_ids for analysis in JOB_ANALYSES
+        if (owner_id, analysis) not in active
+        and _is_stale(analysis, last_finished.get((owner_id, analysis)), last_purchases.get(owner_id), now)
+    ]
+    # ignore_conflicts: کاری که همزمان از مسیر دیگری در صف قرار گرفته، تکرار نمی‌شود
+    AnalyticsJob.objects.bulk_create(new_jobs, ignore_conflicts=True)
+    return len(new_jobs)
+
+
+def claim_jobs(limit):
+    """برداشتن حداکثر limit کار از صف به صورت (شناسه کار، شناسه فروشگاه)؛ هر کار فقط توسط یک پردازش برداشته می‌شود."""
+    claimed = []
+    pending = AnalyticsJob.objects.filter(status=AnalyticsJob.Status.PENDING).order_by('created_at')
+    for job_id, owner_id in pending.values_list('id', 'owner_id')[:limit]:
+        updated = AnalyticsJob.objects.filter(id=job_id, status=AnalyticsJob.Status.PENDING).update(
+            status=AnalyticsJob.Status.RUNNING, started_at=timezone.now()
+        )
+        if updated:
+            claimed.append((job_id, owner_id))
+    return claimed
+
+
+def requeue_stale_jobs(timeout):
+    """بازگرداندن کارهایی که پردازشگرشان از کار افتاده به صف."""
+    return AnalyticsJob.objects.filter(
+        status=AnalyticsJob.Status.RUNNING, started_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=AnalyticsJob.Status.PENDING, started_at=None)
+
+
+def run_job(job_id):
+    """اجرای یک کار تحلیلی و ذخیره نتیجه آن (در پردازش‌های استخر اجرا می‌شود)."""
+    job = AnalyticsJob.objects.select_related('owner').get(id=job_id)
+    try:
+        job.result = JOB_ANALYSES[job.analysis](job.owner)
+        job.status = AnalyticsJob.Status.SUCCEEDED
+        job.error = ''
+    except Exception as e:
+        logger.error(f"Analytics job {job_id} ({job.analysis}) failed: {e}")
+        job.status = AnalyticsJob.Status.FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    with transaction.atomic():
+        job.save(update_fields=['result', 'status', 'error', 'finished_at'])
+        # نتایج قدیمی‌تر همین تحلیل حذف می‌شوند؛ پس از شکست، آخرین نتیجه موفق برای نمایش می‌ماند
+        older = AnalyticsJob.objects.filter(
+            owner_id=job.owner_id, analysis=job.analysis, finished_at__lte=job.finished_at,
+            status__in=[AnalyticsJob.Status.SUCCEEDED, AnalyticsJob.Status.FAILED],
+        ).exclude(id=job.id)
+        if job.status == AnalyticsJob.Status.FAILED:
+            older = older.filter(status=AnalyticsJob.Status.FAILED)
+        older.delete()
+    return job.status
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.rollups import rebuild_daily_stats, refresh_product_totals
+
+
+def parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'تاریخ نامعتبر است: {value} (قالب درست: YYYY-MM-DD)')
+
+
+def get_owner(username):
+    try:
+        return User.objects.get(username=username)
+    except User.DoesNotExist:
+        raise CommandError(f'کاربر "{username}" یافت نشد.')
+
+
+class Command(BaseCommand):
+    help = 'آمار روزانه و شمارنده‌های کل محصولات را از روی رویدادهای خام بازسازی می‌کند.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='نام کاربری صاحب فروشگاه (پیش‌فرض: همه کاربران)')
+        parser.add_argument('--since', type=parse_day, help='از این روز (YYYY-MM-DD)')
+        parser.add_argument('--until', type=parse_day, help='تا این روز (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        owner = get_owner(options['owner']) if options['owner'] else None
+        created = rebuild_daily_stats(owner, options['since'], options['until'])
+        refresh_product_totals(owner)
+        self.stdout.write(self.style.SUCCESS(f'✅ {created} ردیف آمار روزانه ساخته شد.'))
@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.forecasting import FORECASTERS, MIN_SALE_DAYS, load_daily_sales
+from core.management.commands.backfill_daily_stats import get_owner
+
+
+class Command(BaseCommand):
+    help = 'مقایسه مدل‌های پیش‌بینی فروش با آزمون گذشته‌نگر (rolling origin) روی همه محصولات.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='نام کاربری صاحب فروشگاه (پیش‌فرض: همه کاربران)')
+        parser.add_argument('--history', type=int, default=90, help='طول تاریخچه آموزش بر حسب روز')
+        parser.add_argument('--horizon', type=int, default=7, help='طول بازه پیش‌بینی بر حسب روز')
+        parser.add_argument('--folds', type=int, default=4, help='تعداد نقطه شروع آزمون')
+        parser.add_argument('--models', nargs='+', default=list(FORECASTERS), choices=list(FORECASTERS))
+
+    def handle(self, *args, **options):
+        history, horizon, folds = options['history'], options['horizon'], options['folds']
+        if options['owner']:
+            owners = [get_owner(options['owner'])]
+        else:
+            owners = User.objects.filter(products__isnull=False).distinct()
+
+        # هر نقطه شروع horizon روز عقب‌تر از قبلی است؛ داده آزمون هر دور بعد از بازه آموزش آن است
+        total_days = history + folds * horizon
+        series = []
+        for owner in owners:
+            _, start_day, sales = load_daily_sales(owner, total_days)
+            if len(sales):
+                series.append((start_day, sales))
+        if not series:
+            raise CommandError('داده فروشی برای آزمون یافت نشد.')
+
+        for name in options['models']:
+            forecaster = FORECASTERS[name]()
+            errors, percent_errors, elapsed, products = [], [], 0.0, 0
+            for start_day, sales in series:
+                for fold in range(folds):
+                    origin = history + fold * horizon
+                    train = sales[:, origin - history:origin]
+                    actual = sales[:, origin:origin + horizon]
+                    enough = (train > 0).sum(axis=1) >= MIN_SALE_DAYS
+                    if not enough.any():
+                        continue
+
+                    started = time.perf_counter()
+                    predicted = forecaster.fit_predict(
+                        train[enough], horizon, start_day + timedelta(days=origin - history)
+                    )
+                    elapsed += time.perf_counter() - started
+
+                    error = np.abs(predicted - actual[enough])
+                    errors.append(error.ravel())
+                    nonzero = actual[enough] > 0
+                    percent_errors.append(error[nonzero] / actual[enough][nonzero])
+                    products += int(enough.sum())
+
+            if not errors:
+                self.stdout.write(self.style.WARNING(f'{name}: محصولی با داده کافی یافت نشد.'))
+                continue
+            mae = np.concatenate(errors).mean()
+            percent_errors = np.concatenate(percent_errors)
+            mape = percent_errors.mean() * 100 if len(percent_errors) else float('nan')
+            self.stdout.write(self.style.SUCCESS(
+                f'{name:>14}: MAE={mae:.3f}  MAPE={mape:.1f}%  fit={elapsed * 1000:.1f}ms  ({products} series×folds)'
+            ))
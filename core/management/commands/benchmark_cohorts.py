@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from core.cohorts import build_cohort_table
+
+
+def legacy_cohorts(df):
+    """پیاده‌سازی قبلی: محاسبه فاصله ماه با apply سطر به سطر (فقط برای مقایسه)."""
+    def get_month_diff(row):
+        return (row['event_month'].year - row['cohort_month'].year) * 12 + (
+                row['event_month'].month - row['cohort_month'].month)
+
+    df = df.copy()
+    df['month_number'] = df.apply(get_month_diff, axis=1)
+    cohort_data = df.groupby(['cohort_month', 'month_number'])['customer_id'].nunique().reset_index()
+    return cohort_data.pivot_table(index='cohort_month', columns='month_number', values='customer_id')
+
+
+class Command(BaseCommand):
+    help = 'سنجش سرعت محاسبه برداری جدول کوهورت روی رویدادهای مصنوعی.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='تعداد ردیف رویداد')
+        parser.add_argument('--customers', type=int, default=1_000_000)
+        parser.add_argument('--months', type=int, default=24)
+        parser.add_argument('--legacy-rows', type=int, default=100_000,
+                            help='تعداد ردیف برای اجرای پیاده‌سازی قبلی (۰ برای رد کردن)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        months = options['months']
+        customer_cohorts = rng.integers(0, months, options['customers'])
+        customer_ids = rng.integers(0, options['customers'], options['rows'])
+        cohort_periods = customer_cohorts[customer_ids]
+        # رویدادها در همان ماه کوهورت یا ماه‌های بعد (با احتمال کاهشی) رخ می‌دهند
+        event_periods = np.minimum(cohort_periods + rng.geometric(0.5, options['rows']) - 1, months - 1)
+        self.stdout.write(f"{options['rows']} رویداد، {options['customers']} مشتری، {months} ماه")
+
+        started = time.perf_counter()
+        cohorts, counts, sizes = build_cohort_table(customer_ids, cohort_periods, event_periods)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'vectorized: {elapsed:.2f}s ({len(cohorts)} cohorts × {counts.shape[1]} offsets)'
+        ))
+
+        n = options['legacy_rows']
+        if not n:
+            return
+        base = np.datetime64('2020-01', 'M')
+        df = pd.DataFrame({
+            'customer_id': customer_ids[:n],
+            'cohort_month': pd.to_datetime((base + cohort_periods[:n]).astype('datetime64[ns]')),
+            'event_month': pd.to_datetime((base + event_periods[:n]).astype('datetime64[ns]')),
+        })
+        started = time.perf_counter()
+        legacy_cohorts(df)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.WARNING(
+            f'legacy apply: {elapsed:.2f}s for {n} rows (~{elapsed * options["rows"] / n:.0f}s for {options["rows"]})'
+        ))
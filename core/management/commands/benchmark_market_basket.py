@@ -0,0 +1,76 @@
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from mlxtend.frequent_patterns import apriori, association_rules
+
+from core.basket import build_basket_matrix, mine_rules
+
+
+def legacy_rules(df, min_support):
+    """پیاده‌سازی قبلی: ماتریس چگال با unstack و apriori (فقط برای مقایسه)."""
+    basket = df.groupby(['customer', 'day', 'product'])['product'].count().unstack().reset_index().fillna(0).set_index(
+        ['customer', 'day'])
+    basket_sets = basket.map(lambda x: x > 0)
+    frequent_itemsets = apriori(basket_sets, min_support=min_support, use_colnames=True)
+    if frequent_itemsets.empty:
+        return pd.DataFrame()
+    return association_rules(frequent_itemsets, num_itemsets=len(basket_sets), metric="lift", min_threshold=1)
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+class Command(BaseCommand):
+    help = 'مقایسه سرعت و حافظه تحلیل سبد خرید اسپارس (FP-Growth) با پیاده‌سازی چگال قبلی روی داده مصنوعی.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baskets', type=int, default=50000)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--items-per-basket', type=float, default=3.0, help='میانگین اقلام هر سبد.')
+        parser.add_argument('--min-support', type=float, default=0.01)
+        parser.add_argument('--pair-rate', type=float, default=0.2, help='نسبت سبدهایی که یک جفت هم‌خرید دارند.')
+        parser.add_argument('--skip-legacy', action='store_true',
+                            help='اجرای پیاده‌سازی قبلی را رد کن (برای داده‌های بزرگ حافظه کافی ندارد).')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        sizes = rng.poisson(options['items_per_basket'] - 1, options['baskets']) + 1
+        basket_ids = np.repeat(np.arange(options['baskets']), sizes)
+        # محبوبیت محصولات توزیع زیپف دارد؛ چند محصول پرفروش و تعداد زیادی کم‌فروش
+        weights = 1.0 / np.arange(1, options['products'] + 1)
+        product_ids = rng.choice(options['products'], size=len(basket_ids), p=weights / weights.sum())
+        # بخشی از سبدها یک جفت هم‌خرید دارند تا قانون معنادار وجود داشته باشد
+        paired = rng.random(options['baskets']) < options['pair_rate']
+        pair_baskets = np.flatnonzero(paired)
+        pair_first = rng.integers(0, min(20, options['products']), len(pair_baskets))
+        basket_ids = np.concatenate([basket_ids, pair_baskets, pair_baskets])
+        product_ids = np.concatenate([product_ids, pair_first, (pair_first + 1) % options['products']])
+        self.stdout.write(f"{options['baskets']} سبد، {options['products']} محصول، {len(basket_ids)} ردیف خرید")
+
+        def sparse_run():
+            matrix, items = build_basket_matrix(list(zip(basket_ids, np.zeros_like(basket_ids))), product_ids)
+            return mine_rules(matrix, items, min_support=options['min_support'])
+
+        rules, elapsed, peak = measure(sparse_run)
+        self.stdout.write(self.style.SUCCESS(
+            f'sparse fpgrowth: {elapsed:.2f}s, peak {peak:.1f} MiB, {len(rules)} rules'
+        ))
+
+        if options['skip_legacy']:
+            return
+        df = pd.DataFrame({'customer': basket_ids, 'day': 0, 'product': product_ids})
+        rules, elapsed, peak = measure(lambda: legacy_rules(df, options['min_support']))
+        self.stdout.write(self.style.WARNING(
+            f'dense apriori:   {elapsed:.2f}s, peak {peak:.1f} MiB, {len(rules)} rules'
+        ))
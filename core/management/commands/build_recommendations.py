@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core.management.commands.backfill_daily_stats import get_owner
+from core.recommender import build_customer_recommendations
+
+
+class Command(BaseCommand):
+    help = 'پیشنهادهای شخصی مشتریان را با فیلترینگ همکارانه محصول‌محور می‌سازد.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='نام کاربری صاحب فروشگاه (پیش‌فرض: همه کاربران)')
+        parser.add_argument('--k', type=int, default=10, help='تعداد پیشنهاد برای هر مشتری')
+        parser.add_argument('--neighbors', type=int, default=50, help='تعداد همسایه نزدیک هر محصول')
+        parser.add_argument('--batch-size', type=int, default=1000, help='تعداد مشتری در هر دسته محاسبه')
+
+    def handle(self, *args, **options):
+        if options['owner']:
+            owners = [get_owner(options['owner'])]
+        else:
+            owners = User.objects.filter(products__isnull=False).distinct()
+        for owner in owners:
+            created = build_customer_recommendations(
+                owner, k=options['k'], neighbors=options['neighbors'], batch_size=options['batch_size']
+            )
+            self.stdout.write(self.style.SUCCESS(f'✅ {created} پیشنهاد برای "{owner.username}" ساخته شد.'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.management.commands.backfill_daily_stats import get_owner, parse_day
+from core.rollups import find_daily_stats_mismatches, rebuild_daily_stats, refresh_product_totals
+
+
+class Command(BaseCommand):
+    help = 'آمار روزانه ذخیره‌شده را با رویدادهای خام مقایسه می‌کند.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='نام کاربری صاحب فروشگاه (پیش‌فرض: همه کاربران)')
+        parser.add_argument('--since', type=parse_day, help='از این روز (YYYY-MM-DD)')
+        parser.add_argument('--until', type=parse_day, help='تا این روز (YYYY-MM-DD)')
+        parser.add_argument('--fix', action='store_true', help='در صورت وجود اختلاف، بازه را بازسازی کن.')
+
+    def handle(self, *args, **options):
+        owner = get_owner(options['owner']) if options['owner'] else None
+        mismatches = find_daily_stats_mismatches(owner, options['since'], options['until'])
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('✅ آمار روزانه با رویدادهای خام یکسان است.'))
+            return
+
+        for m in mismatches[:50]:
+            self.stdout.write(
+                f"product={m['product_id']} day={m['day']} {m['field']}: "
+                f"expected={m['expected']} actual={m['actual']}"
+            )
+        self.stdout.write(self.style.WARNING(f'⚠️ {len(mismatches)} اختلاف یافت شد.'))
+
+        if options['fix']:
+            rebuild_daily_stats(owner, options['since'], options['until'])
+            refresh_product_totals(owner)
+            self.stdout.write(self.style.SUCCESS('✅ آمار روزانه بازسازی شد.'))
+        else:
+            raise CommandError('آمار روزانه با رویدادهای خام همخوانی ندارد.')
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.ingest import last_seen_buffer
+from core.spool import drain_spool
+
+
+class Command(BaseCommand):
+    help = 'رویدادهای ذخیره‌شده در صف محلی را به صورت دسته‌ای در پایگاه داده ثبت می‌کند.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='فقط یک بار صف را تخلیه کن و خارج شو.')
+        parser.add_argument('--flush-size', type=int, default=settings.EVENT_SPOOL_FLUSH_SIZE,
+                            help='حداکثر تعداد رویداد در هر تراکنش.')
+        parser.add_argument('--flush-interval', type=float, default=settings.EVENT_SPOOL_FLUSH_INTERVAL,
+                            help='فاصله بررسی صف وقتی رویداد جدیدی نیست (ثانیه).')
+
+    def handle(self, *args, **options):
+        directory = settings.EVENT_SPOOL_DIR
+        while True:
+            processed = drain_spool(directory, options['flush_size'])
+            if processed:
+                self.stdout.write(f'{processed} رویداد از صف ثبت شد.')
+            if options['once']:
+                last_seen_buffer.flush()
+                break
+            if processed < options['flush_size']:
+                # صف خالی است؛ زمان‌های last_seen در انتظار همین حالا ثبت می‌شوند
+                last_seen_buffer.flush()
+                time.sleep(options['flush_interval'])
@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core.management.commands.backfill_daily_stats import get_owner
+from core.rules import generate_recommendations
+
+
+class Command(BaseCommand):
+    help = 'پیشنهادهای مبتنی بر قانون (بازدید کم، موجودی کم، محصول محبوب و ...) را برای محصولات می‌سازد.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='نام کاربری صاحب فروشگاه (پیش‌فرض: همه کاربران)')
+        parser.add_argument('--days', type=int, default=30, help='بازه آماری بر حسب روز')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='تعداد محصول در هر دسته')
+
+    def handle(self, *args, **options):
+        if options['owner']:
+            owners = [get_owner(options['owner'])]
+        else:
+            owners = User.objects.filter(products__isnull=False).distinct()
+        for owner in owners:
+            counts = generate_recommendations(owner, days=options['days'], chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ "{owner.username}": {counts["created"]} پیشنهاد جدید، {counts["updated"]} به‌روزرسانی، '
+                f'{counts["deactivated"]} غیرفعال.'
+            ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.management.commands.backfill_daily_stats import get_owner
+from core.rollups import rebuild_ab_test_stats
+
+
+class Command(BaseCommand):
+    help = 'آمار نسخه‌های تست‌های A/B را از روی رویدادهای تست بازسازی می‌کند.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='نام کاربری صاحب فروشگاه (پیش‌فرض: همه کاربران)')
+
+    def handle(self, *args, **options):
+        owner = get_owner(options['owner']) if options['owner'] else None
+        created = rebuild_ab_test_stats(owner)
+        self.stdout.write(self.style.SUCCESS(f'✅ {created} ردیف آمار نسخه ساخته شد.'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.management.commands.backfill_daily_stats import get_owner
+from core.rollups import find_cohort_activity_mismatches, rebuild_cohort_activity
+
+
+class Command(BaseCommand):
+    help = 'جدول فعالیت کوهورت را از روی رویدادهای خام بازسازی یا با آن مقایسه می‌کند.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='نام کاربری صاحب فروشگاه (پیش‌فرض: همه کاربران)')
+        parser.add_argument('--check', action='store_true',
+                            help='فقط جدول ذخیره‌شده را با محاسبه کامل مقایسه کن (بدون بازسازی).')
+
+    def handle(self, *args, **options):
+        owner = get_owner(options['owner']) if options['owner'] else None
+        if not options['check']:
+            created = rebuild_cohort_activity(owner)
+            self.stdout.write(self.style.SUCCESS(f'✅ {created} ردیف فعالیت کوهورت ساخته شد.'))
+            return
+
+        mismatches = find_cohort_activity_mismatches(owner)
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('✅ جدول فعالیت کوهورت با رویدادهای خام یکسان است.'))
+            return
+        for m in mismatches[:50]:
+            self.stdout.write(
+                f"owner={m['owner_id']} cohort={m['cohort_month']} month={m['activity_month']}: "
+                f"expected={m['expected']} actual={m['actual']}"
+            )
+        raise CommandError(f'{len(mismatches)} اختلاف در جدول فعالیت کوهورت یافت شد.')
@@ -0,0 +1,105 @@
+import multiprocessing
+import time
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# مدل‌ها در این ماژول import نمی‌شوند: پردازش‌های استخر با spawn ساخته می‌شوند
+# و این ماژول پیش از django.setup() در آن‌ها بارگذاری می‌شود.
+
+
+def _setup_django():
+    import django
+    django.setup()
+
+
+def _execute(job_id):
+    from core.jobs import run_job
+    return run_job(job_id)
+
+
+class Command(BaseCommand):
+    help = 'کارهای تحلیلی صف را با چند پردازه پس‌زمینه اجرا می‌کند؛ کارهای هر فروشگاه همیشه به یک پردازه می‌رسند.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='تعداد پردازش‌های همزمان.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='فاصله بررسی صف (ثانیه).')
+        parser.add_argument('--stale-after', type=int, default=1800,
+                            help='کارهای در حال اجرا قدیمی‌تر از این مقدار (ثانیه) دوباره در صف قرار می‌گیرند.')
+        parser.add_argument('--once', action='store_true', help='کارهای فعلی صف را اجرا کن و خارج شو.')
+        parser.add_argument('--totals-interval', type=float, default=None,
+                            help='فاصله به‌روزرسانی شمارنده‌های کل محصولات (ثانیه؛ پیش‌فرض PRODUCT_TOTALS_REFRESH_INTERVAL).')
+        parser.add_argument('--schedule-interval', type=float, default=None,
+                            help='فاصله افزودن کار برای نتایج کهنه به صف (ثانیه؛ پیش‌فرض ANALYTICS_JOB_SCHEDULE_INTERVAL).')
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from core.jobs import claim_jobs, requeue_stale_jobs, schedule_stale_jobs
+        from core.models import AnalyticsJob
+        from core.rollups import refresh_product_totals
+
+        totals_interval = options['totals_interval'] or settings.PRODUCT_TOTALS_REFRESH_INTERVAL
+        totals_refreshed_at = None
+        schedule_interval = options['schedule_interval'] or settings.ANALYTICS_JOB_SCHEDULE_INTERVAL
+        scheduled_at = None
+
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'{requeued} کار نیمه‌تمام دوباره در صف قرار گرفت.'))
+
+        processes = options['processes']
+        running = {}
+        # هر فروشگاه همیشه به یک پردازه ثابت (owner_id % processes) می‌رسد تا شاخص‌های درون‌حافظه‌ای
+        # مانند شاخص هم‌رخدادی بین اجراها در همان پردازه بمانند
+        pools = [self._new_pool() for _ in range(processes)]
+        try:
+            while True:
+                if totals_refreshed_at is None or time.monotonic() - totals_refreshed_at >= totals_interval:
+                    # محصولات دارای آمار امروز و دیروز (رویدادهای نزدیک نیمه‌شب)
+                    refresh_product_totals(since=timezone.localdate() - timedelta(days=1))
+                    totals_refreshed_at = time.monotonic()
+
+                # در --once فقط یک بار زمان‌بندی می‌شود تا حلقه پس از خالی شدن صف پایان یابد
+                if scheduled_at is None or (not options['once'] and time.monotonic() - scheduled_at >= schedule_interval):
+                    scheduled = schedule_stale_jobs()
+                    if scheduled:
+                        self.stdout.write(f'{scheduled} کار تحلیلی کهنه در صف قرار گرفت.')
+                    scheduled_at = time.monotonic()
+
+                claimed = claim_jobs(processes - len(running)) if len(running) < processes else []
+                for job_id, owner_id in claimed:
+                    slot = owner_id % processes
+                    running[pools[slot].submit(_execute, job_id)] = (job_id, slot)
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id, slot = running.pop(future)
+                    try:
+                        status = future.result()
+                        self.stdout.write(f'کار {job_id}: {status}')
+                    except Exception as e:
+                        # پردازش اجراکننده از کار افتاده و نتیجه‌ای ذخیره نکرده است
+                        AnalyticsJob.objects.filter(id=job_id).update(
+                            status=AnalyticsJob.Status.FAILED, error=str(e), finished_at=timezone.now()
+                        )
+                        self.stderr.write(f'کار {job_id} ناموفق بود: {e}')
+                        if isinstance(e, BrokenProcessPool):
+                            # کارهای دیگر همین پردازه هم با همین خطا پایان می‌یابند؛ پردازه جایگزین ساخته می‌شود
+                            pools[slot] = self._new_pool()
+        finally:
+            for pool in pools:
+                pool.shutdown()
+
+    @staticmethod
+    def _new_pool():
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_setup_django)
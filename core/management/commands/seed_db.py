@@ -8,6 +8,9 @@ from decimal import Decimal
 from django.utils import timezone
 from datetime import timedelta, datetime
 from core.models import Product, Customer, ProductEvent, Recommendation  # مدل Customer اضافه شد
+from core.rollups import (
+    rebuild_daily_stats, refresh_product_totals, rebuild_cohort_activity, rebuild_customer_summaries,
+)
 
 
 class Command(BaseCommand):
@@ -133,4 +136,11 @@ class Command(BaseCommand):
                                       text='موجودی ساعت هوشمند رو به اتمام است. برای جلوگیری از توقف فروش، سریعاً آن را شارژ کنید.',
                                       confidence_score=0.98)
 
+        # --- ۷) آمار روزانه ---
+        # رویدادها مستقیم ساخته شده‌اند، پس جدول آمار روزانه باید از نو ساخته شود
+        rebuild_daily_stats(owner=user)
+        refresh_product_totals(owner=user)
+        rebuild_cohort_activity(owner=user)
+        rebuild_customer_summaries(owner=user)
+
         self.stdout.write(self.style.SUCCESS('✅ همه داده‌ها با موفقیت ساخته شد! داشبورد شما اکنون آماده نمایش است 🔥'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.management.commands.backfill_daily_stats import get_owner
+from core.models import UserSite
+from core.services import WooCommerceError, WooCommerceService, sync_woocommerce_products
+
+
+class Command(BaseCommand):
+    help = 'محصولات سایت‌های ووکامرس را به صورت گروهی و افزایشی همگام‌سازی می‌کند.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='نام کاربری صاحب فروشگاه (پیش‌فرض: همه کاربران)')
+        parser.add_argument('--full', action='store_true', help='همه محصولات، بدون توجه به آخرین همگام‌سازی')
+        parser.add_argument('--workers', type=int, help='تعداد درخواست‌های همزمان به هر سایت')
+
+    def handle(self, *args, **options):
+        sites = UserSite.objects.filter(is_active=True).exclude(woocommerce_consumer_key='').select_related('owner')
+        if options['owner']:
+            sites = sites.filter(owner=get_owner(options['owner']))
+
+        for site in sites:
+            self.stdout.write(f'🔄 همگام‌سازی {site.site_url} ...')
+            try:
+                synced = sync_woocommerce_products(
+                    site, full=options['full'], service=WooCommerceService(site, workers=options['workers'])
+                )
+            except WooCommerceError as e:
+                self.stdout.write(self.style.WARNING(f'⚠️ همگام‌سازی {site.site_url} ناموفق بود: {e}'))
+                continue
+            self.stdout.write(self.style.SUCCESS(f'✅ {synced} محصول از {site.site_url} ذخیره شد.'))
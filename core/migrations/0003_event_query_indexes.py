@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_spoolcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='abtestevent',
+            index=models.Index(fields=['test', 'variant_shown', 'event_type'], name='abtest_event_variant_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['owner', 'first_seen'], name='customer_owner_first_seen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productevent',
+            index=models.Index(fields=['product', 'event_type', 'created_at'], name='event_product_type_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='abtestevent',
+            name='test',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='test_events', to='core.abtest'),
+        ),
+        migrations.AlterField(
+            model_name='productevent',
+            name='product',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='core.product'),
+        ),
+    ]
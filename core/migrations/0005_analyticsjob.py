@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_dailyproductstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('analysis', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('PENDING', 'در صف'), ('RUNNING', 'در حال اجرا'), ('SUCCEEDED', 'انجام شد'), ('FAILED', 'ناموفق')], default='PENDING', max_length=20)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'کار تحلیلی',
+                'verbose_name_plural': 'کارهای تحلیلی',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='analytics_job_status_idx'), models.Index(fields=['owner', 'analysis', 'status', 'finished_at'], name='analytics_job_lookup_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'RUNNING'])), fields=('owner', 'analysis'), name='unique_active_analytics_job')],
+            },
+        ),
+    ]
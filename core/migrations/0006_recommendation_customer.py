@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_analyticsjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendation',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='core.customer'),
+        ),
+    ]
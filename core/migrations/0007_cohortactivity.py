@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recommendation_customer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_active_month',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CohortActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort_month', models.DateField()),
+                ('activity_month', models.DateField()),
+                ('customers', models.PositiveIntegerField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cohort_activity', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'فعالیت کوهورت',
+                'verbose_name_plural': 'فعالیت کوهورت\u200cها',
+                'unique_together': {('owner', 'cohort_month', 'activity_month')},
+            },
+        ),
+    ]
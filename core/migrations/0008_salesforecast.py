@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cohortactivity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('predictions', models.JSONField(blank=True, null=True)),
+                ('model', models.CharField(max_length=30)),
+                ('fitted_at', models.DateTimeField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_forecasts', to=settings.AUTH_USER_MODEL)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sales_forecast', to='core.product')),
+            ],
+            options={
+                'verbose_name': 'پیش\u200cبینی فروش',
+                'verbose_name_plural': 'پیش\u200cبینی\u200cهای فروش',
+            },
+        ),
+    ]
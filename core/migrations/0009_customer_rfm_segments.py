@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_salesforecast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='frequency',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='monetary',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='recency_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='rfm_score',
+            field=models.CharField(blank=True, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='segment',
+            field=models.CharField(blank=True, choices=[('CHAMPIONS', 'مشتریان برتر'), ('LOYAL', 'مشتریان وفادار'), ('POTENTIAL', 'وفادار بالقوه'), ('NEW', 'مشتریان جدید'), ('AT_RISK', 'در معرض ریزش'), ('HIBERNATING', 'غیرفعال'), ('WINDOW_SHOPPER', 'خریداران پنجره\u200cای')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='segment_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['owner', 'segment'], name='customer_owner_segment_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_customer_rfm_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSummary',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='core.customer')),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('purchase_count', models.PositiveIntegerField(default=0)),
+                ('event_count', models.PositiveIntegerField(default=0)),
+                ('last_event_at', models.DateTimeField(blank=True, null=True)),
+                ('category_counts', models.JSONField(default=dict)),
+            ],
+            options={
+                'verbose_name': 'خلاصه مشتری',
+                'verbose_name_plural': 'خلاصه مشتریان',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productevent',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='event_customer_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='productevent',
+            name='customer',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='core.customer'),
+        ),
+    ]
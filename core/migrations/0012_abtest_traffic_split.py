@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:59
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_product_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='abtest',
+            name='extra_variant_values',
+            field=models.JSONField(blank=True, default=list, help_text='مقادیر نسخه\u200cهای بیشتر (VARIANT_2، VARIANT_3، ...)'),
+        ),
+        migrations.AddField(
+            model_name='abtest',
+            name='traffic_percent',
+            field=models.PositiveSmallIntegerField(default=100, help_text='درصد بازدیدکنندگانی که وارد تست می\u200cشوند', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)], verbose_name='درصد ترافیک'),
+        ),
+        migrations.AddField(
+            model_name='abtest',
+            name='weights',
+            field=models.JSONField(blank=True, default=list, help_text='وزن ترافیک هر نسخه به ترتیب کنترل، متغیر و نسخه\u200cهای بیشتر؛ خالی یعنی تقسیم مساوی'),
+        ),
+    ]
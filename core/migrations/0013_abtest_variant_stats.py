@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_abtest_traffic_split'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ABTestVariantStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('variant', models.CharField(max_length=20)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('conversions', models.PositiveIntegerField(default=0)),
+                ('test', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='variant_stats', to='core.abtest')),
+            ],
+            options={
+                'verbose_name': 'آمار نسخه تست A/B',
+                'verbose_name_plural': 'آمار نسخه\u200cهای تست A/B',
+                'unique_together': {('test', 'variant')},
+            },
+        ),
+    ]
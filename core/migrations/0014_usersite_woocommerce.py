@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_abtest_variant_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersite',
+            name='woocommerce_consumer_key',
+            field=models.CharField(blank=True, max_length=255, verbose_name='کلید مصرف\u200cکننده ووکامرس'),
+        ),
+        migrations.AddField(
+            model_name='usersite',
+            name='woocommerce_consumer_secret',
+            field=models.CharField(blank=True, max_length=255, verbose_name='رمز مصرف\u200cکننده ووکامرس'),
+        ),
+        migrations.AddField(
+            model_name='usersite',
+            name='woocommerce_synced_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='آخرین همگام\u200cسازی ووکامرس'),
+        ),
+    ]
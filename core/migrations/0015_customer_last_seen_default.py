@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_usersite_woocommerce'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
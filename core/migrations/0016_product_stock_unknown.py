@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+def clear_ingest_default_stock(apps, schema_editor):
+    # موجودی صفر محصولات فروشگاه‌هایی که هرگز با ووکامرس همگام نشده‌اند فقط مقدار پیش‌فرض ثبت رویداد بوده است
+    Product = apps.get_model('core', 'Product')
+    UserSite = apps.get_model('core', 'UserSite')
+    synced_owners = UserSite.objects.filter(woocommerce_synced_at__isnull=False).values('owner_id')
+    Product.objects.filter(stock=0).exclude(owner_id__in=synced_owners).update(stock=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_customer_last_seen_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='stock',
+            field=models.IntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(clear_ingest_default_stock, migrations.RunPython.noop),
+    ]
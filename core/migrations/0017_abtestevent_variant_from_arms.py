@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_product_stock_unknown'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='abtestevent',
+            name='variant_shown',
+            field=models.CharField(help_text='برچسب نسخه نمایش داده شده (از ABTest.arms)', max_length=20),
+        ),
+    ]
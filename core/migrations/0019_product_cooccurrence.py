@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_analytics_watermark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCooccurrence',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cooccurrence', serialize=False, to='core.product')),
+                ('bought_together', models.JSONField(default=list)),
+                ('viewed_together', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_cooccurrences', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'هم\u200cرخدادی محصول',
+                'verbose_name_plural': 'هم\u200cرخدادی محصولات',
+            },
+        ),
+    ]
@@ -4,6 +4,8 @@ import secrets
 import string
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -22,17 +24,40 @@ class Category(models.Model):
 
 
 class Customer(models.Model):
+    class Segment(models.TextChoices):
+        CHAMPIONS = 'CHAMPIONS', 'مشتریان برتر'
+        LOYAL = 'LOYAL', 'مشتریان وفادار'
+        POTENTIAL = 'POTENTIAL', 'وفادار بالقوه'
+        NEW = 'NEW', 'مشتریان جدید'
+        AT_RISK = 'AT_RISK', 'در معرض ریزش'
+        HIBERNATING = 'HIBERNATING', 'غیرفعال'
+        WINDOW_SHOPPER = 'WINDOW_SHOPPER', 'خریداران پنجره‌ای'
+
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='customers', null=True)
     identifier = models.CharField(max_length=255, help_text="شناسه مشتری (IP یا شناسه از سایت شما)", null=True)
     email = models.EmailField(null=True, blank=True)
     name = models.CharField(max_length=255, null=True, blank=True)
     first_seen = models.DateTimeField(auto_now_add=True)
-    last_seen = models.DateTimeField(auto_now=True)
+    # به صورت تجمیعی و دوره‌ای توسط core.ingest به‌روز می‌شود، نه در هر ذخیره
+    last_seen = models.DateTimeField(default=timezone.now)
+    # آخرین ماهی که مشتری در جدول فعالیت کوهورت شمرده شده است
+    last_active_month = models.DateField(null=True, blank=True)
+    # ویژگی‌های RFM (تازگی، تکرار و ارزش خرید) و بخش مشتری؛ توسط core.segments محاسبه می‌شوند
+    recency_days = models.PositiveIntegerField(null=True, blank=True)
+    frequency = models.PositiveIntegerField(default=0)
+    monetary = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rfm_score = models.CharField(max_length=3, blank=True)
+    segment = models.CharField(max_length=20, choices=Segment.choices, blank=True)
+    segment_updated_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name = 'مشتری'
         verbose_name_plural = 'مشتریان'
         unique_together = ('owner', 'identifier')
+        indexes = [
+            models.Index(fields=['owner', 'first_seen'], name='customer_owner_first_seen_idx'),
+            models.Index(fields=['owner', 'segment'], name='customer_owner_segment_idx'),
+        ]
 
     def __str__(self):
         return self.identifier
@@ -44,16 +69,30 @@ class Product(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     page_url = models.URLField(max_length=1024)
-    stock = models.IntegerField(default=0, null=True, blank=True)
+    # None یعنی موجودی نامشخص (محصولی که فقط از رویدادها ساخته شده و هنوز همگام‌سازی نشده)
+    stock = models.IntegerField(default=None, null=True, blank=True)
     category = models.CharField(max_length=255, default='عمومی')
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0.0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # شمارنده‌های کل رویدادها؛ همراه با آمار روزانه به‌روز می‌شوند (core.rollups)
+    total_views = models.PositiveIntegerField(default=0)
+    total_carts = models.PositiveIntegerField(default=0)
+    total_purchases = models.PositiveIntegerField(default=0)
+    conversion_rate = models.FloatField(default=0.0)
 
     class Meta:
         verbose_name = 'محصول'
         verbose_name_plural = 'محصولات'
         unique_together = ('owner', 'product_id_from_site')
+        # ایندکس‌های مرتب‌سازی فهرست محصولات (صفحه‌بندی keyset)
+        indexes = [
+            models.Index(fields=['owner', 'created_at', 'id'], name='product_owner_created_idx'),
+            models.Index(fields=['owner', 'total_views', 'id'], name='product_owner_views_idx'),
+            models.Index(fields=['owner', 'total_purchases', 'id'], name='product_owner_purchases_idx'),
+            models.Index(fields=['owner', 'conversion_rate', 'id'], name='product_owner_conversion_idx'),
+            models.Index(fields=['owner', 'category'], name='product_owner_category_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -65,19 +104,102 @@ class ProductEvent(models.Model):
         ADD_TO_CART = 'ADD_TO_CART', 'افزودن به سبد'
         PURCHASE = 'PURCHASE', 'خرید نهایی'
 
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='events', null=True, blank=True)
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='events', null=True, blank=True)
+    # ایندکس جداگانه روی product لازم نیست؛ ایندکس ترکیبی زیر با product شروع می‌شود
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='events', null=True, blank=True,
+                                db_index=False)
+    # ایندکس ترکیبی (customer, created_at) برای تاریخچه رویدادهای مشتری جایگزین ایندکس جداگانه است
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='events', null=True, blank=True,
+                                 db_index=False)
     event_type = models.CharField(max_length=20, choices=EventType.choices, default=EventType.VIEW)
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         verbose_name = 'رویداد محصول'
         verbose_name_plural = 'رویدادهای محصولات'
+        indexes = [
+            models.Index(fields=['product', 'event_type', 'created_at'], name='event_product_type_created_idx'),
+            models.Index(fields=['customer', 'created_at', 'id'], name='event_customer_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_event_type_display()} for {self.product.name if self.product else 'Unknown'} by {self.customer.identifier if self.customer else 'Unknown'}"
 
 
+class CustomerSummary(models.Model):
+    """خلاصه فعالیت یک مشتری که هنگام ثبت رویدادها به‌روز می‌شود."""
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    purchase_count = models.PositiveIntegerField(default=0)
+    event_count = models.PositiveIntegerField(default=0)
+    last_event_at = models.DateTimeField(null=True, blank=True)
+    # تعداد رویدادهای مشتری در هر دسته‌بندی محصول
+    category_counts = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name = 'خلاصه مشتری'
+        verbose_name_plural = 'خلاصه مشتریان'
+
+    def top_categories(self, limit=3):
+        return sorted(self.category_counts, key=self.category_counts.get, reverse=True)[:limit]
+
+    def __str__(self):
+        return f"{self.customer_id}: {self.event_count} events"
+
+
+class DailyProductStats(models.Model):
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_product_stats')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    carts = models.PositiveIntegerField(default=0)
+    purchases = models.PositiveIntegerField(default=0)
+    unique_customers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'آمار روزانه محصول'
+        verbose_name_plural = 'آمار روزانه محصولات'
+        unique_together = ('product', 'day')
+        indexes = [
+            models.Index(fields=['owner', 'day'], name='daily_stats_owner_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.day}"
+
+
+class CohortActivity(models.Model):
+    """تعداد مشتریان یکتای هر کوهورت ماهانه که در یک ماه فعالیت داشته‌اند."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cohort_activity')
+    cohort_month = models.DateField()
+    activity_month = models.DateField()
+    customers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'فعالیت کوهورت'
+        verbose_name_plural = 'فعالیت کوهورت‌ها'
+        unique_together = ('owner', 'cohort_month', 'activity_month')
+
+    def __str__(self):
+        return f"{self.cohort_month} → {self.activity_month}: {self.customers}"
+
+
+class SalesForecast(models.Model):
+    """آخرین پیش‌بینی فروش روزانه یک محصول."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sales_forecasts')
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='sales_forecast')
+    # نگاشت تاریخ (YYYY-MM-DD) به تعداد فروش پیش‌بینی‌شده؛ اگر داده کافی نباشد خالی است
+    predictions = models.JSONField(null=True, blank=True)
+    model = models.CharField(max_length=30)
+    fitted_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'پیش‌بینی فروش'
+        verbose_name_plural = 'پیش‌بینی‌های فروش'
+
+    def __str__(self):
+        return f"{self.product_id} ({self.model}) @ {self.fitted_at}"
+
+
 class Recommendation(models.Model):
     class ReasonType(models.TextChoices):
         LOW_VIEW = 'LOW_VIEW', 'بازدید کم'
@@ -90,6 +212,9 @@ class Recommendation(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='core_recommendations', null=True,
                                 blank=True)
+    # پیشنهاد شخصی برای یک مشتری؛ اگر خالی باشد پیشنهاد برای صاحب فروشگاه است
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='recommendations', null=True,
+                                 blank=True)
     reason = models.CharField(max_length=30, choices=ReasonType.choices)
     text = models.TextField(verbose_name="متن پیشنهاد")
     is_active = models.BooleanField(default=True)
@@ -134,6 +259,10 @@ class UserSite(models.Model):
     api_key = models.OneToOneField(ApiKey, on_delete=models.CASCADE, related_name='site')
     is_active = models.BooleanField(default=True, verbose_name='وضعیت فعال')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+    woocommerce_consumer_key = models.CharField(max_length=255, blank=True, verbose_name='کلید مصرف‌کننده ووکامرس')
+    woocommerce_consumer_secret = models.CharField(max_length=255, blank=True, verbose_name='رمز مصرف‌کننده ووکامرس')
+    # زمان شروع آخرین همگام‌سازی کامل‌شده (GMT)؛ اجرای بعدی فقط محصولات تغییرکرده پس از آن را می‌خواند
+    woocommerce_synced_at = models.DateTimeField(null=True, blank=True, verbose_name='آخرین همگام‌سازی ووکامرس')
 
     def __str__(self):
         return self.site_url
@@ -149,6 +278,14 @@ class ABTest(models.Model):
     variable = models.CharField(max_length=20, choices=TestVariable.choices, verbose_name="متغیر مورد تست")
     control_value = models.CharField(max_length=255, help_text="مقدار اصلی یا کنترل")
     variant_value = models.CharField(max_length=255, help_text="مقدار جدید برای تست")
+    extra_variant_values = models.JSONField(default=list, blank=True,
+                                            help_text="مقادیر نسخه‌های بیشتر (VARIANT_2، VARIANT_3، ...)")
+    weights = models.JSONField(default=list, blank=True,
+                               help_text="وزن ترافیک هر نسخه به ترتیب کنترل، متغیر و نسخه‌های بیشتر؛ خالی یعنی تقسیم مساوی")
+    traffic_percent = models.PositiveSmallIntegerField(
+        default=100, validators=[MinValueValidator(1), MaxValueValidator(100)],
+        verbose_name="درصد ترافیک", help_text="درصد بازدیدکنندگانی که وارد تست می‌شوند"
+    )
     is_active = models.BooleanField(default=True)
     start_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateTimeField(null=True, blank=True)
@@ -160,22 +297,137 @@ class ABTest(models.Model):
     def __str__(self):
         return f"تست '{self.name}' برای محصول '{self.product.name}'"
 
+    def arms(self):
+        """نسخه‌های تست به صورت لیست (برچسب، مقدار)؛ نسخه اول همیشه کنترل است."""
+        arms = [('CONTROL', self.control_value), ('VARIANT', self.variant_value)]
+        arms += [(f'VARIANT_{i}', value) for i, value in enumerate(self.extra_variant_values, start=2)]
+        return arms
+
+    def clean(self):
+        if not isinstance(self.extra_variant_values, list):
+            raise ValidationError({'extra_variant_values': 'مقادیر نسخه‌ها باید به صورت لیست باشد.'})
+        if self.weights:
+            if len(self.weights) != len(self.arms()):
+                raise ValidationError({'weights': 'تعداد وزن‌ها باید با تعداد نسخه‌ها برابر باشد.'})
+            if any(not isinstance(w, (int, float)) or w < 0 for w in self.weights) or not sum(self.weights):
+                raise ValidationError({'weights': 'وزن‌ها باید اعداد نامنفی با مجموع مثبت باشند.'})
 
-class ABTestEvent(models.Model):
-    class VariantType(models.TextChoices):
-        CONTROL = 'CONTROL', 'کنترل'
-        VARIANT = 'VARIANT', 'متغیر جدید'
 
+class ABTestEvent(models.Model):
     class EventType(models.TextChoices):
         VIEW = 'VIEW', 'نمایش'
         CONVERSION = 'CONVERSION', 'تبدیل (خرید)'
 
-    test = models.ForeignKey(ABTest, on_delete=models.CASCADE, related_name='test_events')
+    test = models.ForeignKey(ABTest, on_delete=models.CASCADE, related_name='test_events', db_index=False)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='test_events')
-    variant_shown = models.CharField(max_length=20, choices=VariantType.choices)
+    # نسخه‌ها به تعداد مقادیر تست بستگی دارند (CONTROL، VARIANT، VARIANT_2، ...)؛ ABTest.arms را ببینید
+    variant_shown = models.CharField(max_length=20, help_text="برچسب نسخه نمایش داده شده (از ABTest.arms)")
     event_type = models.CharField(max_length=20, choices=EventType.choices)
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         verbose_name = 'رویداد تست A/B'
         verbose_name_plural = 'رویدادهای تست A/B'
+        indexes = [
+            models.Index(fields=['test', 'variant_shown', 'event_type'], name='abtest_event_variant_type_idx'),
+        ]
+
+    def clean(self):
+        if self.test_id and self.variant_shown not in {label for label, _ in self.test.arms()}:
+            raise ValidationError({'variant_shown': 'این نسخه در تست تعریف نشده است.'})
+
+
+class ABTestVariantStats(models.Model):
+    """شمارنده نمایش و تبدیل هر نسخه یک تست A/B که هنگام ثبت رویدادها به‌روز می‌شود."""
+    test = models.ForeignKey(ABTest, on_delete=models.CASCADE, related_name='variant_stats', db_index=False)
+    variant = models.CharField(max_length=20)
+    views = models.PositiveIntegerField(default=0)
+    conversions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'آمار نسخه تست A/B'
+        verbose_name_plural = 'آمار نسخه‌های تست A/B'
+        unique_together = ('test', 'variant')
+
+    def __str__(self):
+        return f"{self.test_id}/{self.variant}: {self.conversions}/{self.views}"
+
+
+class SpoolCheckpoint(models.Model):
+    segment = models.CharField(max_length=255, unique=True)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'نقطه بازیابی صف رویدادها'
+        verbose_name_plural = 'نقاط بازیابی صف رویدادها'
+
+    def __str__(self):
+        return f"{self.segment} @ {self.offset}"
+
+
+class AnalyticsJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'در صف'
+        RUNNING = 'RUNNING', 'در حال اجرا'
+        SUCCEEDED = 'SUCCEEDED', 'انجام شد'
+        FAILED = 'FAILED', 'ناموفق'
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analytics_jobs')
+    analysis = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'کار تحلیلی'
+        verbose_name_plural = 'کارهای تحلیلی'
+        constraints = [
+            # برای هر فروشگاه و هر تحلیل فقط یک کار در صف یا در حال اجرا مجاز است
+            models.UniqueConstraint(
+                fields=['owner', 'analysis'],
+                condition=models.Q(status__in=['PENDING', 'RUNNING']),
+                name='unique_active_analytics_job',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='analytics_job_status_idx'),
+            models.Index(fields=['owner', 'analysis', 'status', 'finished_at'], name='analytics_job_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.analysis} ({self.get_status_display()}) for {self.owner_id}"
+
+
+class AnalyticsWatermark(models.Model):
+    """نسخه داده‌های یک فروشگاه برای باطل کردن نتایج تحلیلی؛ در پایگاه داده تا همه پردازه‌ها آن را ببینند."""
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='analytics_watermark')
+    version = models.PositiveBigIntegerField(default=0)
+    # زمان آخرین خرید ثبت‌شده
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'نسخه داده‌های تحلیلی'
+        verbose_name_plural = 'نسخه‌های داده‌های تحلیلی'
+
+    def __str__(self):
+        return f"{self.owner_id}: {self.version}"
+
+
+class ProductCooccurrence(models.Model):
+    """محصولات هم‌خرید و هم‌بازدید یک محصول؛ پردازشگر کارها فقط ردیف محصولات تغییرکرده را بازنویسی می‌کند."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='cooccurrence')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_cooccurrences')
+    bought_together = models.JSONField(default=list)
+    viewed_together = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'هم‌رخدادی محصول'
+        verbose_name_plural = 'هم‌رخدادی محصولات'
+
+    def __str__(self):
+        return f"{self.product_id} ({self.updated_at})"
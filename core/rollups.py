@@ -0,0 +1,473 @@
+# core/rollups.py
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    Case, Count, DateField, F, FloatField, Max, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import (
+    Product, ProductEvent, DailyProductStats, Customer, CohortActivity, CustomerSummary, ABTestEvent,
+    ABTestVariantStats,
+)
+
+logger = logging.getLogger(__name__)
+
+# نگاشت نوع رویداد به ستون شمارنده در جدول آمار روزانه
+EVENT_COUNTER_FIELDS = {
+    'VIEW': 'views',
+    'ADD_TO_CART': 'carts',
+    'PURCHASE': 'purchases',
+}
+STATS_FIELDS = ('views', 'carts', 'purchases', 'unique_customers')
+# نگاشت نوع رویداد تست A/B به ستون شمارنده آمار نسخه
+AB_TEST_COUNTER_FIELDS = {'VIEW': 'views', 'CONVERSION': 'conversions'}
+
+# نرخ تبدیل کل محصول (درصد خرید به بازدید) از روی شمارنده‌های کل
+CONVERSION_RATE = Case(
+    When(total_views__gt=0, then=F('total_purchases') * 100.0 / F('total_views')),
+    default=Value(0.0),
+    output_field=FloatField(),
+)
+
+
+def _day_bounds(first_day, last_day):
+    start = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), datetime.min.time()))
+    return start, end
+
+
+def record_daily_stats(owner, product_events):
+    """به‌روزرسانی افزایشی آمار روزانه برای رویدادهای تازه ثبت‌شده."""
+    if not product_events:
+        return
+
+    deltas = defaultdict(lambda: dict.fromkeys(STATS_FIELDS, 0))
+    batch_customers = defaultdict(set)
+    for event in product_events:
+        key = (event.product_id, timezone.localdate(event.created_at))
+        deltas[key][EVENT_COUNTER_FIELDS[event.event_type]] += 1
+        batch_customers[key].add(event.customer_id)
+
+    # مشتریانی که پیش از این دسته در همان روز رویدادی برای همان محصول داشته‌اند، یکتا حساب نمی‌شوند
+    days = [day for _, day in deltas]
+    start, end = _day_bounds(min(days), max(days))
+    seen = set(ProductEvent.objects.filter(
+        product_id__in={product_id for product_id, _ in deltas},
+        customer_id__in={event.customer_id for event in product_events},
+        created_at__gte=start, created_at__lt=end,
+        id__lt=min(event.id for event in product_events),
+    ).annotate(day=TruncDate('created_at')).values_list('product_id', 'day', 'customer_id').distinct())
+    for (product_id, day), customers in batch_customers.items():
+        deltas[(product_id, day)]['unique_customers'] = sum(
+            1 for customer_id in customers if (product_id, day, customer_id) not in seen
+        )
+
+    # شمارنده‌های کل محصول اینجا نوشته نمی‌شوند تا ردیف محصولات پربازدید در هر دسته قفل نشود؛
+    # refresh_product_totals آن‌ها را به صورت دوره‌ای از همین جدول به‌روز می‌کند
+    _upsert_daily_stats(owner, deltas)
+
+
+# حداکثر ردیف در هر INSERT ... ON CONFLICT (سقف تعداد پارامترهای SQLite)
+UPSERT_CHUNK_SIZE = 100
+
+
+def _upsert_daily_stats(owner, deltas):
+    """افزودن شمارنده‌های دسته به آمار روزانه با یک INSERT ... ON CONFLICT DO UPDATE.
+
+    روی پایگاه‌داده‌هایی که این دستور را ندارند، ردیف‌های خالی ساخته و هر کلید جداگانه افزایش داده می‌شود.
+    """
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        # ابتدا ردیف‌های خالی ساخته می‌شوند تا افزایش شمارنده‌ها در حالت همزمان هم درست بماند
+        DailyProductStats.objects.bulk_create(
+            [DailyProductStats(owner=owner, product_id=product_id, day=day) for product_id, day in deltas],
+            ignore_conflicts=True,
+        )
+        for (product_id, day), delta in deltas.items():
+            DailyProductStats.objects.filter(product_id=product_id, day=day).update(
+                **{field: F(field) + value for field, value in delta.items() if value}
+            )
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(DailyProductStats._meta.db_table)
+    columns = ['owner_id', 'product_id', 'day', *STATS_FIELDS]
+    updates = ', '.join(f'{qn(field)} = {table}.{qn(field)} + excluded.{qn(field)}' for field in STATS_FIELDS)
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    items = list(deltas.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+            chunk = items[start:start + UPSERT_CHUNK_SIZE]
+            params = []
+            for (product_id, day), delta in chunk:
+                params += [owner.pk, product_id, connection.ops.adapt_datefield_value(day),
+                           *(delta[field] for field in STATS_FIELDS)]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(qn(c) for c in columns)}) VALUES {", ".join([row] * len(chunk))} '
+                f'ON CONFLICT ({qn("product_id")}, {qn("day")}) DO UPDATE SET {updates}',
+                params,
+            )
+
+
+def _raw_daily_stats(owner=None, start_day=None, end_day=None):
+    """محاسبه آمار روزانه مستقیماً از جدول رویدادها."""
+    events = ProductEvent.objects.filter(product__isnull=False)
+    if owner is not None:
+        events = events.filter(product__owner=owner)
+    if start_day is not None:
+        events = events.filter(created_at__gte=_day_bounds(start_day, start_day)[0])
+    if end_day is not None:
+        events = events.filter(created_at__lt=_day_bounds(end_day, end_day)[1])
+    return events.annotate(day=TruncDate('created_at')).values(
+        'product_id', 'product__owner_id', 'day'
+    ).annotate(
+        views=Count('id', filter=Q(event_type='VIEW')),
+        carts=Count('id', filter=Q(event_type='ADD_TO_CART')),
+        purchases=Count('id', filter=Q(event_type='PURCHASE')),
+        unique_customers=Count('customer', distinct=True),
+    ).order_by()
+
+
+def _stored_daily_stats(owner=None, start_day=None, end_day=None):
+    stats = DailyProductStats.objects.all()
+    if owner is not None:
+        stats = stats.filter(owner=owner)
+    if start_day is not None:
+        stats = stats.filter(day__gte=start_day)
+    if end_day is not None:
+        stats = stats.filter(day__lte=end_day)
+    return stats
+
+
+@transaction.atomic
+def rebuild_daily_stats(owner=None, start_day=None, end_day=None, batch_size=5000):
+    """بازسازی کامل آمار روزانه از روی رویدادهای خام؛ تعداد ردیف‌های ساخته‌شده را برمی‌گرداند."""
+    _stored_daily_stats(owner, start_day, end_day).delete()
+
+    created, batch = 0, []
+    for row in _raw_daily_stats(owner, start_day, end_day).iterator(chunk_size=batch_size):
+        batch.append(DailyProductStats(
+            owner_id=row['product__owner_id'], product_id=row['product_id'], day=row['day'],
+            **{field: row[field] for field in STATS_FIELDS}
+        ))
+        if len(batch) >= batch_size:
+            DailyProductStats.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    DailyProductStats.objects.bulk_create(batch)
+    return created + len(batch)
+
+
+@transaction.atomic
+def refresh_product_totals(owner=None, since=None, batch_size=5000):
+    """محاسبه مجدد شمارنده‌های کل محصولات از جدول آمار روزانه.
+
+    since: فقط محصولاتی که از این روز به بعد آمار دارند (اجرای دوره‌ای در run_analytics_worker)؛
+    بدون آن همه محصولات بازسازی می‌شوند (پس از rebuild_daily_stats).
+    """
+    products = Product.objects.all()
+    stats = DailyProductStats.objects.all()
+    if owner is not None:
+        products = products.filter(owner=owner)
+        stats = stats.filter(owner=owner)
+    if since is not None:
+        touched = stats.filter(day__gte=since).values('product_id')
+        products = products.filter(id__in=touched)
+        stats = stats.filter(product_id__in=touched)
+    products.update(total_views=0, total_carts=0, total_purchases=0)
+
+    totals = stats.values('product_id').annotate(
+        views=Sum('views'), carts=Sum('carts'), purchases=Sum('purchases')
+    ).order_by()
+    Product.objects.bulk_update(
+        [
+            Product(id=row['product_id'], total_views=row['views'], total_carts=row['carts'],
+                    total_purchases=row['purchases'])
+            for row in totals.iterator()
+        ],
+        ['total_views', 'total_carts', 'total_purchases'], batch_size=batch_size,
+    )
+    products.update(conversion_rate=CONVERSION_RATE)
+
+
+def find_daily_stats_mismatches(owner=None, start_day=None, end_day=None):
+    """مقایسه آمار روزانه ذخیره‌شده با رویدادهای خام؛ لیست اختلاف‌ها را برمی‌گرداند."""
+    expected = {
+        (row['product_id'], row['day']): row
+        for row in _raw_daily_stats(owner, start_day, end_day).iterator()
+    }
+    actual = {
+        (row['product_id'], row['day']): row
+        for row in _stored_daily_stats(owner, start_day, end_day).values('product_id', 'day', *STATS_FIELDS).iterator()
+    }
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        for field in STATS_FIELDS:
+            expected_value = expected[key][field] if key in expected else 0
+            actual_value = actual[key][field] if key in actual else 0
+            if expected_value != actual_value:
+                mismatches.append({
+                    'product_id': key[0], 'day': key[1], 'field': field,
+                    'expected': expected_value, 'actual': actual_value,
+                })
+    return mismatches
+
+
+def _month(value):
+    day = timezone.localdate(value)
+    return day.replace(day=1)
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def record_cohort_activity(owner, product_events):
+    """به‌روزرسانی افزایشی جدول فعالیت کوهورت برای رویدادهای تازه ثبت‌شده.
+
+    هر مشتری فقط با اولین رویدادش در هر ماه شمرده می‌شود. در حالت عادی ماه رویداد با
+    last_active_month مشتری مقایسه می‌شود؛ فقط رویدادهای دیررس (ماه قدیمی‌تر) به جدول رویدادها مراجعه می‌کنند.
+    """
+    if not product_events:
+        return
+
+    batch_months = defaultdict(set)
+    for event in product_events:
+        batch_months[event.customer_id].add(_month(event.created_at))
+
+    # قفل ردیف مشتریان تا دو دسته همزمان یک ماه را دو بار حساب نکنند
+    customers = list(Customer.objects.select_for_update().filter(id__in=batch_months).values_list(
+        'id', 'first_seen', 'last_active_month'
+    ))
+    if len(customers) < len(batch_months):
+        # مشتری در همین تراکنش حذف شده؛ مانند بررسی کلید خارجی هنگام commit شکست می‌خورد
+        missing = set(batch_months) - {customer_id for customer_id, _, _ in customers}
+        raise IntegrityError(f"Customers {sorted(missing)} referenced by events do not exist")
+    new_activity, late_activity, advanced = [], [], []
+    cohort_months = {}
+    for customer_id, first_seen, last_active_month in customers:
+        cohort_months[customer_id] = _month(first_seen)
+        for month in batch_months[customer_id]:
+            if last_active_month is None or month > last_active_month:
+                new_activity.append((customer_id, month))
+            elif month < last_active_month:
+                late_activity.append((customer_id, month))
+        latest = max(batch_months[customer_id])
+        if last_active_month is None or latest > last_active_month:
+            advanced.append(Customer(id=customer_id, last_active_month=latest))
+
+    if late_activity:
+        months = [month for _, month in late_activity]
+        start, end = _day_bounds(min(months), _next_month(max(months)) - timedelta(days=1))
+        seen = set(ProductEvent.objects.filter(
+            customer_id__in={customer_id for customer_id, _ in late_activity},
+            created_at__gte=start, created_at__lt=end,
+            id__lt=min(event.id for event in product_events),
+        ).annotate(
+            month=TruncMonth('created_at', output_field=DateField())
+        ).values_list('customer_id', 'month').distinct())
+        new_activity.extend(pair for pair in late_activity if pair not in seen)
+
+    Customer.objects.bulk_update(advanced, ['last_active_month'])
+    if not new_activity:
+        return
+
+    deltas = defaultdict(int)
+    for customer_id, month in new_activity:
+        deltas[(cohort_months[customer_id], month)] += 1
+    CohortActivity.objects.bulk_create(
+        [CohortActivity(owner=owner, cohort_month=cohort, activity_month=month) for cohort, month in deltas],
+        ignore_conflicts=True,
+    )
+    for (cohort, month), count in deltas.items():
+        CohortActivity.objects.filter(owner=owner, cohort_month=cohort, activity_month=month).update(
+            customers=F('customers') + count
+        )
+
+
+def _raw_cohort_activity(owner=None):
+    """محاسبه فعالیت کوهورت مستقیماً از جدول رویدادها."""
+    events = ProductEvent.objects.filter(customer__isnull=False)
+    if owner is not None:
+        events = events.filter(customer__owner=owner)
+    return events.annotate(
+        cohort_month=TruncMonth('customer__first_seen', output_field=DateField()),
+        activity_month=TruncMonth('created_at', output_field=DateField()),
+    ).values('customer__owner_id', 'cohort_month', 'activity_month').annotate(
+        customers=Count('customer', distinct=True)
+    ).order_by()
+
+
+@transaction.atomic
+def rebuild_cohort_activity(owner=None):
+    """بازسازی کامل جدول فعالیت کوهورت و last_active_month مشتریان؛ تعداد ردیف‌ها را برمی‌گرداند."""
+    stored = CohortActivity.objects.all()
+    customers = Customer.objects.all()
+    if owner is not None:
+        stored = stored.filter(owner=owner)
+        customers = customers.filter(owner=owner)
+    stored.delete()
+
+    latest_month = ProductEvent.objects.filter(customer=OuterRef('pk')).annotate(
+        month=TruncMonth('created_at', output_field=DateField())
+    ).order_by('-month').values('month')[:1]
+    customers.update(last_active_month=Subquery(latest_month))
+
+    rows = CohortActivity.objects.bulk_create([
+        CohortActivity(
+            owner_id=row['customer__owner_id'], cohort_month=row['cohort_month'],
+            activity_month=row['activity_month'], customers=row['customers'],
+        )
+        for row in _raw_cohort_activity(owner).iterator()
+    ], batch_size=5000)
+    return len(rows)
+
+
+def find_cohort_activity_mismatches(owner=None):
+    """مقایسه جدول فعالیت کوهورت با محاسبه کامل از رویدادها؛ لیست اختلاف‌ها را برمی‌گرداند."""
+    expected = {
+        (row['customer__owner_id'], row['cohort_month'], row['activity_month']): row['customers']
+        for row in _raw_cohort_activity(owner).iterator()
+    }
+    stored = CohortActivity.objects.all()
+    if owner is not None:
+        stored = stored.filter(owner=owner)
+    actual = {
+        (owner_id, cohort, month): count
+        for owner_id, cohort, month, count in stored.values_list(
+            'owner_id', 'cohort_month', 'activity_month', 'customers'
+        ).iterator()
+    }
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        if expected.get(key, 0) != actual.get(key, 0):
+            mismatches.append({
+                'owner_id': key[0], 'cohort_month': key[1], 'activity_month': key[2],
+                'expected': expected.get(key, 0), 'actual': actual.get(key, 0),
+            })
+    return mismatches
+
+
+def record_customer_summaries(product_events):
+    """به‌روزرسانی افزایشی خلاصه مشتریان برای رویدادهای تازه ثبت‌شده.
+
+    باید بعد از record_cohort_activity در همان تراکنش اجرا شود؛ قفل ردیف مشتریان که آنجا گرفته شده
+    از به‌روزرسانی همزمان یک خلاصه جلوگیری می‌کند.
+    """
+    if not product_events:
+        return
+
+    products = {
+        product_id: (price or 0, category)
+        for product_id, price, category in Product.objects.filter(
+            id__in={event.product_id for event in product_events}
+        ).values_list('id', 'price', 'category')
+    }
+    customer_ids = {event.customer_id for event in product_events}
+    summaries = CustomerSummary.objects.in_bulk(customer_ids)
+    existing_ids = set(summaries)
+    for customer_id in customer_ids - existing_ids:
+        summaries[customer_id] = CustomerSummary(customer_id=customer_id, category_counts={})
+
+    missing = {event.product_id for event in product_events} - set(products)
+    if missing:
+        # محصول در همین تراکنش حذف شده؛ مانند بررسی کلید خارجی هنگام commit شکست می‌خورد
+        raise IntegrityError(f"Products {sorted(missing)} referenced by events do not exist")
+
+    for event in product_events:
+        summary = summaries[event.customer_id]
+        price, category = products[event.product_id]
+        summary.event_count += 1
+        if event.event_type == 'PURCHASE':
+            summary.purchase_count += 1
+            summary.total_spent += price
+        summary.category_counts[category] = summary.category_counts.get(category, 0) + 1
+        if summary.last_event_at is None or event.created_at > summary.last_event_at:
+            summary.last_event_at = event.created_at
+
+    CustomerSummary.objects.bulk_create([summaries[i] for i in customer_ids - existing_ids])
+    CustomerSummary.objects.bulk_update(
+        [summaries[i] for i in existing_ids],
+        ['total_spent', 'purchase_count', 'event_count', 'last_event_at', 'category_counts'],
+    )
+
+
+@transaction.atomic
+def rebuild_customer_summaries(owner=None, batch_size=5000):
+    """بازسازی کامل خلاصه مشتریان از رویدادهای خام؛ تعداد خلاصه‌های ساخته‌شده را برمی‌گرداند."""
+    events = ProductEvent.objects.filter(customer__isnull=False, product__isnull=False)
+    summaries = CustomerSummary.objects.all()
+    if owner is not None:
+        events = events.filter(customer__owner=owner)
+        summaries = summaries.filter(customer__owner=owner)
+    summaries.delete()
+
+    category_counts = defaultdict(dict)
+    for customer_id, category, count in events.values('customer_id', 'product__category').annotate(
+        count=Count('id')
+    ).order_by().values_list('customer_id', 'product__category', 'count').iterator():
+        category_counts[customer_id][category] = count
+
+    purchase = Q(event_type='PURCHASE')
+    rows = events.values('customer_id').annotate(
+        total_spent=Sum('product__price', filter=purchase),
+        purchase_count=Count('id', filter=purchase),
+        event_count=Count('id'),
+        last_event_at=Max('created_at'),
+    ).order_by()
+    created = CustomerSummary.objects.bulk_create([
+        CustomerSummary(
+            customer_id=row['customer_id'], total_spent=row['total_spent'] or 0,
+            purchase_count=row['purchase_count'], event_count=row['event_count'],
+            last_event_at=row['last_event_at'], category_counts=category_counts[row['customer_id']],
+        )
+        for row in rows.iterator()
+    ], batch_size=batch_size)
+    return len(created)
+
+
+def record_ab_test_stats(ab_test_events):
+    """افزایش شمارنده‌های نمایش و تبدیل نسخه‌های تست A/B برای رویدادهای تازه ثبت‌شده."""
+    deltas = defaultdict(lambda: dict.fromkeys(AB_TEST_COUNTER_FIELDS.values(), 0))
+    for event in ab_test_events:
+        deltas[(event.test_id, event.variant_shown)][AB_TEST_COUNTER_FIELDS[event.event_type]] += 1
+    if not deltas:
+        return
+
+    ABTestVariantStats.objects.bulk_create(
+        [ABTestVariantStats(test_id=test_id, variant=variant) for test_id, variant in deltas],
+        ignore_conflicts=True,
+    )
+    for (test_id, variant), delta in deltas.items():
+        ABTestVariantStats.objects.filter(test_id=test_id, variant=variant).update(
+            **{field: F(field) + value for field, value in delta.items() if value}
+        )
+
+
+@transaction.atomic
+def rebuild_ab_test_stats(owner=None):
+    """بازسازی کامل آمار نسخه‌های تست A/B از رویدادهای تست؛ تعداد ردیف‌ها را برمی‌گرداند."""
+    events = ABTestEvent.objects.all()
+    stored = ABTestVariantStats.objects.all()
+    if owner is not None:
+        events = events.filter(test__product__owner=owner)
+        stored = stored.filter(test__product__owner=owner)
+    stored.delete()
+
+    rows = events.values('test_id', 'variant_shown').annotate(
+        views=Count('id', filter=Q(event_type='VIEW')),
+        conversions=Count('id', filter=Q(event_type='CONVERSION')),
+    ).order_by()
+    created = ABTestVariantStats.objects.bulk_create([
+        ABTestVariantStats(test_id=row['test_id'], variant=row['variant_shown'],
+                           views=row['views'], conversions=row['conversions'])
+        for row in rows.iterator()
+    ], batch_size=5000)
+    return len(created)
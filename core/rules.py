@@ -0,0 +1,168 @@
+# core/rules.py
+
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Product, DailyProductStats, Recommendation
+
+logger = logging.getLogger(__name__)
+
+Reason = Recommendation.ReasonType
+
+# آستانه‌های قوانین پیشنهاد؛ «میانگین» یعنی میانگین همه محصولات فروشگاه در همان بازه
+RULE_THRESHOLDS = {
+    'low_view_ratio': 0.2,           # بازدید کمتر از ۲۰٪ میانگین
+    'high_view_min_views': 50,
+    'high_view_max_cart_rate': 0.02,  # کمتر از ۲٪ بازدیدها به سبد خرید می‌رسند
+    'popular_ratio': 3.0,            # خرید بیش از ۳ برابر میانگین
+    'popular_min_purchases': 5,
+    'low_stock_days': 7,             # موجودی کمتر از فروش ۷ روز آینده
+    'high_discount_percent': 30,
+}
+
+RULE_REASONS = [Reason.LOW_VIEW, Reason.HIGH_VIEW_LOW_ADD, Reason.POPULAR_ITEM, Reason.LOW_STOCK, Reason.HIGH_DISCOUNT]
+
+
+def _clamp(value):
+    return max(0.0, min(1.0, value))
+
+
+def evaluate_rules(product, stats, baseline, days):
+    """بررسی همه قوانین برای یک محصول؛ خروجی لیست (دلیل، متن، امتیاز اطمینان) است."""
+    t = RULE_THRESHOLDS
+    name = product['name']
+    views, carts, purchases = stats['views'], stats['carts'], stats['purchases']
+    avg_views, avg_purchases = baseline['avg_views'], baseline['avg_purchases']
+    results = []
+
+    low_view_limit = avg_views * t['low_view_ratio']
+    if views < low_view_limit:
+        results.append((
+            Reason.LOW_VIEW,
+            f'محصول «{name}» در {days} روز گذشته فقط {views} بازدید داشته است. '
+            f'آن را در صفحه اصلی یا شبکه‌های اجتماعی معرفی کنید.',
+            _clamp(1 - views / low_view_limit),
+        ))
+
+    if views >= max(avg_views, t['high_view_min_views']):
+        cart_rate = carts / views
+        if cart_rate < t['high_view_max_cart_rate']:
+            results.append((
+                Reason.HIGH_VIEW_LOW_ADD,
+                f'محصول «{name}» {views} بازدید داشته اما فقط {carts} بار به سبد خرید اضافه شده است. '
+                f'قیمت‌گذاری یا تصاویر محصول را بررسی کنید.',
+                _clamp((1 - cart_rate / t['high_view_max_cart_rate']) * min(1.0, views / (2 * avg_views))),
+            ))
+
+    if purchases >= max(avg_purchases * t['popular_ratio'], t['popular_min_purchases']):
+        results.append((
+            Reason.POPULAR_ITEM,
+            f'محصول «{name}» با {purchases} خرید از پرفروش‌ترین محصولات شماست. '
+            f'آن را در پیشنهادهای صفحه اصلی قرار دهید.',
+            _clamp(purchases / (2 * avg_purchases * t['popular_ratio'])),
+        ))
+
+    stock = product['stock']
+    if stock is not None and purchases > 0:
+        days_of_cover = stock / (purchases / days)
+        if days_of_cover < t['low_stock_days']:
+            results.append((
+                Reason.LOW_STOCK,
+                f'موجودی «{name}» ({stock} عدد) با روند فروش فعلی کمتر از {t["low_stock_days"]} روز دیگر تمام می‌شود. '
+                f'برای جلوگیری از توقف فروش، سریعاً آن را شارژ کنید.',
+                _clamp(1 - days_of_cover / t['low_stock_days']),
+            ))
+
+    discount = float(product['discount'] or 0)
+    if discount >= t['high_discount_percent']:
+        results.append((
+            Reason.HIGH_DISCOUNT,
+            f'محصول «{name}» {discount:g}٪ تخفیف دارد. '
+            f'این تخفیف را در کمپین‌های تبلیغاتی اطلاع‌رسانی کنید.',
+            _clamp(discount / 100 + (0.5 if purchases < avg_purchases else 0)),
+        ))
+
+    return results
+
+
+def _owner_baseline(owner, since):
+    """میانگین بازدید و خرید هر محصول فروشگاه در بازه (یک کوئری تجمیعی)."""
+    totals = DailyProductStats.objects.filter(owner=owner, day__gte=since).aggregate(
+        views=Sum('views'), purchases=Sum('purchases')
+    )
+    product_count = Product.objects.filter(owner=owner).count() or 1
+    return {
+        'avg_views': (totals['views'] or 0) / product_count,
+        'avg_purchases': (totals['purchases'] or 0) / product_count,
+    }
+
+
+@transaction.atomic
+def _apply_chunk(owner, products, stats_by_product, baseline, days):
+    product_ids = [p['id'] for p in products]
+    active = {}
+    duplicates = []
+    for rec_id, product_id, reason in Recommendation.objects.filter(
+        owner=owner, product_id__in=product_ids, customer__isnull=True, is_active=True, reason__in=RULE_REASONS
+    ).order_by('id').values_list('id', 'product_id', 'reason'):
+        if (product_id, reason) in active:
+            duplicates.append(rec_id)
+        else:
+            active[(product_id, reason)] = rec_id
+
+    empty = {'views': 0, 'carts': 0, 'purchases': 0}
+    to_create, to_update = [], []
+    for product in products:
+        for reason, text, score in evaluate_rules(product, stats_by_product.get(product['id'], empty), baseline, days):
+            rec_id = active.pop((product['id'], reason), None)
+            if rec_id is None:
+                to_create.append(Recommendation(owner=owner, product_id=product['id'], reason=reason,
+                                                text=text, confidence_score=score))
+            else:
+                to_update.append(Recommendation(id=rec_id, text=text, confidence_score=score))
+
+    Recommendation.objects.bulk_create(to_create)
+    Recommendation.objects.bulk_update(to_update, ['text', 'confidence_score'])
+    # پیشنهادهای فعالی که قانونشان دیگر برقرار نیست (و نسخه‌های تکراری) غیرفعال می‌شوند
+    stale_ids = list(active.values()) + duplicates
+    deactivated = Recommendation.objects.filter(id__in=stale_ids).update(is_active=False) if stale_ids else 0
+    return len(to_create), len(to_update), deactivated
+
+
+def generate_recommendations(owner, days=30, chunk_size=2000):
+    """اجرای همه قوانین پیشنهاد برای محصولات یک فروشگاه.
+
+    محصولات در دسته‌های chunk_size خوانده می‌شوند و برای هر دسته فقط یک کوئری آمار تجمیعی
+    اجرا می‌شود، پس حافظه مصرفی به تعداد کل محصولات بستگی ندارد.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    baseline = _owner_baseline(owner, since)
+    counts = {'created': 0, 'updated': 0, 'deactivated': 0}
+
+    last_id = 0
+    while True:
+        products = list(
+            Product.objects.filter(owner=owner, id__gt=last_id).order_by('id')
+            .values('id', 'name', 'stock', 'discount')[:chunk_size]
+        )
+        if not products:
+            break
+        last_id = products[-1]['id']
+
+        stats_by_product = {
+            row['product_id']: row
+            for row in DailyProductStats.objects.filter(
+                product_id__in=[p['id'] for p in products], day__gte=since
+            ).values('product_id').annotate(views=Sum('views'), carts=Sum('carts'), purchases=Sum('purchases'))
+        }
+        created, updated, deactivated = _apply_chunk(owner, products, stats_by_product, baseline, days)
+        counts['created'] += created
+        counts['updated'] += updated
+        counts['deactivated'] += deactivated
+
+    logger.info(f"Generated rule recommendations for owner {owner.pk}: {counts}")
+    return counts
@@ -0,0 +1,113 @@
+# core/segments.py
+
+import logging
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Customer, ProductEvent
+
+logger = logging.getLogger(__name__)
+
+Segment = Customer.Segment
+
+RFM_WINDOW_DAYS = 365
+# مشتری بدون خرید با بیش از این تعداد بازدید «خریدار پنجره‌ای» است
+WINDOW_SHOPPER_MIN_VIEWS = 10
+
+
+def get_rfm_features(owner, days=RFM_WINDOW_DAYS):
+    """ویژگی‌های هر مشتری (آخرین خرید، تعداد خرید، مبلغ خرید، تعداد بازدید) در یک کوئری تجمیعی."""
+    purchase = Q(event_type='PURCHASE')
+    rows = ProductEvent.objects.filter(
+        customer__owner=owner, created_at__gte=timezone.now() - timedelta(days=days)
+    ).values('customer_id').annotate(
+        last_purchase=Max('created_at', filter=purchase),
+        frequency=Count('id', filter=purchase),
+        monetary=Sum('product__price', filter=purchase),
+        views=Count('id', filter=Q(event_type='VIEW')),
+    ).order_by()
+    return list(rows.values_list('customer_id', 'last_purchase', 'frequency', 'monetary', 'views'))
+
+
+def quantile_scores(values, higher_is_better=True):
+    """امتیاز ۱ تا ۵ بر اساس پنجک‌های مقادیر."""
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    edges = np.quantile(values, [0.2, 0.4, 0.6, 0.8])
+    scores = 1 + np.searchsorted(edges, values, side='left')
+    return scores if higher_is_better else 6 - scores
+
+
+def assign_segments(recency_scores, frequency_scores, monetary_scores):
+    """تعیین بخش هر مشتری خریدار از روی امتیازهای RFM."""
+    r = recency_scores
+    fm = (frequency_scores + monetary_scores) / 2
+    return np.select(
+        [
+            (r >= 4) & (fm >= 4),
+            (r >= 3) & (fm >= 3),
+            (r >= 4) & (frequency_scores <= 2),
+            (r <= 2) & (fm >= 3),
+            r <= 2,
+        ],
+        [Segment.CHAMPIONS.value, Segment.LOYAL.value, Segment.NEW.value, Segment.AT_RISK.value,
+         Segment.HIBERNATING.value],
+        default=Segment.POTENTIAL.value,
+    )
+
+
+@transaction.atomic
+def refresh_customer_segments(owner, days=RFM_WINDOW_DAYS, batch_size=2000):
+    """محاسبه امتیاز RFM و بخش همه مشتریان یک فروشگاه و ذخیره آن روی مشتری.
+
+    همه ویژگی‌ها با یک کوئری خوانده و امتیازها با NumPy محاسبه می‌شوند؛ تعداد مشتریان به‌روزشده برگردانده می‌شود.
+    """
+    now = timezone.now()
+    rows = get_rfm_features(owner, days)
+
+    # مشتریانی که در بازه رویدادی ندارند بخشی ندارند
+    Customer.objects.filter(owner=owner).exclude(segment='').update(
+        recency_days=None, frequency=0, monetary=0, rfm_score='', segment='', segment_updated_at=now
+    )
+    if not rows:
+        return 0
+
+    customer_ids, last_purchases, frequency, amounts, views = zip(*rows)
+    customer_ids = np.asarray(customer_ids)
+    frequency = np.asarray(frequency, dtype=np.int64)
+    monetary = np.asarray([float(m or 0) for m in amounts])
+    views = np.asarray(views, dtype=np.int64)
+    recency = np.asarray([(now - p).days if p else -1 for p in last_purchases], dtype=np.int64)
+
+    buyers = frequency > 0
+    scores = np.zeros((len(customer_ids), 3), dtype=np.int64)
+    scores[buyers, 0] = quantile_scores(recency[buyers], higher_is_better=False)
+    scores[buyers, 1] = quantile_scores(frequency[buyers])
+    scores[buyers, 2] = quantile_scores(monetary[buyers])
+
+    segments = np.full(len(customer_ids), '', dtype=object)
+    segments[buyers] = assign_segments(scores[buyers, 0], scores[buyers, 1], scores[buyers, 2])
+    segments[~buyers & (views > WINDOW_SHOPPER_MIN_VIEWS)] = Segment.WINDOW_SHOPPER.value
+
+    customers = [
+        Customer(
+            id=int(customer_ids[i]),
+            recency_days=int(recency[i]) if buyers[i] else None,
+            frequency=int(frequency[i]),
+            monetary=amounts[i] or 0,
+            rfm_score=''.join(map(str, scores[i])) if buyers[i] else '',
+            segment=segments[i],
+            segment_updated_at=now,
+        )
+        for i in range(len(customer_ids))
+    ]
+    Customer.objects.bulk_update(
+        customers, ['recency_days', 'frequency', 'monetary', 'rfm_score', 'segment', 'segment_updated_at'],
+        batch_size=batch_size,
+    )
+    logger.info(f"Segmented {len(customers)} customers of owner {owner.pk}")
+    return len(customers)
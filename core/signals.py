@@ -1,9 +1,38 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import ApiKey
+from .models import ApiKey, UserSite, Product, ABTest, Customer
+from .caching import invalidate_site_cache
+from .abtesting import invalidate_active_tests
+from .ingest import forget_product, forget_customer
 
 @receiver(post_save, sender=User)
 def create_api_key_for_new_user(sender, instance, created, **kwargs):
     if created:
-        ApiKey.objects.create(user=instance)
\ No newline at end of file
+        ApiKey.objects.create(user=instance)
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+@receiver(post_save, sender=UserSite)
+@receiver(post_delete, sender=UserSite)
+def invalidate_api_key_cache(sender, **kwargs):
+    invalidate_site_cache()
+
+
+@receiver(post_save, sender=ABTest)
+@receiver(post_delete, sender=ABTest)
+def invalidate_ab_test_index(sender, instance, **kwargs):
+    owner_id = Product.objects.filter(pk=instance.product_id).values_list('owner_id', flat=True).first()
+    invalidate_active_tests(owner_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    forget_product(instance.owner_id, instance.product_id_from_site)
+
+
+@receiver(post_delete, sender=Customer)
+def invalidate_customer_cache(sender, instance, **kwargs):
+    forget_customer(instance.owner_id, instance.identifier)
@@ -0,0 +1,288 @@
+# core/spool.py
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DataError, IntegrityError, transaction
+from django.utils.dateparse import parse_datetime
+
+from .ingest import forget_cached_ids, ingest_events
+from .models import SpoolCheckpoint
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.open'
+SEALED_SUFFIX = '.seg'
+DEAD_LETTER_DIR = 'dead-letter'
+LOCK_FILE = '.drain.lock'
+# خطاهایی که از خود رکورد ناشی می‌شوند؛ خطای اتصال به پایگاه داده رکورد را به dead-letter نمی‌فرستد
+RECORD_ERRORS = (DataError, IntegrityError, ValidationError, ArithmeticError, KeyError, TypeError, ValueError)
+
+
+class SpoolFull(Exception):
+    """حجم صف رویدادها از سقف مجاز بیشتر شده است."""
+
+
+class EventSpool:
+    """صف محلی رویدادها به صورت فایل‌های قطعه‌ای فقط-افزودنی (append-only)."""
+
+    def __init__(self, directory, segment_max_bytes, segment_max_age, max_bytes, fsync=True):
+        self.directory = Path(directory)
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._path = None
+        self._segment_bytes = 0
+        self._segment_opened_at = 0
+        self._size = 0
+        self._size_checked_at = 0
+
+    def size(self):
+        """حجم کل قطعه‌های صف (با کش یک‌ثانیه‌ای)."""
+        now = time.monotonic()
+        if now - self._size_checked_at > 1:
+            self._size = sum(
+                p.stat().st_size for p in self.directory.iterdir()
+                if p.suffix in (OPEN_SUFFIX, SEALED_SUFFIX)
+            ) if self.directory.exists() else 0
+            self._size_checked_at = now
+        return self._size
+
+    def _seal(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        try:
+            os.rename(self._path, self._path.with_suffix(SEALED_SUFFIX))
+        except FileNotFoundError:
+            # قطعه رهاشده را تخلیه‌کننده پیش از این بسته است
+            pass
+        self._fd = None
+        self._path = None
+
+    def _current_segment(self, incoming):
+        if self._pid != os.getpid():
+            # پس از fork، فایل باز والد متعلق به این فرایند نیست
+            self._pid = os.getpid()
+            self._fd = None
+        if self._fd is not None and (
+                self._segment_bytes + incoming > self.segment_max_bytes
+                or time.monotonic() - self._segment_opened_at > self.segment_max_age):
+            self._seal()
+        if self._fd is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            name = f"{time.time_ns():020d}-{self._pid}-{uuid.uuid4().hex[:8]}{OPEN_SUFFIX}"
+            self._path = self.directory / name
+            self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self._segment_bytes = 0
+            self._segment_opened_at = time.monotonic()
+        return self._fd
+
+    def append(self, owner_id, events):
+        """افزودن رویدادهای اعتبارسنجی‌شده به صف؛ در صورت پر بودن صف SpoolFull می‌دهد."""
+        data = ''.join(
+            json.dumps({'owner_id': owner_id, 'event': event}, cls=DjangoJSONEncoder) + '\n'
+            for event in events
+        ).encode('utf-8')
+        with self._lock:
+            if self.size() + len(data) > self.max_bytes:
+                raise SpoolFull()
+            fd = self._current_segment(len(data))
+            os.write(fd, data)
+            if self.fsync:
+                os.fsync(fd)
+            self._segment_bytes += len(data)
+            self._size += len(data)
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._seal()
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """نمونه مشترک صف رویدادها بر اساس تنظیمات پروژه."""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = EventSpool(
+                directory=settings.EVENT_SPOOL_DIR,
+                segment_max_bytes=settings.EVENT_SPOOL_SEGMENT_MAX_BYTES,
+                segment_max_age=settings.EVENT_SPOOL_FLUSH_INTERVAL,
+                max_bytes=settings.EVENT_SPOOL_MAX_BYTES,
+                fsync=settings.EVENT_SPOOL_FSYNC,
+            )
+        return _spool
+
+
+def _restore_event(event):
+    return {
+        **event,
+        'created_at': parse_datetime(event['created_at']),
+        'product_price': Decimal(event['product_price']),
+    }
+
+
+def _segment_is_sealed(path):
+    """قطعه بسته‌شده، یا قطعه بازی که مدتی طولانی‌تر از عمر مجاز قطعه تغییر نکرده است.
+
+    نویسنده پس از segment_max_age در قطعه نمی‌نویسد و آن را می‌بندد؛ پس قطعه باز قدیمی‌تر از
+    EVENT_SPOOL_ABANDONED_AFTER رها شده است و با تغییر نام بسته می‌شود.
+    """
+    if path.suffix == SEALED_SUFFIX:
+        return True
+    try:
+        idle = time.time() - path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    return idle > settings.EVENT_SPOOL_ABANDONED_AFTER
+
+
+def _dead_letter(directory, segment, line, error):
+    """نگه‌داری رکوردی که ذخیره نمی‌شود در پوشه dead-letter برای بررسی دستی."""
+    dead_letter_dir = directory / DEAD_LETTER_DIR
+    dead_letter_dir.mkdir(parents=True, exist_ok=True)
+    entry = json.dumps({'error': error, 'record': line.decode('utf-8', errors='replace').rstrip('\n')})
+    with open(dead_letter_dir / f'{segment}.jsonl', 'a', encoding='utf-8') as f:
+        f.write(entry + '\n')
+    logger.error(f"Moved a spooled record of segment {segment} to dead-letter: {error}")
+
+
+def _flush(segment, records, offset):
+    """ذخیره یک دسته از رکوردها و جابجایی نقطه بازیابی در همان تراکنش."""
+    owners = User.objects.in_bulk({record['owner_id'] for record in records})
+    events_by_owner = {}
+    for record in records:
+        events_by_owner.setdefault(record['owner_id'], []).append(_restore_event(record['event']))
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                for owner_id, events in events_by_owner.items():
+                    owner = owners.get(owner_id)
+                    if owner is None:
+                        logger.warning(f"Dropping {len(events)} spooled events for missing owner {owner_id}.")
+                        continue
+                    ingest_events(owner, events)
+                SpoolCheckpoint.objects.update_or_create(segment=segment, defaults={'offset': offset})
+            return
+        except IntegrityError:
+            # کلیدهای خارجی هنگام commit بررسی می‌شوند؛ شاید شناسه کش‌شده‌ای در پردازه دیگری حذف شده باشد
+            if attempt:
+                raise
+            for owner_id, events in events_by_owner.items():
+                if owner_id in owners:
+                    forget_cached_ids(owners[owner_id], events)
+
+
+def _flush_isolating(directory, segment, batch):
+    """ذخیره دسته (لیست (پایان رکورد، خط خام، رکورد))؛ اگر خطا داد با نصف کردن دسته رکورد خراب جدا می‌شود.
+
+    رکورد خراب به dead-letter می‌رود و نقطه بازیابی از آن عبور می‌کند تا قطعه گیر نکند.
+    """
+    try:
+        _flush(segment, [record for _, _, record in batch], batch[-1][0])
+        return len(batch)
+    except RECORD_ERRORS as e:
+        if len(batch) == 1:
+            end, line, _ = batch[0]
+            _dead_letter(directory, segment, line, repr(e))
+            SpoolCheckpoint.objects.update_or_create(segment=segment, defaults={'offset': end})
+            return 0
+    middle = len(batch) // 2
+    return _flush_isolating(directory, segment, batch[:middle]) + _flush_isolating(directory, segment, batch[middle:])
+
+
+def drain_segment(path, flush_size):
+    """خواندن رکوردهای کامل یک قطعه از آخرین نقطه بازیابی؛ تعداد رکوردهای ذخیره‌شده را برمی‌گرداند."""
+    # نقطه بازیابی با نام بدون پسوند ذخیره می‌شود تا پس از بسته شدن قطعه معتبر بماند
+    segment = path.stem
+    if path.suffix == OPEN_SUFFIX and _segment_is_sealed(path):
+        sealed_path = path.with_suffix(SEALED_SUFFIX)
+        try:
+            os.rename(path, sealed_path)
+        except FileNotFoundError:
+            return 0
+        path = sealed_path
+    sealed = path.suffix == SEALED_SUFFIX
+    checkpoint = SpoolCheckpoint.objects.filter(segment=segment).first()
+    offset = checkpoint.offset if checkpoint else 0
+    processed = 0
+
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        # قطعه همین حالا بسته شده و در دور بعد با نام جدید خوانده می‌شود
+        return 0
+
+    with f:
+        f.seek(offset)
+        batch = []
+        for line in f:
+            if not line.endswith(b'\n'):
+                # رکورد ناقص: یا هنوز در حال نوشتن است یا نویسنده هنگام نوشتن از کار افتاده
+                if sealed:
+                    logger.warning(f"Skipping torn record at end of spool segment {segment}.")
+                break
+            offset += len(line)
+            try:
+                batch.append((offset, line, json.loads(line)))
+            except json.JSONDecodeError:
+                # رکوردهای قبلی اول ذخیره می‌شوند تا نقطه بازیابی بتواند از خط خراب عبور کند،
+                # حتی اگر پس از آن (در انتهای قطعه باز) رکورد دیگری نباشد
+                if batch:
+                    processed += _flush_isolating(path.parent, segment, batch)
+                    batch = []
+                _dead_letter(path.parent, segment, line, 'corrupt JSON')
+                SpoolCheckpoint.objects.update_or_create(segment=segment, defaults={'offset': offset})
+                continue
+            if len(batch) >= flush_size:
+                processed += _flush_isolating(path.parent, segment, batch)
+                batch = []
+        if batch:
+            processed += _flush_isolating(path.parent, segment, batch)
+
+    if sealed:
+        path.unlink()
+        SpoolCheckpoint.objects.filter(segment=segment).delete()
+    return processed
+
+
+def drain_spool(directory, flush_size):
+    """تخلیه همه قطعه‌های صف به ترتیب ایجاد.
+
+    فقط یک تخلیه‌کننده در هر زمان روی پوشه کار می‌کند (قفل فایل)؛ اگر قفل گرفته شده باشد ۰ برمی‌گردد.
+    """
+    directory = Path(directory)
+    if not directory.exists():
+        return 0
+    with open(directory / LOCK_FILE, 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info(f"Another worker is draining spool {directory}.")
+            return 0
+        segments = sorted(
+            (p for p in directory.iterdir() if p.suffix in (OPEN_SUFFIX, SEALED_SUFFIX)),
+            key=lambda p: p.name,
+        )
+        return sum(drain_segment(path, flush_size) for path in segments)
@@ -1,3 +1,1050 @@
-from django.test import TestCase
+import base64
+import fcntl
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Product, Customer, CustomerSummary, CohortActivity, DailyProductStats, ProductEvent, SalesForecast, ABTest, ABTestEvent, ABTestVariantStats, UserSite, ApiKey, SpoolCheckpoint, AnalyticsJob, AnalyticsWatermark, ProductCooccurrence, Recommendation
+from . import cooccurrence, ingest, jobs
+from .abtesting import (
+    ARM_LABELS, UNDECIDED, ActiveTest, analyze_test, assign_variant, bucket, invalidate_active_tests,
+    two_proportion_z_test, wilson_interval,
+)
+from .analytics_cache import bump_watermark, cached_analysis
+from .basket import build_basket_matrix, mine_rules
+from .caching import TTLCache, get_site_for_api_key, invalidate_site_cache
+from .catalog import InvalidCursor, encode_cursor, get_product_page
+from .cohorts import compute_cohorts
+from .forecasting import (
+    FORECASTERS, NOT_ENOUGH_DATA_MESSAGE, HoltWintersForecaster, LinearTrendForecaster, SeasonalForecaster,
+    get_forecaster, get_stored_forecast, load_daily_sales, refresh_sales_forecasts,
+)
+from .ingest import LastSeenBuffer, ingest_events, parse_event
+from .jobs import get_job_state
+from .recommender import build_customer_recommendations, item_similarity, top_k_per_row
+from .rollups import refresh_product_totals
+from .rules import generate_recommendations
+from .segments import WINDOW_SHOPPER_MIN_VIEWS, quantile_scores, refresh_customer_segments
+from .services import WooCommerceService, sync_woocommerce_products
+from .spool import DEAD_LETTER_DIR, LOCK_FILE, OPEN_SUFFIX, EventSpool, drain_spool
+from .timeseries import MAX_HOURLY_DAYS
+from .utils import get_ab_test_results, get_dashboard_metrics
+
+
+class EventQueryIndexTests(TestCase):
+    """اطمینان از اینکه کوئری‌های اصلی داشبورد از ایندکس‌های ترکیبی استفاده می‌کنند."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='09120000000')
+        cls.product = Product.objects.create(owner=cls.user, product_id_from_site='p1', name='p1',
+                                             page_url='https://shop.test/p1')
+        customer = Customer.objects.create(owner=cls.user, identifier='c1')
+        ProductEvent.objects.bulk_create([
+            ProductEvent(product=cls.product, customer=customer, event_type=event_type)
+            for event_type in ('VIEW', 'ADD_TO_CART', 'PURCHASE')
+        ])
+        cls.test = ABTest.objects.create(product=cls.product, name='t', variable='PRICE',
+                                         control_value='1', variant_value='2')
+        ABTestEvent.objects.create(test=cls.test, customer=customer, variant_shown='CONTROL', event_type='VIEW')
+        cls.date_range = (timezone.now() - timedelta(days=6), timezone.now())
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, msg=plan)
+
+    def test_dashboard_event_counts_use_product_index(self):
+        events = ProductEvent.objects.filter(
+            product__owner=self.user, event_type='VIEW', created_at__range=self.date_range
+        )
+        self.assertUsesIndex(events, 'event_product_type_created_idx')
+
+    def test_product_sales_query_uses_product_index(self):
+        purchases = ProductEvent.objects.filter(
+            product_id=self.product.id, event_type='PURCHASE', created_at__range=self.date_range
+        ).values('created_at__date').annotate(c=Count('id'))
+        self.assertUsesIndex(purchases, 'event_product_type_created_idx')
+
+    def test_ab_test_counts_use_variant_index(self):
+        events = ABTestEvent.objects.filter(test=self.test, variant_shown='CONTROL', event_type='VIEW')
+        self.assertUsesIndex(events, 'abtest_event_variant_type_idx')
+
+    def test_cohort_query_uses_customer_index(self):
+        customers = Customer.objects.filter(owner=self.user, first_seen__gte=self.date_range[0])
+        self.assertUsesIndex(customers, 'customer_owner_first_seen_idx')
+
+
+class DashboardMetricsTests(TestCase):
+    """شاخص‌های داشبورد باید در یک کوئری محاسبه شوند."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='09120000000')
+        product = Product.objects.create(owner=cls.user, product_id_from_site='p1', name='p1',
+                                         page_url='https://shop.test/p1')
+        alice = Customer.objects.create(owner=cls.user, identifier='alice')
+        bob = Customer.objects.create(owner=cls.user, identifier='bob')
+        ProductEvent.objects.bulk_create([
+            ProductEvent(product=product, customer=alice, event_type='VIEW'),
+            ProductEvent(product=product, customer=alice, event_type='VIEW'),
+            ProductEvent(product=product, customer=bob, event_type='VIEW'),
+            ProductEvent(product=product, customer=alice, event_type='ADD_TO_CART'),
+            ProductEvent(product=product, customer=alice, event_type='PURCHASE'),
+        ])
+        other_owner = User.objects.create(username='09130000000')
+        other_product = Product.objects.create(owner=other_owner, product_id_from_site='p1', name='p1',
+                                               page_url='https://other.test/p1')
+        ProductEvent.objects.create(product=other_product, event_type='VIEW')
+
+    def test_metrics_use_single_query(self):
+        start, end = timezone.now() - timedelta(days=1), timezone.now()
+        with self.assertNumQueries(1):
+            metrics = get_dashboard_metrics(self.user, start, end)
+
+        self.assertEqual(
+            (metrics['total_views'], metrics['total_carts'], metrics['total_purchases']), (3, 1, 1)
+        )
+        funnel = metrics['funnel']
+        self.assertEqual((funnel['views'], funnel['carts'], funnel['purchases']), (2, 1, 1))
+        self.assertAlmostEqual(funnel['overall_conversion_rate'], 50.0)
+
+    def test_hourly_chart_range_is_capped(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/daily-events-chart/', {
+            'granularity': 'hour', 'start_date': '2024-01-01', 'end_date': '2024-03-01',
+        })
+        labels = response.json()['labels']
+        self.assertEqual(len(labels), MAX_HOURLY_DAYS * 24)
+        self.assertEqual(labels[0], '2024-02-24 00:00')
+        self.assertEqual(labels[-1], '2024-03-01 23:00')
+
+
+class EventBatchValidationTests(TestCase):
+    """یک رویداد نامعتبر نباید کل دسته را از بین ببرد."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.api_key = ApiKey.objects.get(user=self.user)
+        UserSite.objects.create(owner=self.user, site_url='https://shop.test', api_key=self.api_key)
+        product = Product.objects.create(owner=self.user, product_id_from_site='p1', name='p1',
+                                         page_url='https://shop.test/p1')
+        self.test = ABTest.objects.create(product=product, name='t', variable='PRICE',
+                                          control_value='10', variant_value='8')
+
+    def event(self, product_id='p1', **product):
+        return {'event_type': 'VIEW', 'customer_id': 'c1', 'product': {'id': product_id, **product}}
+
+    def test_invalid_records_are_rejected_individually(self):
+        batch = [
+            self.event(price=10),
+            self.event(price='NaN'),
+            self.event(price='Infinity'),
+            self.event(price='1e20'),
+            self.event(name='x' * 300),
+            self.event(product_id='p' * 300),
+            {**self.event(), 'customer_id': 'c' * 300},
+            {**self.event(), 'ab_test_id': self.test.id, 'ab_test_variant': 'VARIANT_7'},
+            {**self.event(), 'ab_test_id': self.test.id, 'ab_test_variant': 'VARIANT'},
+            self.event(product_id='p2', price='19.99'),
+        ]
+        response = self.client.post('/api/track-events/batch/', json.dumps(batch),
+                                    content_type='application/json', HTTP_X_API_KEY=self.api_key.key)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([item['index'] for item in data['rejected']], [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual([item['index'] for item in data['accepted']], [0, 8, 9])
+        self.assertEqual(ProductEvent.objects.filter(product__owner=self.user).count(), 3)
+        self.assertEqual(ABTestEvent.objects.filter(test=self.test, variant_shown='VARIANT').count(), 1)
+
+
+class ApiKeyCacheTests(TestCase):
+    """کلید API بدون کوئری تکراری به سایت تبدیل و پس از تغییر سایت باطل می‌شود."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.api_key = ApiKey.objects.get(user=self.user)
+        self.site = UserSite.objects.create(owner=self.user, site_url='https://shop.test', api_key=self.api_key)
+        invalidate_site_cache()
+        self.addCleanup(invalidate_site_cache)
+
+    def test_valid_key_is_served_from_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_site_for_api_key(self.api_key.key), self.site)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_site_for_api_key(self.api_key.key).owner, self.user)
+
+    def test_unknown_key_is_cached_negatively(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_site_for_api_key('sk_unknown'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_site_for_api_key('sk_unknown'))
+
+    def test_deactivated_site_invalidates_cache(self):
+        get_site_for_api_key(self.api_key.key)
+        self.site.is_active = False
+        self.site.save()
+        self.assertIsNone(get_site_for_api_key(self.api_key.key))
+
+    def test_ttl_cache_evicts_least_recently_used_and_expired(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        cache.set('d', 4, ttl=-1)
+        self.assertIsNone(cache.get('d'))
+
+
+class MarketBasketTests(TestCase):
+    """استخراج قوانین هم‌خرید روی ماتریس اسپارس سبدها."""
+
+    def setUp(self):
+        baskets = {'b1': [1, 2, 1], 'b2': [1, 2], 'b3': [1, 3], 'b4': [2], 'b5': [4]}
+        self.keys = [key for key, items in baskets.items() for _ in items]
+        self.items = [item for items in baskets.values() for item in items]
+
+    def test_matrix_counts_repeated_purchase_once(self):
+        matrix, items = build_basket_matrix(self.keys, self.items)
+        self.assertEqual(matrix.shape, (5, 4))
+        self.assertEqual(matrix[0, items.index(1)], True)
+        self.assertEqual(matrix.sum(), 8)
+
+    def test_rules_support_confidence_and_lift(self):
+        rules = mine_rules(*build_basket_matrix(self.keys, self.items), min_support=0.3)
+        self.assertEqual(
+            {(frozenset(r.antecedents), frozenset(r.consequents)) for r in rules.itertuples()},
+            {(frozenset({1}), frozenset({2})), (frozenset({2}), frozenset({1}))},
+        )
+        rule = rules.iloc[0]
+        self.assertAlmostEqual(rule['support'], 2 / 5)
+        self.assertAlmostEqual(rule['confidence'], 2 / 3)
+        self.assertAlmostEqual(rule['lift'], (2 / 3) / (3 / 5))
+
+    def test_no_rules_without_frequent_pairs(self):
+        self.assertTrue(mine_rules(*build_basket_matrix(self.keys, self.items), min_support=0.5).empty)
+        self.assertTrue(mine_rules(*build_basket_matrix([], [])).empty)
+
+
+class ItemRecommenderTests(TestCase):
+    """فیلترینگ همکارانه محصول‌محور روی ماتریس اسپارس تعامل."""
+
+    def test_top_k_per_row_keeps_largest_values(self):
+        matrix = sparse.csr_matrix(np.array([[0.1, 0.5, 0.3, 0], [0, 0, 0, 0], [0.2, 0, 0, 0.9]]))
+        self.assertEqual(top_k_per_row(matrix, 2).toarray().tolist(),
+                         [[0, 0.5, 0.3, 0], [0, 0, 0, 0], [0.2, 0, 0, 0.9]])
+
+    def test_blocked_similarity_matches_dense_cosine(self):
+        dense = np.array([[1, 2, 0, 0], [0, 1, 3, 0], [4, 0, 1, 1], [0, 0, 2, 5], [1, 1, 1, 0]], dtype=float)
+        similarity = item_similarity(sparse.csr_matrix(dense), neighbors=10, block_size=3).toarray()
+
+        normalized = dense / np.linalg.norm(dense, axis=0)
+        expected = normalized.T @ normalized
+        np.fill_diagonal(expected, 0)
+        np.testing.assert_allclose(similarity, expected, rtol=1e-6)
+
+    def test_recommends_unseen_products_of_similar_customers(self):
+        user = User.objects.create(username='09120000000')
+        UserSite.objects.create(owner=user, site_url='https://shop.test', api_key=ApiKey.objects.get(user=user))
+        purchases = {'alice': ('p1', 'p2'), 'bob': ('p1', 'p2', 'p3'), 'carol': ('p1',)}
+        ingest_events(user, [
+            parse_event({'event_type': 'PURCHASE', 'customer_id': customer, 'product': {'id': product_id}})
+            for customer, products in purchases.items() for product_id in products
+        ])
+
+        build_customer_recommendations(user, k=5)
+
+        recommended = Recommendation.objects.filter(customer__identifier='carol').order_by('-confidence_score')
+        self.assertEqual([r.product.product_id_from_site for r in recommended], ['p2', 'p3'])
+        self.assertEqual(
+            list(Recommendation.objects.filter(customer__identifier='alice').values_list(
+                'product__product_id_from_site', flat=True)),
+            ['p3'],
+        )
+        self.assertFalse(Recommendation.objects.filter(customer__identifier='bob').exists())
+
+        response = self.client.get('/api/customers/carol/recommendations/?k=1',
+                                   HTTP_X_API_KEY=ApiKey.objects.get(user=user).key)
+        self.assertEqual([r['product_id'] for r in response.json()['recommendations']], ['p2'])
+
+
+class SalesForecastStorageTests(TestCase):
+    """پیش‌بینی همه محصولات یک فروشگاه با یک کوئری خوانده و یک‌جا ذخیره می‌شود."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.steady, self.rare, self.gone = (
+            Product.objects.create(owner=self.user, product_id_from_site=site_id, name=site_id,
+                                   page_url=f'https://shop.test/{site_id}')
+            for site_id in ('steady', 'rare', 'gone')
+        )
+        yesterday = timezone.localdate() - timedelta(days=1)
+        DailyProductStats.objects.bulk_create(
+            [DailyProductStats(owner=self.user, product=self.steady, day=yesterday - timedelta(days=i), purchases=4)
+             for i in range(20)]
+            + [DailyProductStats(owner=self.user, product=self.rare, day=yesterday - timedelta(days=i), purchases=1)
+               for i in range(3)]
+        )
+
+    def test_load_daily_sales_fills_missing_days_with_zero(self):
+        product_ids, start_day, sales = load_daily_sales(self.user, days=30)
+        self.assertEqual(product_ids, sorted([self.steady.id, self.rare.id]))
+        self.assertEqual(start_day, timezone.localdate() - timedelta(days=30))
+        self.assertEqual(sales.shape, (2, 30))
+        self.assertEqual(sales[product_ids.index(self.steady.id)].tolist(), [0] * 10 + [4] * 20)
+
+    @override_settings(SALES_FORECAST_MODEL='linear')
+    def test_refresh_stores_forecasts_and_drops_products_without_sales(self):
+        SalesForecast.objects.create(owner=self.user, product=self.gone, predictions={}, model='linear',
+                                     fitted_at=timezone.now())
+        with self.assertNumQueries(3):
+            self.assertEqual(refresh_sales_forecasts(self.user, days=20, horizon=7), 2)
+
+        predictions, _ = get_stored_forecast(self.steady.id)
+        self.assertEqual(list(predictions.values()), [4] * 7)
+        self.assertEqual(min(predictions), timezone.localdate().strftime('%Y-%m-%d'))
+        self.assertEqual(get_stored_forecast(self.rare.id), (None, NOT_ENOUGH_DATA_MESSAGE))
+        self.assertFalse(SalesForecast.objects.filter(product=self.gone).exists())
+
+
+class ForecasterTests(TestCase):
+    """مدل‌های پیش‌بینی روی سری‌های مصنوعی با الگوی مشخص."""
+
+    monday = date(2024, 1, 1)
+    week = np.array([1, 1, 1, 1, 1, 5, 5], dtype=float)
+
+    def test_linear_extends_trend(self):
+        sales = np.vstack([2 + 0.5 * np.arange(28), np.full(28, 3.0)])
+        predicted = LinearTrendForecaster().fit_predict(sales, 5, self.monday)
+        np.testing.assert_allclose(predicted, [2 + 0.5 * np.arange(28, 33), np.full(5, 3.0)])
+
+    def test_seasonal_models_follow_weekday_pattern(self):
+        # شروع از سه‌شنبه: روز اول پیش‌بینی هم سه‌شنبه است
+        sales = np.tile(np.roll(self.week, -1), 8)[None, :]
+        expected = np.roll(self.week, -1)[None, :]
+        for forecaster in (SeasonalForecaster(), HoltWintersForecaster()):
+            with self.subTest(forecaster=forecaster.name):
+                predicted = forecaster.fit_predict(sales, 7, self.monday + timedelta(days=1))
+                np.testing.assert_allclose(predicted, expected, atol=1e-9)
+
+    def test_holt_winters_fits_each_series_independently(self):
+        rng = np.random.default_rng(0)
+        sales = np.vstack([np.tile(self.week, 8) * 3, 10 + 0.2 * np.arange(56)]) + rng.normal(0, 0.5, (2, 56))
+        forecaster = HoltWintersForecaster()
+        together = forecaster.fit_predict(sales, 14, self.monday)
+        for row in range(2):
+            np.testing.assert_allclose(together[row], forecaster.fit_predict(sales[row:row + 1], 14, self.monday)[0])
+
+    def test_unknown_forecaster_is_rejected(self):
+        self.assertEqual(set(FORECASTERS), {'linear', 'seasonal', 'holt_winters'})
+        with self.assertRaises(ValueError):
+            get_forecaster('arima')
+
+
+class CustomerSegmentTests(TestCase):
+    """امتیاز RFM و بخش مشتریان از یک کوئری تجمیعی محاسبه و روی مشتری ذخیره می‌شود."""
+
+    def test_quantile_scores(self):
+        values = np.array([1, 10, 30, 60, 200])
+        self.assertEqual(quantile_scores(values).tolist(), [1, 2, 3, 4, 5])
+        self.assertEqual(quantile_scores(values, higher_is_better=False).tolist(), [5, 4, 3, 2, 1])
+        self.assertEqual(len(quantile_scores(np.array([]))), 0)
+
+    def test_refresh_assigns_segments(self):
+        user = User.objects.create(username='09120000000')
+        product = Product.objects.create(owner=user, product_id_from_site='p1', name='p1', price=100,
+                                         page_url='https://shop.test/p1')
+        now = timezone.now()
+        # (نام، تعداد خرید، چند روز پیش، تعداد بازدید)
+        profiles = [('champ', 5, 1, 0), ('b2', 4, 10, 0), ('b3', 3, 30, 0), ('b4', 2, 60, 0), ('lapsed', 1, 200, 0),
+                    ('viewer', 0, 0, WINDOW_SHOPPER_MIN_VIEWS + 1), ('browser', 0, 0, 2)]
+        events = []
+        for identifier, purchases, days_ago, views in profiles:
+            customer = Customer.objects.create(owner=user, identifier=identifier)
+            events += [ProductEvent(product=product, customer=customer, event_type='PURCHASE',
+                                    created_at=now - timedelta(days=days_ago)) for _ in range(purchases)]
+            events += [ProductEvent(product=product, customer=customer, event_type='VIEW') for _ in range(views)]
+        ProductEvent.objects.bulk_create(events)
+        stale = Customer.objects.create(owner=user, identifier='stale', segment=Customer.Segment.LOYAL, rfm_score='333')
+
+        self.assertEqual(refresh_customer_segments(user), 7)
+
+        customers = {c.identifier: c for c in Customer.objects.filter(owner=user)}
+        self.assertEqual(
+            {identifier: c.segment for identifier, c in customers.items()},
+            {'champ': 'CHAMPIONS', 'b2': 'CHAMPIONS', 'b3': 'LOYAL', 'b4': 'HIBERNATING', 'lapsed': 'HIBERNATING',
+             'viewer': 'WINDOW_SHOPPER', 'browser': '', 'stale': ''},
+        )
+        champ = customers['champ']
+        self.assertEqual((champ.rfm_score, champ.frequency, champ.monetary, champ.recency_days), ('555', 5, 500, 1))
+        self.assertIsNone(customers['viewer'].recency_days)
+        self.assertEqual(customers[stale.identifier].rfm_score, '')
+
+        self.client.force_login(user)
+        response = self.client.get('/api/customer-segments/CHAMPIONS/')
+        self.assertEqual([c['identifier'] for c in response.json()['customers']], ['champ', 'b2'])
+
+
+class CustomerHistoryTests(TestCase):
+    """خلاصه مشتری هنگام ثبت رویدادها به‌روز و تاریخچه با صفحه‌بندی keyset خوانده می‌شود."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.client.force_login(self.user)
+
+    def test_summary_is_updated_at_ingest(self):
+        Product.objects.create(owner=self.user, product_id_from_site='p1', name='p1', price=30, category='shoes',
+                               page_url='https://shop.test/p1')
+        for event_type in ('VIEW', 'PURCHASE', 'PURCHASE'):
+            ingest_events(self.user, [parse_event({'event_type': event_type, 'customer_id': 'c1',
+                                                   'product': {'id': 'p1', 'price': 30}})])
+        ingest_events(self.user, [parse_event({'event_type': 'VIEW', 'customer_id': 'c1', 'product': {'id': 'p2'}})])
+
+        summary = CustomerSummary.objects.get(customer__identifier='c1')
+        self.assertEqual((summary.event_count, summary.purchase_count, summary.total_spent), (4, 2, 60))
+        self.assertEqual(summary.top_categories(), ['shoes', Product._meta.get_field('category').default])
+        self.assertEqual(summary.last_event_at, ProductEvent.objects.latest('created_at').created_at)
+
+    def test_event_pages_cover_history_once_in_order(self):
+        customer = Customer.objects.create(owner=self.user, identifier='c1')
+        product = Product.objects.create(owner=self.user, product_id_from_site='p1', name='p1',
+                                         page_url='https://shop.test/p1')
+        now = timezone.now()
+        # رویدادهای هم‌زمان باید با شناسه از هم جدا شوند
+        ProductEvent.objects.bulk_create([
+            ProductEvent(product=product, customer=customer, event_type='VIEW', created_at=now - timedelta(minutes=i // 2))
+            for i in range(7)
+        ])
+        expected = list(ProductEvent.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        seen, cursor = [], None
+        for _ in range(3):
+            response = self.client.get('/api/customers/c1/events/', {'limit': 3, **({'cursor': cursor} if cursor else {})})
+            page = response.json()
+            seen += [event['id'] for event in page['events']]
+            cursor = page['next_cursor']
+        self.assertEqual(seen, expected)
+        self.assertIsNone(cursor)
+
+        self.assertEqual(self.client.get('/api/customers/c1/events/', {'cursor': 'bad'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/customers/unknown/events/').status_code, 404)
+
+
+class ABTestAssignmentTests(TestCase):
+    """تعیین نسخه تست A/B با هش کلیددار پایدار و شاخص کش‌شده تست‌های فعال."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.api_key = ApiKey.objects.get(user=self.user)
+        UserSite.objects.create(owner=self.user, site_url='https://shop.test', api_key=self.api_key)
+        self.product = Product.objects.create(owner=self.user, product_id_from_site='p1', name='p1',
+                                              page_url='https://shop.test/p1')
+        self.test = ABTest.objects.create(product=self.product, name='t', variable='PRICE', control_value='10',
+                                          variant_value='8', extra_variant_values=['6'], weights=[2, 1, 1],
+                                          traffic_percent=50)
+        invalidate_active_tests()
+        invalidate_site_cache()
+        self.addCleanup(invalidate_active_tests)
+
+    def test_bucket_is_stable_and_keyed(self):
+        first = bucket(self.test.id, 'c1')
+        self.assertEqual(bucket(self.test.id, 'c1'), first)
+        self.assertTrue(all(0 <= value < 1 for value in first))
+        self.assertNotEqual(bucket(self.test.id, 'c2'), first)
+        with override_settings(AB_TEST_HASH_KEY='another-key'):
+            self.assertNotEqual(bucket(self.test.id, 'c1'), first)
+
+    def test_assignment_follows_traffic_and_weights(self):
+        active = ActiveTest(self.test)
+        assigned = Counter(
+            (assign_variant(active, f'customer-{i}') or ('OUT', None))[0] for i in range(20000)
+        )
+        self.assertAlmostEqual(assigned['OUT'] / 20000, 0.5, delta=0.02)
+        self.assertAlmostEqual(assigned['CONTROL'] / 20000, 0.25, delta=0.02)
+        self.assertAlmostEqual(assigned['VARIANT'] / 20000, 0.125, delta=0.02)
+        self.assertAlmostEqual(assigned['VARIANT_2'] / 20000, 0.125, delta=0.02)
+
+    def test_variant_api_is_consistent_and_served_from_cache(self):
+        enrolled = next(f'customer-{i}' for i in range(100) if assign_variant(ActiveTest(self.test), f'customer-{i}'))
+        body = json.dumps({'product_id': 'p1', 'customer_id': enrolled})
+        first = self.client.post('/api/get-variant/', body, content_type='application/json',
+                                 HTTP_X_API_KEY=self.api_key.key).json()
+        with self.assertNumQueries(0):
+            second = self.client.post('/api/get-variant/', body, content_type='application/json',
+                                      HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(first, second)
+        self.assertEqual(first['ab_test_id'], self.test.id)
+
+        # توقف تست شاخص فروشگاه را باطل می‌کند
+        self.test.is_active = False
+        self.test.save()
+        response = self.client.post('/api/get-variant/', body, content_type='application/json',
+                                    HTTP_X_API_KEY=self.api_key.key)
+        self.assertEqual(response.json(), {'ab_test_id': None})
+
+
+class ABTestSignificanceTests(TestCase):
+    """شمارنده‌های نسخه‌ها هنگام ثبت رویداد و آزمون معناداری با تصحیح بونفرونی."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        product = Product.objects.create(owner=self.user, product_id_from_site='p1', name='p1',
+                                         page_url='https://shop.test/p1')
+        self.test = ABTest.objects.create(product=product, name='t', variable='PRICE',
+                                          control_value='10', variant_value='8')
+        invalidate_active_tests()
+        self.addCleanup(invalidate_active_tests)
+
+    def test_wilson_interval(self):
+        self.assertEqual(wilson_interval(0, 0, 0.95), (0.0, 0.0))
+        low, high = wilson_interval(50, 100, 0.95)
+        self.assertAlmostEqual(low, 0.4038, places=4)
+        self.assertAlmostEqual(high, 0.5962, places=4)
+        low, high = wilson_interval(0, 10, 0.95)
+        self.assertAlmostEqual(low, 0.0)
+        self.assertAlmostEqual(high, 0.2775, places=4)
+
+    def test_two_proportion_z_test(self):
+        z, p_value = two_proportion_z_test(100, 1000, 130, 1000)
+        self.assertAlmostEqual(z, 0.03 / math.sqrt(0.115 * 0.885 * 2 / 1000), places=6)
+        self.assertAlmostEqual(p_value, 0.0355, places=3)
+        self.assertEqual(two_proportion_z_test(0, 0, 1, 10), (None, None))
+        self.assertEqual(two_proportion_z_test(0, 10, 0, 10), (None, None))
+
+    def test_bonferroni_correction_with_more_arms(self):
+        counters = {'CONTROL': (1000, 100), 'VARIANT': (1000, 130)}
+        results = analyze_test(self.test, counters)
+        self.assertTrue(results['variant']['significant'])
+        self.assertEqual(results['winner'], ARM_LABELS['VARIANT'])
+
+        # با دو نسخه جدید، سطح معناداری نصف می‌شود و p≈0.035 دیگر کافی نیست
+        self.test.extra_variant_values = ['6']
+        results = analyze_test(self.test, {**counters, 'VARIANT_2': (1000, 100)})
+        self.assertFalse(results['variant']['significant'])
+        self.assertEqual(results['winner'], UNDECIDED)
+
+    def test_variant_counters_are_kept_at_ingest(self):
+        events = [
+            {'event_type': event_type, 'customer_id': customer, 'product': {'id': 'p1'},
+             'ab_test_id': self.test.id, 'ab_test_variant': variant}
+            for customer, variant, event_types in (
+                ('c1', 'CONTROL', ('VIEW', 'PURCHASE')), ('c2', 'CONTROL', ('VIEW',)), ('c3', 'VARIANT', ('VIEW',)),
+            )
+            for event_type in event_types
+        ]
+        ingest_events(self.user, [parse_event(event) for event in events])
+
+        self.assertEqual(
+            set(ABTestVariantStats.objects.values_list('variant', 'views', 'conversions')),
+            {('CONTROL', 2, 1), ('VARIANT', 1, 0)},
+        )
+        self.assertEqual(get_ab_test_results(self.test)['control']['rate'], 50)
+
+
+class IngestCacheTests(TestCase):
+    """کش شناسه‌ها در ثبت رویداد: محصول بدون تغییر نوشته نمی‌شود و شناسه حذف‌شده ثبت را خراب نمی‌کند."""
+
+    def tearDown(self):
+        ingest.last_seen_buffer.flush()
+        ingest._product_cache.clear()
+        ingest._customer_cache.clear()
+
+    def test_stale_product_cache_is_evicted_and_retried(self):
+        user = User.objects.create(username='09120000000')
+        event = parse_event({'event_type': 'VIEW', 'customer_id': 'c1',
+                             'product': {'id': 'p1', 'name': 'p1', 'price': '10'}})
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_events(user, [event])
+        # حذف بدون سیگنال، مانند حذف در پردازه‌ای دیگر که کش این پردازه را پاک نمی‌کند
+        for model in (ProductEvent, DailyProductStats, Product):
+            model.objects.all()._raw_delete('default')
+
+        ingest_events(user, [event])
+        self.assertEqual(ProductEvent.objects.get().product.product_id_from_site, 'p1')
+
+    def test_stale_customer_cache_is_evicted_and_retried(self):
+        user = User.objects.create(username='09120000000')
+        event = parse_event({'event_type': 'VIEW', 'customer_id': 'c1', 'product': {'id': 'p1'}})
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_events(user, [event])
+        for model in (ProductEvent, CohortActivity, CustomerSummary, Customer):
+            model.objects.all()._raw_delete('default')
+
+        ingest_events(user, [event])
+        self.assertEqual(ProductEvent.objects.get().customer.identifier, 'c1')
+
+    def product_writes(self, user, event):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            ingest_events(user, [parse_event(event)])
+        # خواندن قیمت و دسته برای خلاصه مشتری جزو حل کردن محصول نیست
+        sql = [q['sql'] for q in queries.captured_queries]
+        return (sum(q.startswith('SELECT') and '"core_product"."product_id_from_site"' in q for q in sql),
+                sum(q.startswith(('UPDATE', 'INSERT')) and q.split('"')[1] == 'core_product' for q in sql))
+
+    def test_unchanged_product_is_not_written(self):
+        user = User.objects.create(username='09120000000')
+        event = {'event_type': 'VIEW', 'customer_id': 'c1',
+                 'product': {'id': 'p1', 'name': 'p1', 'price': '10', 'url': 'https://shop.test/p1'}}
+        self.assertEqual(self.product_writes(user, event)[1], 1)
+        # اثر انگشت یکسان در کش: نه خواندن و نه نوشتن محصول
+        self.assertEqual(self.product_writes(user, {**event, 'product': {**event['product'], 'price': '10.00'}}), (0, 0))
+        # کش خالی (پردازه دیگر): فقط یک خواندن
+        ingest._product_cache.clear()
+        self.assertEqual(self.product_writes(user, event), (1, 0))
+
+        self.assertEqual(self.product_writes(user, {**event, 'product': {**event['product'], 'price': '12'}}), (0, 1))
+        self.assertEqual(Product.objects.get().price, 12)
+
+
+class LastSeenBufferTests(TestCase):
+    """زمان دیده‌شدن مشتریان در حافظه تجمیع و گروهی ثبت می‌شود و فقط جلو می‌رود."""
+
+    def setUp(self):
+        user = User.objects.create(username='09120000000')
+        self.now = timezone.now()
+        self.alice = Customer.objects.create(owner=user, identifier='alice', last_seen=self.now)
+        self.bob = Customer.objects.create(owner=user, identifier='bob', last_seen=self.now)
+        self.buffer = LastSeenBuffer(flush_interval=3600, flush_size=3)
+
+    def last_seen(self, customer):
+        customer.refresh_from_db(fields=['last_seen'])
+        return customer.last_seen
+
+    def test_flush_writes_latest_time_and_never_moves_back(self):
+        self.buffer.add({self.alice.id: self.now + timedelta(minutes=5), self.bob.id: self.now - timedelta(hours=1)})
+        self.buffer.add({self.alice.id: self.now + timedelta(minutes=1)})
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.last_seen(self.alice), self.now + timedelta(minutes=5))
+        # رویداد دیررس زمان ذخیره‌شده را عقب نمی‌برد (Greatest)
+        self.assertEqual(self.last_seen(self.bob), self.now)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_full_buffer_flushes_on_add(self):
+        carol = Customer.objects.create(owner=self.alice.owner, identifier='carol', last_seen=self.now)
+        later = self.now + timedelta(minutes=1)
+        self.buffer.add({self.alice.id: later, self.bob.id: later})
+        self.assertEqual(self.last_seen(self.alice), self.now)
+        self.buffer.add({carol.id: later})
+        self.assertEqual([self.last_seen(c) for c in (self.alice, self.bob, carol)], [later] * 3)
+
+
+class LastSeenTimerTests(TransactionTestCase):
+    """رشته پس‌زمینه بافر را بدون درخواست جدید ثبت می‌کند."""
+
+    def test_timer_flushes_pending_times(self):
+        user = User.objects.create(username='09120000000')
+        customer = Customer.objects.create(owner=user, identifier='alice', last_seen=timezone.now())
+        buffer = LastSeenBuffer(flush_interval=0.05, flush_size=1000)
+        # رشته daemon تا پایان پردازه زنده است؛ پس از تست عملاً متوقف می‌شود
+        self.addCleanup(setattr, buffer, 'flush_interval', 3600)
+        later = customer.last_seen + timedelta(minutes=5)
+        buffer.add({customer.id: later})
+
+        deadline = time.monotonic() + 5
+        while Customer.objects.get(id=customer.id).last_seen != later and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(Customer.objects.get(id=customer.id).last_seen, later)
+
+
+class ProductTotalsTests(TestCase):
+    """شمارنده‌های کل محصول در ثبت رویداد نوشته نمی‌شوند و به صورت دوره‌ای از آمار روزانه به‌روز می‌شوند."""
+
+    def test_periodic_refresh_updates_touched_products_only(self):
+        user = User.objects.create(username='09120000000')
+        old = Product.objects.create(owner=user, product_id_from_site='old', name='old',
+                                     page_url='https://shop.test', total_views=7)
+        events = [parse_event({'event_type': event_type, 'customer_id': 'c1', 'product': {'id': 'p1'}})
+                  for event_type in ('VIEW', 'VIEW', 'VIEW', 'VIEW', 'PURCHASE')]
+        ingest_events(user, events)
+        product = Product.objects.get(product_id_from_site='p1')
+        self.assertEqual((product.total_views, product.total_purchases), (0, 0))
+
+        refresh_product_totals(since=timezone.localdate() - timedelta(days=1))
+        product.refresh_from_db()
+        old.refresh_from_db()
+        self.assertEqual((product.total_views, product.total_purchases, product.conversion_rate), (4, 1, 25.0))
+        self.assertEqual(old.total_views, 7)
+
+
+class ProductCatalogTests(TestCase):
+    """صفحه‌بندی keyset و فیلترهای فهرست محصولات."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='09120000000')
+        Product.objects.bulk_create([
+            Product(owner=cls.user, product_id_from_site=f'p{i}', name=f'p{i}', page_url='https://shop.test',
+                    category='a' if i % 2 else 'b', stock=[None, 0, 5][i % 3], total_views=i % 4)
+            for i in range(10)
+        ])
+
+    def test_pages_cover_all_products_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = get_product_page(self.user, sort='views', cursor=cursor, limit=3)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual(len({p.pk for p in seen}), 10)
+        self.assertEqual(seen, sorted(seen, key=lambda p: (p.total_views, p.pk), reverse=True))
+
+    def test_stock_filters_keep_unknown_separate(self):
+        def names(**filters):
+            return {p.name for p in get_product_page(self.user, **filters)[0]}
+        self.assertEqual(names(stock='out'), {'p1', 'p4', 'p7'})
+        self.assertEqual(names(stock='unknown'), {'p0', 'p3', 'p6', 'p9'})
+        self.assertEqual(names(stock='in', category='b'), {'p2', 'p8'})
+
+    def test_crafted_cursor_is_rejected(self):
+        for value in ([1], '5', None, True, float('inf')):
+            cursor = base64.urlsafe_b64encode(json.dumps(['views', value, 1]).encode()).decode()
+            with self.assertRaises(InvalidCursor):
+                get_product_page(self.user, sort='views', cursor=cursor)
+        with self.assertRaises(InvalidCursor):
+            get_product_page(self.user, sort='conversion', cursor=encode_cursor('views', Product(total_views=1, id=1)))
+
+
+class CohortAnalysisTests(TestCase):
+    """جدول کوهورت با یک کوئری، به صورت ماهانه یا هفتگی و برای هر نوع رویداد."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='09120000000')
+        product = Product.objects.create(owner=cls.user, product_id_from_site='p1', name='p1',
+                                         page_url='https://shop.test/p1')
+        start = timezone.make_aware(timezone.datetime(2026, 1, 5, 12))  # دوشنبه
+        alice = Customer.objects.create(owner=cls.user, identifier='alice')
+        bob = Customer.objects.create(owner=cls.user, identifier='bob')
+        Customer.objects.filter(pk__in=[alice.pk, bob.pk]).update(first_seen=start)
+        ProductEvent.objects.bulk_create([
+            ProductEvent(product=product, customer=alice, event_type='VIEW', created_at=start),
+            ProductEvent(product=product, customer=bob, event_type='VIEW', created_at=start),
+            ProductEvent(product=product, customer=alice, event_type='PURCHASE', created_at=start + timedelta(days=7)),
+            ProductEvent(product=product, customer=bob, event_type='VIEW', created_at=start + timedelta(days=35)),
+        ])
+
+    def test_weekly_counts_and_percents(self):
+        with self.assertNumQueries(1):
+            cohorts = compute_cohorts(self.user, 'week')
+        counts = cohorts['counts'].loc['2026-01-05']
+        self.assertEqual((counts['هفته 0'], counts['هفته 1'], counts['هفته 5']), (2, 1, 1))
+        self.assertEqual(cohorts['percents'].loc['2026-01-05', 'هفته 1'], 50.0)
+
+    def test_monthly_retention_by_event_type(self):
+        cohorts = compute_cohorts(self.user, 'month', event_type='VIEW')
+        self.assertEqual(cohorts['counts'].loc['2026-01'].tolist(), [2, 1])
+        purchases = compute_cohorts(self.user, 'month', event_type='PURCHASE')
+        self.assertEqual(purchases['counts'].loc['2026-01'].tolist(), [1])
+
+
+class LowStockRuleTests(TestCase):
+    """محصولی که از رویدادها ساخته شده موجودی نامشخص دارد و هشدار موجودی کم نمی‌گیرد."""
+
+    def test_unknown_stock_is_not_low_stock(self):
+        user = User.objects.create(username='09120000000')
+        ingest_events(user, [parse_event({'event_type': 'PURCHASE', 'customer_id': 'c1', 'product': {'id': 'p1'}})])
+        self.assertIsNone(Product.objects.get().stock)
+
+        generate_recommendations(user)
+        self.assertFalse(Recommendation.objects.filter(reason=Recommendation.ReasonType.LOW_STOCK).exists())
+
+
+@override_settings(ANALYTICS_CACHE_BACKGROUND_REFRESH=False)
+class AnalyticsCacheTests(TestCase):
+    """نتیجه کش‌شده تا تغییر نسخه داده یا پایان TTL دوباره محاسبه نمی‌شود."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.calls = 0
+
+    def tearDown(self):
+        caches[settings.ANALYTICS_CACHE_ALIAS].clear()
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_purchase_watermark_invalidates_cached_result(self):
+        self.assertEqual(cached_analysis(self.user, 'cohorts', self.compute, {'granularity': 'week'}), 1)
+        self.assertEqual(cached_analysis(self.user, 'cohorts', self.compute, {'granularity': 'week'}), 1)
+        # پارامتر متفاوت کلید جداگانه دارد
+        self.assertEqual(cached_analysis(self.user, 'cohorts', self.compute, {'granularity': 'month'}), 2)
+
+        bump_watermark(self.user.pk)
+        self.assertEqual(AnalyticsWatermark.objects.get(owner=self.user).version, 1)
+        # نتیجه کهنه برگردانده و محاسبه مجدد انجام می‌شود (اینجا همزمان)
+        self.assertEqual(cached_analysis(self.user, 'cohorts', self.compute, {'granularity': 'week'}), 1)
+        self.assertEqual(cached_analysis(self.user, 'cohorts', self.compute, {'granularity': 'week'}), 3)
+
+
+class AnalyticsJobStalenessTests(TestCase):
+    """خرید جدید پس از پایان یک کار تحلیلی باید آن را کهنه کند."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        Product.objects.create(owner=self.user, product_id_from_site='p1', name='p1', page_url='https://shop.test/p1')
+
+    def tearDown(self):
+        caches[settings.ANALYTICS_CACHE_ALIAS].clear()
+
+    def finished_job(self, status=AnalyticsJob.Status.SUCCEEDED, minutes_ago=5, analysis='market_basket'):
+        return AnalyticsJob.objects.create(owner=self.user, analysis=analysis, status=status,
+                                           finished_at=timezone.now() - timedelta(minutes=minutes_ago))
+
+    def test_purchase_after_finished_job_schedules_refresh(self):
+        for analysis in jobs.JOB_ANALYSES:
+            self.finished_job(analysis=analysis)
+        self.assertEqual(jobs.schedule_stale_jobs(), 0)
+
+        bump_watermark(self.user.pk)
+        self.assertEqual(jobs.schedule_stale_jobs(), len(jobs.JOB_ANALYSES))
+        latest, active = get_job_state(self.user, 'market_basket')
+        self.assertEqual(active.status, AnalyticsJob.Status.PENDING)
+        # کار فعال دوباره در صف قرار نمی‌گیرد
+        self.assertEqual(jobs.schedule_stale_jobs(), 0)
+
+    def test_job_state_is_read_only_single_query(self):
+        with self.assertNumQueries(1):
+            latest, active = get_job_state(self.user, 'market_basket')
+        self.assertEqual((latest, active), (None, None))
+        self.assertFalse(AnalyticsJob.objects.exists())
+
+    def test_newer_result_prunes_older_rows(self):
+        self.finished_job(minutes_ago=10)
+        self.finished_job(status=AnalyticsJob.Status.FAILED, minutes_ago=5)
+        job = AnalyticsJob.objects.create(owner=self.user, analysis='market_basket', status=AnalyticsJob.Status.RUNNING)
+        with patch.dict(jobs.JOB_ANALYSES, market_basket=lambda owner: {'rules': []}):
+            jobs.run_job(job.id)
+        self.assertEqual(list(AnalyticsJob.objects.values_list('id', flat=True)), [job.id])
+
+        # پس از شکست، آخرین نتیجه موفق برای نمایش حفظ می‌شود
+        self.finished_job(status=AnalyticsJob.Status.FAILED, minutes_ago=1)
+        job = AnalyticsJob.objects.create(owner=self.user, analysis='market_basket', status=AnalyticsJob.Status.RUNNING)
+        with patch.dict(jobs.JOB_ANALYSES, market_basket=Mock(side_effect=ValueError('boom'))):
+            jobs.run_job(job.id)
+        self.assertEqual(AnalyticsJob.objects.count(), 2)
+        latest, active = get_job_state(self.user, 'market_basket')
+        self.assertEqual(latest.result, {'rules': []})
+        self.assertIsNone(active)
+
+
+class CooccurrenceIndexTests(TestCase):
+    """شاخص هم‌رخدادی در پردازشگر کارها ساخته و از طریق API خوانده می‌شود."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.api_key = ApiKey.objects.get(user=self.user)
+        UserSite.objects.create(owner=self.user, site_url='https://shop.test', api_key=self.api_key)
+        ingest_events(self.user, [
+            parse_event({'event_type': 'VIEW', 'customer_id': customer, 'product': {'id': product_id}})
+            for customer in ('c1', 'c2') for product_id in ('p1', 'p2', 'p3')
+        ])
+
+    def tearDown(self):
+        cooccurrence._indexes.clear()
+
+    @override_settings(RECOMMENDATION_BASKET_MAX_ITEMS=2)
+    def test_reread_margin_does_not_double_count(self):
+        index = cooccurrence.get_cooccurrence_index(self.user.pk)
+        index.refresh()
+        p1, p2, p3 = (index.site_ids[site_id] for site_id in ('p1', 'p2', 'p3'))
+        self.assertEqual(index.pairs['VIEW'][p1], {p2: 2})
+        self.assertNotIn(p3, index.pairs['VIEW'])
+
+    def test_api_serves_latest_job_result(self):
+        url = '/api/recommendations/p1/'
+        response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key)
+        self.assertEqual(response.json()['viewed_together'], [])
+        self.assertFalse(AnalyticsJob.objects.exists())
+        jobs.schedule_stale_jobs()
+        job = AnalyticsJob.objects.get(owner=self.user, analysis='cooccurrence')
+        jobs.run_job(job.id)
+
+        response = self.client.get(url + '?k=1', HTTP_X_API_KEY=self.api_key.key)
+        self.assertEqual([p['product_id'] for p in response.json()['viewed_together']], ['p2'])
+
+    def test_store_writes_only_changed_products(self):
+        index = cooccurrence.get_cooccurrence_index(self.user.pk)
+        self.assertEqual(index.store(5), 3)
+        self.assertEqual(ProductCooccurrence.objects.filter(owner=self.user).count(), 3)
+
+        ingest_events(self.user, [
+            parse_event({'event_type': 'VIEW', 'customer_id': 'c3', 'product': {'id': product_id}})
+            for product_id in ('p1', 'p2')
+        ])
+        index.refresh()
+        self.assertEqual(index.store(5), 2)
+        row = ProductCooccurrence.objects.get(product__product_id_from_site='p1')
+        self.assertEqual([(p['product_id'], p['score']) for p in row.viewed_together], [('p2', 3), ('p3', 2)])
+
+        # شاخص تازه همه ردیف‌ها را بازنویسی و ردیف محصولات بدون هم‌رخدادی را حذف می‌کند
+        ProductEvent.objects.filter(product__product_id_from_site='p3').delete()
+        cooccurrence._indexes.clear()
+        cooccurrence.get_cooccurrence_index(self.user.pk).store(5)
+        self.assertEqual(
+            set(ProductCooccurrence.objects.values_list('product__product_id_from_site', flat=True)), {'p1', 'p2'}
+        )
+
+
+class SpoolDrainTests(TestCase):
+    """رکورد خراب صف نباید تخلیه قطعه و رکوردهای بعد از آن را متوقف کند."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.spool = EventSpool(self.directory.name, segment_max_bytes=1 << 20, segment_max_age=60,
+                                max_bytes=1 << 30, fsync=False)
+
+    def event(self, product_id='p1', price='10'):
+        return {
+            'event_type': 'VIEW', 'product_id': product_id, 'product_name': 'p1', 'product_price': price,
+            'product_url': 'https://shop.test/p1', 'customer_identifier': 'c1', 'ab_test_id': None,
+            'ab_test_variant': None, 'created_at': timezone.now(),
+        }
+
+    def test_bad_record_goes_to_dead_letter(self):
+        self.spool.append(self.user.pk, [self.event(), self.event(product_id='p2', price='NaN'), self.event()])
+        self.spool.close()
+
+        self.assertEqual(drain_spool(self.directory.name, flush_size=10), 2)
+
+        self.assertEqual(ProductEvent.objects.filter(product__owner=self.user).count(), 2)
+        dead_letters = os.listdir(os.path.join(self.directory.name, DEAD_LETTER_DIR))
+        with open(os.path.join(self.directory.name, DEAD_LETTER_DIR, dead_letters[0])) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertFalse(SpoolCheckpoint.objects.exists())
+
+    def test_corrupt_tail_of_open_segment_is_dead_lettered_once(self):
+        self.spool.append(self.user.pk, [self.event()])
+        segment = next(name for name in os.listdir(self.directory.name) if name.endswith(OPEN_SUFFIX))
+        with open(os.path.join(self.directory.name, segment), 'ab') as f:
+            f.write(b'{not json\n')
+
+        self.assertEqual(drain_spool(self.directory.name, flush_size=10), 1)
+        self.assertEqual(drain_spool(self.directory.name, flush_size=10), 0)
+
+        self.assertEqual(ProductEvent.objects.filter(product__owner=self.user).count(), 1)
+        dead_letters = os.listdir(os.path.join(self.directory.name, DEAD_LETTER_DIR))
+        with open(os.path.join(self.directory.name, DEAD_LETTER_DIR, dead_letters[0])) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.spool.close()
+
+    def test_second_drainer_skips_locked_spool(self):
+        self.spool.append(self.user.pk, [self.event()])
+        self.spool.close()
+        with open(os.path.join(self.directory.name, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.assertEqual(drain_spool(self.directory.name, flush_size=10), 0)
+        self.assertEqual(drain_spool(self.directory.name, flush_size=10), 1)
+
+
+class StubWooCommerceHandler(BaseHTTPRequestHandler):
+    """پاسخ‌دهنده ساده به /wp-json/wc/v3/products با صفحه‌بندی شبیه ووکامرس."""
+    products = []
+    requests_seen = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.requests_seen.append(params)
+        if url.path != '/wp-json/wc/v3/products':
+            self.send_error(404)
+            return
+        items = self.products
+        if 'modified_after' in params:
+            items = [item for item in items if item['date_modified_gmt'] > params['modified_after']]
+        per_page, page = int(params['per_page']), int(params['page'])
+        body = json.dumps(items[(page - 1) * per_page:page * per_page]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-WP-Total', str(len(items)))
+        self.send_header('X-WP-TotalPages', str(max(1, -(-len(items) // per_page))))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WooCommerceSyncTests(TestCase):
+    """همگام‌سازی گروهی و افزایشی محصولات در برابر یک سرور ووکامرس محلی."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubWooCommerceHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create(username='09120000000')
+        self.site = UserSite.objects.create(
+            owner=self.user, site_url=f'http://127.0.0.1:{self.server.server_port}',
+            api_key=ApiKey.objects.get(user=self.user),
+            woocommerce_consumer_key='ck_test', woocommerce_consumer_secret='cs_test',
+        )
+        StubWooCommerceHandler.products = [
+            {
+                'id': i, 'name': f'product {i}', 'permalink': f'https://shop.test/p/{i}',
+                'price': '80' if i % 10 == 0 else '100', 'regular_price': '100', 'stock_quantity': i % 7,
+                'categories': [{'name': f'cat {i % 3}'}], 'date_modified_gmt': '2020-01-01T00:00:00',
+            }
+            for i in range(1, 251)
+        ]
+        StubWooCommerceHandler.requests_seen = []
+
+    def sync(self, **kwargs):
+        return sync_woocommerce_products(self.site, service=WooCommerceService(self.site, workers=4, page_size=20),
+                                         **kwargs)
+
+    def test_full_sync_upserts_all_pages(self):
+        Product.objects.create(owner=self.user, product_id_from_site='5', name='old', page_url='https://shop.test/')
+
+        self.assertEqual(self.sync(), 250)
+
+        self.assertEqual(Product.objects.filter(owner=self.user).count(), 250)
+        self.assertEqual(len(StubWooCommerceHandler.requests_seen), 13)
+        product = Product.objects.get(owner=self.user, product_id_from_site='10')
+        self.assertEqual((product.name, product.stock, product.category), ('product 10', 3, 'cat 1'))
+        self.assertEqual(product.discount, 20)
+        self.assertEqual(Product.objects.get(owner=self.user, product_id_from_site='5').name, 'product 5')
+
+    def test_incremental_sync_uses_checkpoint(self):
+        self.sync()
+        self.site.refresh_from_db()
+        self.assertIsNotNone(self.site.woocommerce_synced_at)
+
+        StubWooCommerceHandler.requests_seen = []
+        StubWooCommerceHandler.products[0].update(price='55', date_modified_gmt='2999-01-01T00:00:00')
+        self.assertEqual(self.sync(), 1)
+
+        self.assertIn('modified_after', StubWooCommerceHandler.requests_seen[0])
+        self.assertEqual(Product.objects.get(owner=self.user, product_id_from_site='1').price, 55)
@@ -0,0 +1,88 @@
+# core/timeseries.py
+
+from datetime import datetime, timedelta
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncHour, TruncWeek
+from django.utils import timezone
+
+from .models import ProductEvent, DailyProductStats
+
+GRANULARITIES = ('hour', 'day', 'week')
+SERIES_FIELDS = ('views', 'carts', 'purchases')
+# بیشترین بازه‌ی مجاز برای دانه‌بندی ساعتی که مستقیم از رویدادهای خام خوانده می‌شود
+MAX_HOURLY_DAYS = 7
+
+
+def _buckets(start, end, granularity):
+    """لیست کامل بازه‌ها تا بازه‌های بدون رویداد هم با صفر نمایش داده شوند."""
+    if granularity == 'hour':
+        current = timezone.localtime(start).replace(minute=0, second=0, microsecond=0)
+        step = timedelta(hours=1)
+    elif granularity == 'week':
+        current = start - timedelta(days=start.weekday())
+        step = timedelta(days=7)
+    else:
+        current = start
+        step = timedelta(days=1)
+
+    buckets = []
+    while current <= end:
+        buckets.append(current)
+        current += step
+    return buckets
+
+
+def _hourly_rows(owner, start, end, product):
+    """شمارش ساعتی از رویدادهای خام با یک کوئری گروه‌بندی‌شده."""
+    events = ProductEvent.objects.filter(product__owner=owner, created_at__range=(start, end))
+    if product is not None:
+        events = events.filter(product=product)
+    return events.annotate(bucket=TruncHour('created_at')).values('bucket').annotate(
+        views=Count('id', filter=Q(event_type='VIEW')),
+        carts=Count('id', filter=Q(event_type='ADD_TO_CART')),
+        purchases=Count('id', filter=Q(event_type='PURCHASE')),
+    ).order_by()
+
+
+def _daily_rows(owner, start, end, product, granularity):
+    """شمارش روزانه یا هفتگی از جدول آمار روزانه با یک کوئری گروه‌بندی‌شده."""
+    stats = DailyProductStats.objects.filter(owner=owner, day__range=(start, end))
+    if product is not None:
+        stats = stats.filter(product=product)
+    bucket = TruncWeek('day') if granularity == 'week' else F('day')
+    return stats.annotate(bucket=bucket).values('bucket').annotate(
+        **{field: Sum(field) for field in SERIES_FIELDS}
+    ).order_by()
+
+
+def get_event_timeseries(owner, start, end, granularity='day', product=None):
+    """سری زمانی بازدید، افزودن به سبد و خرید برای یک فروشگاه یا یک محصول.
+
+    start و end برای دانه‌بندی ساعتی زمان (datetime) و برای روزانه/هفتگی تاریخ (date) هستند.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    if granularity == 'hour':
+        if not isinstance(start, datetime):
+            start = timezone.make_aware(datetime.combine(start, datetime.min.time()))
+            end = timezone.make_aware(datetime.combine(end, datetime.max.time()))
+        rows = _hourly_rows(owner, start, end, product)
+    else:
+        if isinstance(start, datetime):
+            start, end = timezone.localdate(start), timezone.localdate(end)
+        rows = _daily_rows(owner, start, end, product, granularity)
+
+    buckets = _buckets(start, end, granularity)
+    values = {bucket: dict.fromkeys(SERIES_FIELDS, 0) for bucket in buckets}
+    for row in rows:
+        if row['bucket'] in values:
+            values[row['bucket']] = {field: row[field] or 0 for field in SERIES_FIELDS}
+
+    series = {field: [values[bucket][field] for bucket in buckets] for field in SERIES_FIELDS}
+    return {
+        'buckets': buckets,
+        **series,
+        'totals': {field: sum(series[field]) for field in SERIES_FIELDS},
+    }
@@ -16,10 +16,12 @@ urlpatterns = [
     path('connect/', views.connect_site_view, name='connect_site'),
 
     path('products/', views.product_list_view, name='product_list'),
+    path('api/products/', views.product_list_api, name='product_list_api'),
     path('products/<int:pk>/', views.product_detail_view, name='product_detail'),
 
     # Customer Analytics
     path('customers/<str:identifier>/', views.customer_profile_view, name='customer_profile'),
+    path('api/customers/<str:identifier>/events/', views.customer_events_api, name='customer_events'),
 
     # Advanced Analytics
     path('analytics/cohort/', views.cohort_analysis_view, name='cohort_analysis'),
@@ -28,10 +30,19 @@ urlpatterns = [
     path('ab-testing/', views.ab_test_list_view, name='ab_test_list'),
     path('ab-testing/new/', views.ab_test_create_view, name='ab_test_create'),
     path('ab-testing/<int:pk>/', views.ab_test_detail_view, name='ab_test_detail'),
+    path('api/ab-tests/results/', views.ab_test_results_api, name='ab_test_results_api'),
 
     # API Endpoints
     path('api/track-event/', views.track_event_view, name='track_event'),
+    path('api/track-events/batch/', views.track_events_batch_view, name='track_events_batch'),
     path('api/get-variant/', views.get_product_variant_api, name='get_product_variant'),
+    path('api/recommendations/<str:product_id_from_site>/', views.product_recommendations_api,
+         name='product_recommendations'),
+    path('api/customers/<str:identifier>/recommendations/', views.customer_recommendations_api,
+         name='customer_recommendations'),
+
+    path('api/customer-segments/<str:segment>/', views.customer_segment_api, name='customer_segment'),
+    path('api/analytics-jobs/<str:analysis>/', views.analytics_job_status_api, name='analytics_job_status'),
 
     # این مسیر جدید را اضافه کنید
     path('api/daily-events-chart/', views.daily_events_chart_api, name='daily_events_chart_api'),
@@ -3,33 +3,53 @@
 import logging
 import random
 import json
-from decimal import Decimal
-from datetime import datetime, timedelta
+import jdatetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-from django.db.models.functions import TruncDate
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Count, Sum, Q
+from django.db.models import Sum, Q
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
+from django.conf import settings
+from django.core.paginator import Paginator
 
 from .models import (
     Product, ProductEvent, Recommendation, OTPCode, UserSite, ApiKey,
-    Customer, ABTest, ABTestEvent
+    Customer, ABTest, CustomerSummary, ProductCooccurrence
 )
 from .forms import OTPRequestForm, OTPVerifyForm, ABTestForm
+from .ingest import InvalidEvent, parse_event, ingest_events
+from .spool import SpoolFull, get_spool
+from .caching import get_site_for_api_key
+from .cooccurrence import KINDS
+from .abtesting import assign_variant, get_active_tests, get_ab_test_results_bulk
+from .timeseries import GRANULARITIES, MAX_HOURLY_DAYS, get_event_timeseries
+from .jobs import JOB_ANALYSES, get_job_state
+from .analytics_cache import cached_analysis
+from .cohorts import COHORT_GRANULARITIES, get_stored_cohorts
+from .forecasting import get_stored_forecast
+from .catalog import PRODUCT_SORTS, STOCK_FILTERS, InvalidCursor, get_product_page
 from .utils import (
-    calculate_funnel_analysis, get_customer_segments, get_market_basket_analysis,
-    predict_future_sales, get_ab_test_results, get_cohort_analysis
+    get_dashboard_metrics, get_customer_segments, get_ab_test_results, get_cohort_analysis
 )
 
 logger = logging.getLogger(__name__)
 
 
+def _get_sales_forecast(user, product_id):
+    """خواندن پیش‌بینی ذخیره‌شده؛ پیش‌بینی‌های کهنه را پردازشگر کارها در پس‌زمینه دوباره محاسبه می‌کند."""
+    forecast_job, _ = get_job_state(user, 'sales_forecast')
+    if forecast_job is None:
+        return None, "پیش‌بینی فروش در حال محاسبه است..."
+    return get_stored_forecast(product_id)
+
+
 @login_required
 def dashboard_overview_view(request):
     """نمایش داشبورد اصلی با آمار کلی و تحلیل‌های پیشرفته."""
@@ -47,49 +67,53 @@ def dashboard_overview_view(request):
     aware_end_date = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
     date_range = (aware_start_date, aware_end_date)
 
+    day_range = (timezone.localdate(aware_start_date), timezone.localdate(aware_end_date))
+
     products = Product.objects.filter(owner=user)
-    all_events = ProductEvent.objects.filter(product__in=products, created_at__range=date_range)
-    total_views = all_events.filter(event_type='VIEW').count()
-    total_carts = all_events.filter(event_type='ADD_TO_CART').count()
-    total_purchases = all_events.filter(event_type='PURCHASE').count()
-    overall_conversion = (total_purchases / total_views * 100) if total_views > 0 else 0
+    # شاخص‌های کلی و قیف فروش با یک گذر روی رویدادها محاسبه می‌شوند
+    metrics = get_dashboard_metrics(user, aware_start_date, aware_end_date)
 
     popular_products = products.annotate(
-        purchases_count=Count('events', filter=Q(events__event_type='PURCHASE', events__created_at__range=date_range))
+        purchases_count=Sum('daily_stats__purchases', filter=Q(daily_stats__day__range=day_range))
     ).filter(purchases_count__gt=0).order_by('-purchases_count')[:5]
 
-    recommendations = Recommendation.objects.filter(owner=user, is_active=True).order_by('-created_at')[:5]
-
-    funnel_data = calculate_funnel_analysis(user, aware_start_date, aware_end_date)
-    customer_segments = get_customer_segments(user, aware_start_date, aware_end_date)
-    market_basket_df, market_basket_message = get_market_basket_analysis(user)
-
-    # تبدیل دیتافریم به لیست دیکشنری‌ها برای تمپلیت
-    market_basket_rules = market_basket_df.to_dict('records') if market_basket_df is not None else []
+    recommendations = Recommendation.objects.filter(
+        owner=user, customer__isnull=True, is_active=True
+    ).order_by('-created_at')[:5]
+
+    # بخش‌بندی RFM در پس‌زمینه روی مشتریان ذخیره می‌شود؛ اینجا فقط خوانده می‌شود
+    customer_segments = get_customer_segments(user)
+    # تحلیل سبد خرید در پس‌زمینه اجرا می‌شود؛ آخرین نتیجه آماده نمایش داده می‌شود
+    market_basket_job, market_basket_active_job = get_job_state(user, 'market_basket')
+    if market_basket_job:
+        market_basket_rules = market_basket_job.result['rules']
+        market_basket_message = market_basket_job.result['message']
+    else:
+        market_basket_rules, market_basket_message = [], "تحلیل سبد خرید در حال محاسبه است..."
 
     # پیش‌بینی فروش (این بخش اضافه شد)
     sales_forecast, forecast_message, forecast_product_name = None, "محصول پرفروشی برای پیش‌بینی یافت نشد.", ""
-    top_product = ProductEvent.objects.filter(product__owner=user, event_type='PURCHASE'
-                                              ).values('product__id', 'product__name').annotate(c=Count('id')).order_by(
-        '-c').first()
+    # شمارنده کل خرید روی محصول نگه داشته می‌شود (ایندکس product_owner_purchases_idx)
+    top_product = products.filter(total_purchases__gt=0).order_by('-total_purchases', '-id').values('id', 'name').first()
 
     if top_product:
-        forecast_product_name = top_product['product__name']
-        sales_forecast, forecast_message = predict_future_sales(top_product['product__id'])
+        forecast_product_name = top_product['name']
+        sales_forecast, forecast_message = _get_sales_forecast(user, top_product['id'])
 
     context = {
-        'total_views': total_views,
-        'total_carts': total_carts,
-        'total_purchases': total_purchases,
-        'overall_conversion': f"{overall_conversion:.2f}",
+        'total_views': metrics['total_views'],
+        'total_carts': metrics['total_carts'],
+        'total_purchases': metrics['total_purchases'],
+        'overall_conversion': f"{metrics['overall_conversion']:.2f}",
         'popular_products': popular_products,
         'recommendations': recommendations,
         'start_date_str': start_date.strftime('%Y-%m-%d'),
         'end_date_str': end_date.strftime('%Y-%m-%d'),
-        'funnel_data': funnel_data,
+        'funnel_data': metrics['funnel'],
         'customer_segments': customer_segments,
         'market_basket_rules': market_basket_rules,
         'market_basket_message': market_basket_message,
+        'market_basket_pending': market_basket_active_job is not None,
         'sales_forecast': sales_forecast,
         'forecast_message': forecast_message,
         'forecast_product_name': forecast_product_name,
@@ -108,27 +132,19 @@ def daily_events_chart_api(request):
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=6)
 
-    date_range_labels = [start_date + timedelta(days=x) for x in range((end_date - start_date).days + 1)]
-    chart_data = {d.strftime('%Y-%m-%d'): {'views': 0, 'carts': 0, 'purchases': 0} for d in date_range_labels}
-
-    events_by_day = ProductEvent.objects.filter(
-        product__owner=user, created_at__date__range=(start_date, end_date)
-    ).annotate(day=TruncDate('created_at')).values('day', 'event_type').annotate(count=Count('id'))
-
-    for event in events_by_day:
-        day_str = event['day'].strftime('%Y-%m-%d')
-        if event['event_type'] == 'VIEW':
-            chart_data[day_str]['views'] = event['count']
-        elif event['event_type'] == 'ADD_TO_CART':
-            chart_data[day_str]['carts'] = event['count']
-        elif event['event_type'] == 'PURCHASE':
-            chart_data[day_str]['purchases'] = event['count']
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return JsonResponse({'error': 'Invalid granularity'}, status=400)
+    if granularity == 'hour':
+        start_date = max(start_date, end_date - timedelta(days=MAX_HOURLY_DAYS - 1))
 
+    series = get_event_timeseries(user, start_date, end_date, granularity=granularity)
+    label_format = '%Y-%m-%d %H:00' if granularity == 'hour' else '%Y-%m-%d'
     return JsonResponse({
-        'labels': list(chart_data.keys()),
-        'views': [d['views'] for d in chart_data.values()],
-        'carts': [d['carts'] for d in chart_data.values()],
-        'purchases': [d['purchases'] for d in chart_data.values()],
+        'labels': [bucket.strftime(label_format) for bucket in series['buckets']],
+        'views': series['views'],
+        'carts': series['carts'],
+        'purchases': series['purchases'],
     })
 
 
@@ -191,67 +207,126 @@ def connect_site_view(request):
     return render(request, 'connect_site.html', context)
 
 
+def _get_site_for_request(request):
+    """یافتن سایت فعال متناظر با کلید API درخواست؛ در صورت خطا پاسخ خطا برگردانده می‌شود."""
+    api_key = request.headers.get('X-API-Key')
+    if not api_key:
+        return None, JsonResponse({'error': 'API Key required'}, status=401)
+    site = get_site_for_api_key(api_key)
+    if site is None:
+        return None, JsonResponse({'error': 'Invalid or inactive API Key'}, status=401)
+    return site, None
+
+
 @csrf_exempt
 @require_POST
 def track_event_view(request):
     """API دریافت رویدادها از سایت کاربر."""
-    api_key = request.headers.get('X-API-Key')
-    if not api_key:
-        return JsonResponse({'error': 'API Key required'}, status=401)
-    try:
-        site = UserSite.objects.select_related('owner').get(api_key__key=api_key, is_active=True)
-    except UserSite.DoesNotExist:
-        return JsonResponse({'error': 'Invalid or inactive API Key'}, status=401)
+    site, error_response = _get_site_for_request(request)
+    if error_response:
+        return error_response
 
     try:
         data = json.loads(request.body)
-        event_type = data['event_type']
-        product_data = data['product']
-        customer_identifier = data.get('customer_id') or request.META.get('REMOTE_ADDR')
-    except (json.JSONDecodeError, KeyError):
+        event = parse_event(data, default_customer_id=request.META.get('REMOTE_ADDR'),
+                            active_tests=get_active_tests(site.owner_id))
+    except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid data'}, status=400)
+    except InvalidEvent as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if settings.EVENT_INGEST_MODE == 'spool':
+        try:
+            get_spool().append(site.owner_id, [event])
+        except SpoolFull:
+            return _spool_full_response()
+        return JsonResponse({'status': 'queued'}, status=202)
 
-    if event_type not in ['VIEW', 'ADD_TO_CART', 'PURCHASE']:
-        return JsonResponse({'error': 'Invalid event type'}, status=400)
+    product_event, = ingest_events(site.owner, [event])
+    return JsonResponse({'status': 'success', 'event_id': product_event.id})
 
-    product, _ = Product.objects.update_or_create(
-        owner=site.owner,
-        product_id_from_site=product_data['id'],
-        defaults={
-            'name': product_data.get('name', 'محصول ناشناس'),
-            'price': Decimal(str(product_data.get('price', 0))),
-            'page_url': product_data.get('url', ''),
-        }
-    )
 
-    customer, _ = Customer.objects.get_or_create(owner=site.owner, identifier=customer_identifier)
+def _spool_full_response():
+    response = JsonResponse({'error': 'Event queue is full, retry later'}, status=503)
+    response['Retry-After'] = str(max(1, int(settings.EVENT_SPOOL_FLUSH_INTERVAL)))
+    return response
+
+
+def _parse_event_batch(request):
+    """خواندن بدنه درخواست گروهی به صورت آرایه JSON یا NDJSON."""
+    body = request.body.decode('utf-8')
+    if request.content_type in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(InvalidEvent('Invalid JSON'))
+        return items
 
-    event = ProductEvent.objects.create(product=product, customer=customer, event_type=event_type)
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get('events')
+    if not isinstance(data, list):
+        raise ValueError('Expected a list of events')
+    return data
 
-    # بررسی تست A/B و ثبت رویداد مربوطه
-    if 'ab_test_variant' in data and data['ab_test_variant']:
+
+@csrf_exempt
+@require_POST
+def track_events_batch_view(request):
+    """API دریافت گروهی رویدادها؛ رویدادهای نامعتبر رد می‌شوند و بقیه ذخیره می‌شوند."""
+    site, error_response = _get_site_for_request(request)
+    if error_response:
+        return error_response
+
+    try:
+        items = _parse_event_batch(request)
+    except (UnicodeDecodeError, ValueError):
+        return JsonResponse({'error': 'Invalid data'}, status=400)
+
+    if len(items) > settings.EVENT_BATCH_MAX_SIZE:
+        return JsonResponse({'error': f'Batch too large (max {settings.EVENT_BATCH_MAX_SIZE} events)'}, status=413)
+
+    default_customer_id = request.META.get('REMOTE_ADDR')
+    active_tests = get_active_tests(site.owner_id)
+    valid_indexes, events, rejected = [], [], []
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, InvalidEvent):
+                raise item
+            events.append(parse_event(item, default_customer_id=default_customer_id, active_tests=active_tests))
+            valid_indexes.append(index)
+        except InvalidEvent as e:
+            rejected.append({'index': index, 'error': str(e)})
+
+    if settings.EVENT_INGEST_MODE == 'spool':
         try:
-            test = ABTest.objects.get(id=data['ab_test_id'], is_active=True)
-            event_type_map = {'PURCHASE': 'CONVERSION', 'VIEW': 'VIEW'}
-            if event.event_type in event_type_map:
-                ABTestEvent.objects.create(
-                    test=test,
-                    customer=customer,
-                    variant_shown=data['ab_test_variant'],
-                    event_type=event_type_map[event.event_type]
-                )
-        except ABTest.DoesNotExist:
-            logger.warning(f"A/B Test with id {data.get('ab_test_id')} not found.")
+            get_spool().append(site.owner_id, events)
+        except SpoolFull:
+            return _spool_full_response()
+        accepted = [{'index': index} for index in valid_indexes]
+        return JsonResponse({'status': 'queued', 'accepted': accepted, 'rejected': rejected}, status=202)
 
-    return JsonResponse({'status': 'success', 'event_id': event.id})
+    product_events = ingest_events(site.owner, events)
+    accepted = [
+        {'index': index, 'event_id': product_event.id}
+        for index, product_event in zip(valid_indexes, product_events)
+    ]
+    return JsonResponse({'status': 'success', 'accepted': accepted, 'rejected': rejected})
 
 
 @csrf_exempt
 def get_product_variant_api(request):
-    """API برای تعیین نسخه محصول در تست A/B."""
-    api_key = request.headers.get('X-API-Key')
-    if not api_key:
-        return JsonResponse({'error': 'API Key required'}, status=401)
+    """API برای تعیین نسخه محصول در تست A/B.
+
+    نسخه با هش پایدار شناسه مشتری تعیین می‌شود و تست‌های فعال از کش خوانده می‌شوند.
+    """
+    site, error_response = _get_site_for_request(request)
+    if error_response:
+        return error_response
 
     try:
         data = json.loads(request.body)
@@ -260,37 +335,149 @@ def get_product_variant_api(request):
     except (json.JSONDecodeError, KeyError):
         return JsonResponse({'error': 'Invalid data'}, status=400)
 
+    active_test = get_active_tests(site.owner_id).get(str(product_id_from_site))
+    if active_test is None or not customer_identifier:
+        return JsonResponse({'ab_test_id': None})
+
+    arm = assign_variant(active_test, customer_identifier)
+    if arm is None:
+        # مشتری خارج از درصد ترافیک تست است
+        return JsonResponse({'ab_test_id': None})
+
+    variant_type, value = arm
+    return JsonResponse({
+        'ab_test_id': active_test.id,
+        'ab_test_variant': variant_type,
+        'variable': active_test.variable,
+        'value': value
+    })
+
+
+@csrf_exempt
+@require_GET
+def product_recommendations_api(request, product_id_from_site):
+    """API محصولات هم‌خرید و هم‌بازدید یک محصول برای نمایش در سایت کاربر."""
+    site, error_response = _get_site_for_request(request)
+    if error_response:
+        return error_response
+
     try:
-        product = Product.objects.get(product_id_from_site=product_id_from_site, owner__sites__api_key__key=api_key)
-        active_test = ABTest.objects.filter(product=product, is_active=True).first()
+        k = int(request.GET.get('k', settings.RECOMMENDATION_INDEX_TOP_K))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid k'}, status=400)
+    k = max(1, min(k, settings.RECOMMENDATION_API_MAX_K))
+
+    # شاخص در پردازشگر کارها ساخته می‌شود؛ تا پایان اولین اجرا یا برای محصول بدون هم‌رخدادی فهرست‌ها خالی است
+    recommendations = ProductCooccurrence.objects.filter(
+        owner=site.owner, product__product_id_from_site=product_id_from_site
+    ).values(*KINDS.values()).first() or {}
+    return JsonResponse({
+        'product_id': product_id_from_site,
+        **{name: recommendations.get(name, [])[:k] for name in KINDS.values()},
+    })
 
-        if active_test:
-            # تقسیم کاربران به دو گروه (کنترل و متغیر)
-            variant_type = 'VARIANT' if hash(customer_identifier) % 2 == 0 else 'CONTROL'
 
-            if variant_type == 'VARIANT':
-                return JsonResponse({
-                    'ab_test_id': active_test.id,
-                    'ab_test_variant': 'VARIANT',
-                    'variable': active_test.variable,
-                    'value': active_test.variant_value
-                })
+@csrf_exempt
+@require_GET
+def customer_recommendations_api(request, identifier):
+    """API پیشنهادهای شخصی یک مشتری (فیلترینگ همکارانه محصول‌محور)."""
+    site, error_response = _get_site_for_request(request)
+    if error_response:
+        return error_response
 
-    except Product.DoesNotExist:
-        return JsonResponse({'error': 'Product not found'}, status=404)
+    try:
+        k = int(request.GET.get('k', settings.RECOMMENDATION_INDEX_TOP_K))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid k'}, status=400)
+    k = max(1, min(k, settings.RECOMMENDATION_API_MAX_K))
+
+    customer = Customer.objects.filter(owner=site.owner, identifier=identifier).first()
+    if customer is None:
+        return JsonResponse({'error': 'Customer not found'}, status=404)
+
+    recommendations = Recommendation.objects.filter(
+        customer=customer, reason=Recommendation.ReasonType.AI_GENERATED, is_active=True
+    ).select_related('product').order_by('-confidence_score')[:k]
+    return JsonResponse({
+        'customer_id': identifier,
+        'recommendations': [
+            {
+                'product_id': r.product.product_id_from_site,
+                'name': r.product.name,
+                'url': r.product.page_url,
+                'score': r.confidence_score,
+            }
+            for r in recommendations
+        ],
+    })
 
-    # اگر تستی فعال نباشد یا کاربر در گروه کنترل باشد
-    return JsonResponse({'ab_test_id': None})
+
+@login_required
+def customer_segment_api(request, segment):
+    """فهرست صفحه‌بندی‌شده مشتریان یک بخش RFM."""
+    if segment not in Customer.Segment.values:
+        return JsonResponse({'error': 'Unknown segment'}, status=404)
+    customers = Customer.objects.filter(owner=request.user, segment=segment).order_by('-monetary', 'id').values(
+        'identifier', 'recency_days', 'frequency', 'monetary', 'rfm_score', 'segment_updated_at'
+    )
+    page = Paginator(customers, settings.CUSTOMER_SEGMENT_PAGE_SIZE).get_page(request.GET.get('page'))
+    return JsonResponse({
+        'segment': segment,
+        'page': page.number,
+        'num_pages': page.paginator.num_pages,
+        'count': page.paginator.count,
+        'customers': [{**c, 'monetary': str(c['monetary'])} for c in page],
+    })
+
+
+@login_required
+def analytics_job_status_api(request, analysis):
+    """وضعیت کار تحلیلی پس‌زمینه برای نظرسنجی (polling) از سمت مرورگر."""
+    if analysis not in JOB_ANALYSES:
+        return JsonResponse({'error': 'Unknown analysis'}, status=404)
+    latest, active = get_job_state(request.user, analysis)
+    return JsonResponse({
+        'analysis': analysis,
+        'status': active.status if active else (latest.status if latest else None),
+        'finished_at': latest.finished_at.isoformat() if latest else None,
+        'result': latest.result if latest else None,
+    })
 
 
 @login_required
 def ab_test_list_view(request):
     """نمایش لیست تمام تست‌های A/B."""
-    tests = ABTest.objects.filter(product__owner=request.user).select_related('product').order_by('-is_active',
-                                                                                                  '-start_date')
+    tests = list(ABTest.objects.filter(product__owner=request.user).select_related('product').order_by('-is_active',
+                                                                                                       '-start_date'))
+    # نتایج همه تست‌ها با یک کوئری روی شمارنده‌های نسخه‌ها
+    results = get_ab_test_results_bulk(tests)
+    for test in tests:
+        test.results = results[test.id]
     return render(request, 'ab_test_list.html', {'tests': tests})
 
 
+@login_required
+@require_GET
+def ab_test_results_api(request):
+    """API نتایج همه تست‌های A/B فعال کاربر (با all=1 همه تست‌ها)."""
+    tests = ABTest.objects.filter(product__owner=request.user).select_related('product').order_by('-start_date')
+    if request.GET.get('all') != '1':
+        tests = tests.filter(is_active=True)
+    tests = list(tests)
+    results = get_ab_test_results_bulk(tests)
+    return JsonResponse({'tests': [
+        {
+            'id': test.id,
+            'name': test.name,
+            'product_id': test.product.product_id_from_site,
+            'variable': test.variable,
+            'is_active': test.is_active,
+            **results[test.id],
+        }
+        for test in tests
+    ]})
+
+
 @login_required
 def ab_test_create_view(request):
     """ایجاد یک تست A/B جدید."""
@@ -318,58 +505,189 @@ def ab_test_detail_view(request, pk):
 
 @login_required
 def cohort_analysis_view(request):
-    """نمایش تحلیل کوهورت (بازگشت مشتری)."""
-    cohort_table, message = get_cohort_analysis(request.user)
+    """نمایش تحلیل کوهورت (بازگشت مشتری) ماهانه یا هفتگی، برای همه رویدادها یا یک نوع رویداد."""
+    granularity = request.GET.get('granularity', 'month')
+    event_type = request.GET.get('event_type') or None
+    if granularity not in COHORT_GRANULARITIES or (event_type and event_type not in ProductEvent.EventType.values):
+        granularity, event_type = 'month', None
+
+    if granularity == 'month' and event_type is None:
+        # جدول فعالیت کوهورت هنگام ثبت رویدادها به‌روز می‌شود؛ نیازی به خواندن رویدادها نیست
+        cohort_table = get_stored_cohorts(request.user)['percents']
+        message = "تحلیل با موفقیت انجام شد." if not cohort_table.empty else "رویدادی برای تحلیل یافت نشد."
+    else:
+        # سایر حالت‌ها با یک کوئری روی رویدادها محاسبه و تا خرید بعدی یا پایان TTL کش می‌شوند
+        cohort_table, message = cached_analysis(
+            request.user, 'cohorts', lambda: get_cohort_analysis(request.user, granularity, event_type),
+            params={'granularity': granularity, 'event_type': event_type},
+        )
     context = {
         'cohort_table_html': cohort_table.to_html(classes='table table-bordered text-center', na_rep=''),
-        'message': message
+        'message': message,
+        'granularity': granularity,
+        'event_type': event_type,
+        'granularities': {key: label for key, (_, label) in COHORT_GRANULARITIES.items()},
+        'event_types': ProductEvent.EventType.choices,
     }
     return render(request, 'cohort_analysis.html', context)
 
 
+def _encode_event_cursor(event):
+    created_at = event.created_at.astimezone(dt_timezone.utc)
+    return f"{created_at.strftime('%Y%m%d%H%M%S%f')}-{event.id}"
+
+
+def _decode_event_cursor(cursor):
+    try:
+        created_at, event_id = cursor.split('-')
+        return datetime.strptime(created_at, '%Y%m%d%H%M%S%f').replace(tzinfo=dt_timezone.utc), int(event_id)
+    except ValueError:
+        return None
+
+
+def _customer_event_page(customer, cursor=None, limit=None):
+    """یک صفحه از تاریخچه رویدادهای مشتری با صفحه‌بندی keyset (جدیدترین اول)."""
+    limit = limit or settings.CUSTOMER_EVENTS_PAGE_SIZE
+    events = ProductEvent.objects.filter(customer=customer).select_related('product').order_by('-created_at', '-id')
+    if cursor:
+        created_at, event_id = cursor
+        events = events.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=event_id))
+    page = list(events[:limit + 1])
+    next_cursor = _encode_event_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
 @login_required
 def customer_profile_view(request, identifier):
     """نمایش پروفایل کامل یک مشتری."""
     customer = get_object_or_404(Customer, identifier=identifier, owner=request.user)
-    events = customer.events.select_related('product').order_by('-created_at')
-
-    total_spent = events.filter(event_type='PURCHASE').aggregate(total=Sum('product__price'))['total'] or 0
-    purchase_count = events.filter(event_type='PURCHASE').count()
+    # خلاصه هنگام ثبت رویدادها به‌روز می‌شود؛ تاریخچه کامل صفحه به صفحه از API خوانده می‌شود
+    summary = CustomerSummary.objects.filter(customer=customer).first() or CustomerSummary(customer=customer)
+    events, next_cursor = _customer_event_page(customer)
 
     context = {
         'customer': customer,
         'events': events,
-        'total_spent': total_spent,
-        'purchase_count': purchase_count,
-        'event_count': events.count()
+        'next_cursor': next_cursor,
+        'total_spent': summary.total_spent,
+        'purchase_count': summary.purchase_count,
+        'event_count': summary.event_count,
+        'last_event_at': summary.last_event_at,
+        'top_categories': summary.top_categories(),
     }
     return render(request, 'customer_profile.html', context)
 
 
+@login_required
+def customer_events_api(request, identifier):
+    """API تاریخچه رویدادهای یک مشتری با صفحه‌بندی keyset؛ مقدار next_cursor در پارامتر cursor فرستاده می‌شود."""
+    customer = Customer.objects.filter(identifier=identifier, owner=request.user).first()
+    if customer is None:
+        return JsonResponse({'error': 'Customer not found'}, status=404)
+
+    cursor = None
+    if request.GET.get('cursor'):
+        cursor = _decode_event_cursor(request.GET['cursor'])
+        if cursor is None:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    try:
+        limit = min(max(1, int(request.GET.get('limit', settings.CUSTOMER_EVENTS_PAGE_SIZE))),
+                    settings.CUSTOMER_EVENTS_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    events, next_cursor = _customer_event_page(customer, cursor, limit)
+    return JsonResponse({
+        'events': [
+            {
+                'id': event.id,
+                'event_type': event.event_type,
+                'created_at': event.created_at.isoformat(),
+                'product_id': event.product.product_id_from_site if event.product else None,
+                'product_name': event.product.name if event.product else None,
+            }
+            for event in events
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+def _product_list_params(request):
+    """خواندن پارامترهای مرتب‌سازی و فیلتر فهرست محصولات از درخواست."""
+    sort = request.GET.get('sort', 'newest')
+    stock = request.GET.get('stock') or None
+    if sort not in PRODUCT_SORTS or (stock and stock not in STOCK_FILTERS):
+        raise InvalidCursor('Invalid sort or filter')
+    return {
+        'sort': sort,
+        'category': request.GET.get('category') or None,
+        'stock': stock,
+        'cursor': request.GET.get('cursor') or None,
+    }
+
+
 @login_required
 def product_list_view(request):
-    """نمایش لیستی از تمام محصولات کاربر."""
-    products = Product.objects.filter(owner=request.user).order_by('-created_at')
+    """نمایش لیست محصولات کاربر با صفحه‌بندی، مرتب‌سازی و فیلتر."""
+    try:
+        params = _product_list_params(request)
+        products, next_cursor = get_product_page(request.user, limit=settings.PRODUCT_LIST_PAGE_SIZE, **params)
+    except InvalidCursor:
+        return redirect('core:product_list')
+
     context = {
-        'products': products
+        'products': products,
+        'next_cursor': next_cursor,
+        'categories': Product.objects.filter(owner=request.user).values_list(
+            'category', flat=True).distinct().order_by('category'),
+        'sort_options': PRODUCT_SORTS,
+        **params,
     }
     return render(request, 'product_list.html', context)
 
+
+@login_required
+def product_list_api(request):
+    """نسخه JSON فهرست محصولات برای اسکرول بی‌پایان؛ next_cursor در پارامتر cursor فرستاده می‌شود."""
+    try:
+        params = _product_list_params(request)
+        products, next_cursor = get_product_page(request.user, limit=settings.PRODUCT_LIST_PAGE_SIZE, **params)
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'products': [
+            {
+                'id': product.pk,
+                'product_id': product.product_id_from_site,
+                'name': product.name,
+                'category': product.category,
+                'price': str(product.price) if product.price is not None else None,
+                'stock': product.stock,
+                'total_views': product.total_views,
+                'total_purchases': product.total_purchases,
+                'conversion_rate': round(product.conversion_rate, 2),
+                'url': reverse('core:product_detail', args=[product.pk]),
+            }
+            for product in products
+        ],
+        'next_cursor': next_cursor,
+    })
+
 @login_required
 def product_detail_view(request, pk):
     """نمایش آمار و تحلیل‌های جامع برای یک محصول خاص."""
     product = get_object_or_404(Product, pk=pk, owner=request.user)
 
-    # بازه زمانی پیش‌فرض: ۳۰ روز گذشته
-    end_date = timezone.now()
+    # بازه زمانی پیش‌فرض: ۳۰ روز گذشته؛ نمودار ۷ روز آخر از همان سری خوانده می‌شود
+    end_date = timezone.localdate()
     start_date = end_date - timedelta(days=29)
-
-    events = product.events.filter(created_at__range=(start_date, end_date))
+    series = get_event_timeseries(request.user, start_date, end_date, product=product)
 
     # ۱. آمار کلیدی
-    views_30_days = events.filter(event_type='VIEW').count()
-    carts_30_days = events.filter(event_type='ADD_TO_CART').count()
-    purchases_30_days = events.filter(event_type='PURCHASE').count()
+    views_30_days = series['totals']['views']
+    carts_30_days = series['totals']['carts']
+    purchases_30_days = series['totals']['purchases']
 
     # ۲. نرخ‌های تبدیل
     # نرخ تبدیل بازدید به سبد خرید
@@ -377,28 +695,19 @@ def product_detail_view(request, pk):
     # نرخ تبدیل بازدید به خرید نهایی
     view_to_purchase_rate = (purchases_30_days / views_30_days * 100) if views_30_days > 0 else 0
 
-    # ۳. داده‌های نمودار برای ۷ روز گذشته
-    chart_labels = []
-    chart_views = []
-    chart_carts = []
-    chart_purchases = []
-    today = timezone.now().date()
-    for i in range(6, -1, -1):
-        day = today - timedelta(days=i)
-        day_events = product.events.filter(created_at__date=day)
-
-        # لیبل شمسی برای نمودار
-        chart_labels.append(jdatetime.date.fromgregorian(date=day).strftime('%a'))
-        chart_views.append(day_events.filter(event_type='VIEW').count())
-        chart_carts.append(day_events.filter(event_type='ADD_TO_CART').count())
-        chart_purchases.append(day_events.filter(event_type='PURCHASE').count())
+    # ۳. داده‌های نمودار برای ۷ روز گذشته (لیبل شمسی)
+    chart_labels = [jdatetime.date.fromgregorian(date=day).strftime('%a') for day in series['buckets'][-7:]]
+    chart_views = series['views'][-7:]
+    chart_carts = series['carts'][-7:]
+    chart_purchases = series['purchases'][-7:]
 
     # ۴. پیشنهادات مخصوص این محصول
-    product_recommendations = Recommendation.objects.filter(product=product, is_active=True).order_by(
-        '-confidence_score')
+    product_recommendations = Recommendation.objects.filter(
+        product=product, customer__isnull=True, is_active=True
+    ).order_by('-confidence_score')
 
     # ۵. پیش‌بینی فروش برای این محصول
-    sales_forecast, forecast_message = predict_future_sales(product.id)
+    sales_forecast, forecast_message = _get_sales_forecast(request.user, product.id)
 
     context = {
         'product': product,